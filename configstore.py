@@ -0,0 +1,302 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Content addressed store of the config files (startup_*.c, system_*.c,
+# linker scripts, ...) shared by generated projects. A file is stored once
+# per content and name as <store>/<digest[:2]>/<digest>/<name>, and projects
+# reference the stored file instead of a private copy. Every project records
+# the files it uses under refs/<pack>/, so retiring a pack version drops its
+# references and gc() deletes the files no project references anymore.
+# Generators hold a shared lock on <store>/.lock from their first stored file
+# until they are closed (or exit), gc() an exclusive one, so gc never deletes
+# a file stored but not yet referenced; without fcntl (Windows) gc() skips
+# files younger than a grace period instead.
+#
+#   python3 configstore.py /var/cache/configstore --list
+#   python3 configstore.py /var/cache/configstore --retire Atmel.SAMD20_DFP.1.0.0 --gc
+
+import argparse
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import stat
+import sys
+import time
+import uuid
+import pdscparser as PP
+import packdiff as PD
+import pdsctrace as PT
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# bump whenever the layout of the reference files changes
+storeFormatVersion = 1
+
+# seconds a stored file is kept by gc() where the store can't be locked
+gcGracePeriod = 3600
+
+# pack version a reference belongs to: <vendor>.<name>.<version>, taken from
+# the pack header and the newest release, so renaming the pdsc or .pack file
+# keeps the key
+def packKey(pdscfile, parser):
+  info = parser.getPackInfo()
+  if not info.get('vendor') or not info.get('name'):
+    raise PP.pdscfileerror('%s: the pack has no vendor or name' %(pdscfile))
+  return '%s.%s.%s' %(info['vendor'], info['name'], PD.packRelease(parser) or '0.0.0')
+
+class configstore(object):
+  def __init__(self, storedir, pack=None):
+    self.logmsg = False
+    self._storedir = os.path.abspath(storedir)
+    self._pack = pack
+    self._hasher = PD.filehasher()
+    self._lockfile = None
+
+  def getStoreDir(self):
+    return self._storedir
+
+  # release the lock of a generator
+  def close(self):
+    if self._lockfile is not None:
+      self._lockfile.close()
+      self._lockfile = None
+
+  # lock the store, shared by generators; False if locks are unsupported
+  def _lock(self, exclusive=False):
+    if fcntl is None:
+      return False
+    mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+    if self._lockfile is None:
+      os.makedirs(self._storedir, exist_ok=True)
+      self._lockfile = open(os.path.join(self._storedir, '.lock'), 'a')
+    try:
+      fcntl.flock(self._lockfile.fileno(), mode | fcntl.LOCK_NB)
+    except (IOError, OSError):
+      self._log('waiting for the store lock')
+      fcntl.flock(self._lockfile.fileno(), mode)
+    return True
+
+  # the lock file doesn't pickle (spawned pool workers), a copy locks again
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state['_lockfile'] = None
+    return state
+
+  # store src (if not stored yet) and return the path of the stored file.
+  # stored files are read only, they are shared by every project using them
+  def add(self, src):
+    try:
+      if self._lockfile is None:
+        self._lock()
+      digest = self._hasher.file(src)
+      if digest is None:
+        self._err('%s is not a valid file' %(src), PP.packfilenotfound)
+      entrydir = os.path.join(self._storedir, digest[:2], digest)
+      path = os.path.join(entrydir, os.path.basename(src))
+      if os.path.isfile(path):
+        return path
+
+      with PT.span('store.file', path=src):
+        os.makedirs(entrydir, exist_ok=True)
+        # concurrent generators store the same file through private names
+        tmpname = os.path.join(entrydir, '.%s.tmp' %(uuid.uuid4().hex))
+        try:
+          shutil.copyfile(src, tmpname)
+          shutil.copystat(src, tmpname)
+          os.chmod(tmpname, stat.S_IMODE(os.stat(tmpname).st_mode) & ~0o222)
+          os.replace(tmpname, path)
+        except:
+          if os.path.lexists(tmpname):
+            os.remove(tmpname)
+          raise
+      PT.count('copy.bytes', os.path.getsize(path))
+      return path
+
+    except PP.pdscerror:
+      raise
+    except Exception as inst:
+      self._err('store %s: %s:%s' %(src, type(inst), inst))
+
+  # record the stored files used by a project (its Makefile or build.ninja)
+  # for the pack of this store; replaces earlier references of the project
+  def addRefs(self, project, paths):
+    if self._pack is None:
+      self._err('store: references need a pack')
+    try:
+      project = os.path.abspath(project)
+      refdir = os.path.join(self._storedir, 'refs', self._pack)
+      os.makedirs(refdir, exist_ok=True)
+      refname = os.path.join(refdir, hashlib.sha1(project.encode('utf-8')).hexdigest() + '.json')
+      refs = {'version':storeFormatVersion, 'project':project,
+              'files':sorted(os.path.relpath(path, self._storedir) for path in paths)}
+      tmpname = '%s.%s.tmp' %(refname, uuid.uuid4().hex)
+      with open(tmpname, 'w') as fo:
+        json.dump(refs, fo, indent=1)
+      os.replace(tmpname, refname)
+
+    except Exception as inst:
+      self._err('store references %s: %s:%s' %(project, type(inst), inst))
+
+  # pack versions with references: {pack: [project, ...]}
+  def getPacks(self):
+    packs = {}
+    for pack, refname, refs in self._refs():
+      packs.setdefault(pack, []).append(refs['project'])
+    return packs
+
+  # drop every reference of a pack version, returns the number of projects
+  def retire(self, pack):
+    refdir = os.path.join(self._storedir, 'refs', pack)
+    if not os.path.isdir(refdir):
+      self._warn('no references of pack %s' %(pack))
+      return 0
+    count = len([name for name in os.listdir(refdir) if name.endswith('.json')])
+    shutil.rmtree(refdir)
+    self._log('retired %s (%d project(s))' %(pack, count))
+    return count
+
+  # delete stored files no project references; references of projects whose
+  # build file is gone are dropped first. grace: seconds a new file is kept
+  # where the store can't be locked. returns (files, bytes) deleted
+  def gc(self, grace=gcGracePeriod):
+    try:
+      locked = self._lock(exclusive=True)
+      used = set()
+      for pack, refname, refs in self._refs():
+        if not os.path.isfile(refs['project']):
+          self._log('dropping references of %s' %(refs['project']))
+          os.remove(refname)
+          continue
+        used.update(refs['files'])
+
+      files = 0
+      size = 0
+      for prefix in os.listdir(self._storedir):
+        prefixdir = os.path.join(self._storedir, prefix)
+        if prefix == 'refs' or len(prefix) != 2 or not os.path.isdir(prefixdir):
+          continue
+        for digest in os.listdir(prefixdir):
+          entrydir = os.path.join(prefixdir, digest)
+          for name in os.listdir(entrydir):
+            path = os.path.join(entrydir, name)
+            if name.startswith('.') or os.path.relpath(path, self._storedir) in used:
+              continue
+            if not locked and time.time() - os.stat(path).st_ctime < grace:
+              continue
+            files += 1
+            size += os.path.getsize(path)
+            os.remove(path)
+          if not os.listdir(entrydir):
+            os.rmdir(entrydir)
+        if not os.listdir(prefixdir):
+          os.rmdir(prefixdir)
+      self._log('deleted %d file(s), %d bytes' %(files, size))
+      return (files, size)
+
+    except Exception as inst:
+      self._err('store gc: %s:%s' %(type(inst), inst))
+
+    finally:
+      self.close()
+
+  # (pack, reference file, references) of every recorded project
+  def _refs(self):
+    refroot = os.path.join(self._storedir, 'refs')
+    if not os.path.isdir(refroot):
+      return
+    for pack in sorted(os.listdir(refroot)):
+      refdir = os.path.join(refroot, pack)
+      for name in sorted(os.listdir(refdir)):
+        if not name.endswith('.json'):
+          continue
+        refname = os.path.join(refdir, name)
+        try:
+          with open(refname) as fi:
+            refs = json.load(fi)
+        except (IOError, OSError, ValueError) as inst:
+          self._warn('ignoring %s: %s' %(refname, inst))
+          continue
+        if refs.get('version') != storeFormatVersion:
+          self._warn('ignoring %s: format %s' %(refname, refs.get('version')))
+          continue
+        yield (pack, refname, refs)
+
+  def _log(self, lmsg):
+    if self.logmsg == False:
+      return
+    print ('==> %s' %(lmsg))
+
+  def _err(self, emsg, errtype=None):
+    raise (errtype or PP.pdscerror)(emsg)
+
+  def _warn(self, wmsg):
+    print ("Warning: %s" %(wmsg))
+
+def main():
+  aparser = argparse.ArgumentParser(description='Manage the config file store of generated projects.')
+  aparser.add_argument('store', metavar='<store dir>', help="Config file store (genmake-arm.py --config-store)")
+  aparser.add_argument('--list', help="List the pack versions and the projects referencing them", action='store_true')
+  aparser.add_argument('--retire', metavar='<pack>', nargs='+', default=[], help="Drop the references of pack version(s), E.g. Atmel.SAMD20_DFP.1.0.0")
+  aparser.add_argument('--gc', help="Delete stored files no project references (waits for running generators)", action='store_true')
+  aparser.add_argument('--grace', metavar='<seconds>', type=int, default=gcGracePeriod, help="Where the store can't be locked, keep files stored less than this ago (default: %d)" %(gcGracePeriod))
+  pargs = aparser.parse_args()
+
+  if not os.path.isdir(pargs.store):
+    print ('store directory \'%s\' doesn\'t exist' %(pargs.store))
+    sys.exit(2)
+
+  store = configstore(pargs.store)
+  store.logmsg = True
+  for pack in pargs.retire:
+    store.retire(pack)
+  if pargs.gc:
+    (files, size) = store.gc(pargs.grace)
+    print ('Deleted %d file(s) (%d bytes).' %(files, size))
+  if pargs.list:
+    for pack, projects in sorted(store.getPacks().items()):
+      print ('%s: %d project(s)' %(pack, len(projects)))
+      for project in projects:
+        print ('  %s' %(project))
+
+if __name__ == '__main__':
+  try:
+    main()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
@@ -0,0 +1,152 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Device search of a parsed pdsc file: a prefix trie over the device names
+# ("Dname" or "Dname:Pname") and secondary indexes on Dcore, Dfamily and
+# Pname. Glob patterns only visit the names below their literal prefix, so
+# "ATSAME70*" doesn't scan the whole pack.
+
+import fnmatch
+
+wildcards = '*?['
+
+# device names by prefix
+class devicetrie(object):
+  def __init__(self, names=()):
+    # char -> child node; '' -> names ending at this node
+    self._root = {}
+    for name in names:
+      self.add(name)
+
+  def add(self, name):
+    node = self._root
+    for ch in name:
+      node = node.setdefault(ch, {})
+    node.setdefault('', []).append(name)
+
+  # all names starting with prefix
+  def prefix(self, prefix):
+    node = self._root
+    for ch in prefix:
+      node = node.get(ch)
+      if node is None:
+        return []
+
+    names = []
+    pending = [node]
+    while pending:
+      node = pending.pop()
+      for ch, child in node.items():
+        if ch == '':
+          names.extend(child)
+        else:
+          pending.append(child)
+    return names
+
+  # names matching a glob pattern (case sensitive, as device names are)
+  def match(self, pattern):
+    cut = len(pattern)
+    for c in wildcards:
+      pos = pattern.find(c)
+      if pos != -1:
+        cut = min(cut, pos)
+    names = self.prefix(pattern[:cut])
+    if cut == len(pattern):
+      return [name for name in names if name == pattern]
+    return [name for name in names if fnmatch.fnmatchcase(name, pattern)]
+
+class devicesearch(object):
+  # names: device names in pack order
+  # processors: Processor of every device name known in detail
+  # devices: Dname -> Device
+  def __init__(self, names, processors, devices):
+    self._order = {}
+    for name in names:
+      self._order.setdefault(name, len(self._order))
+    self._trie = devicetrie(self._order)
+
+    self._byCore = {}
+    self._byFamily = {}
+    self._byPname = {}
+    for processor in processors:
+      name = processor.fullname
+      self._byCore.setdefault(processor.core, set()).add(name)
+      self._byPname.setdefault(processor.pname, set()).add(name)
+      device = devices.get(processor.dname)
+      if device is not None:
+        self._byFamily.setdefault(device.family, set()).add(name)
+
+    # devices with a Pname, i.e. one of several processors
+    self._withPname = set()
+    for pname, names in self._byPname.items():
+      if pname != '':
+        self._withPname.update(names)
+
+  # device names in pack order matching a glob pattern (None for all) and
+  # every given attribute: core (Dcore), family (Dfamily) and pname (Pname,
+  # True for any non-empty Pname)
+  def find(self, pattern=None, core=None, family=None, pname=None):
+    sets = []
+    if core is not None:
+      sets.append(self._byCore.get(core, ()))
+    if family is not None:
+      sets.append(self._byFamily.get(family, ()))
+    if pname is True:
+      sets.append(self._withPname)
+    elif pname is not None:
+      sets.append(self._byPname.get(pname, ()))
+
+    candidates = None
+    if sets:
+      sets.sort(key=len)
+      candidates = set(sets[0])
+      for s in sets[1:]:
+        candidates.intersection_update(s)
+
+    if pattern is not None:
+      matches = self._trie.match(pattern)
+      if candidates is not None:
+        matches = [name for name in matches if name in candidates]
+    elif candidates is not None:
+      matches = candidates
+    else:
+      matches = self._order
+
+    return sorted(matches, key=self._order.__getitem__)
+
+  def getCores(self):
+    return sorted(core for core in self._byCore if core is not None)
+
+  def getFamilies(self):
+    return sorted(family for family in self._byFamily if family is not None)
@@ -34,16 +34,66 @@
 
 import argparse
 import pdscparser as PP
+import packrepo as PR
+import pdscserver as PS
+import pdsctrace as PT
+import packdiff as PD
+import svdindex as SV
+import configstore as CS
 import sys
 import tempfile as TMP
 import os.path
 import shutil
+import fnmatch
+import hashlib
+import json
+import multiprocessing
+import concurrent.futures
+import errno
+import uuid
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
+# a build file or config file of a device could not be generated
+class generateerror(PP.pdscerror):
+  pass
+
+# device fingerprints of --changed-only, kept in the output directory
+manifestName = '.genmake-manifest.json'
+manifestFormatVersion = 1
 
 aparser = argparse.ArgumentParser(description='Generate Makefile fragment for Atmel Devices.')
-aparser.add_argument('-f', metavar='<pdsc file>', help="PDSC file", required="True")
-aparser.add_argument('-d', metavar='<devicename>', help="Device name E.g. ATSAMD20E14 or ATSAM4C4C:0 (for special device names refer Pname attribute of processor tag in pdsc file)", required="True")
-aparser.add_argument('-c', metavar='<cmsis pack dir>', help="CMSIS pack directory", required="True")
+aparser.add_argument('-f', metavar='<pdsc file>', help="PDSC file or .pack archive (default: newest pack in --pack-repo providing the device)")
+aparser.add_argument('-d', metavar='<devicename>', nargs='+', help="Device name(s) or glob pattern(s) E.g. ATSAMD20E14, ATSAM4C4C:0 or 'ATSAMD21*' (for special device names refer Pname attribute of processor tag in pdsc file)")
+aparser.add_argument('--device-list', metavar='<file>', help="File with one device name or pattern per line")
+aparser.add_argument('--all-devices', help="Generate build files for every device in the pack", action='store_true')
+aparser.add_argument('--core', metavar='<Dcore>', help="Only devices with this core, E.g. Cortex-M0+ (selects from every device in the pack without -d)")
+aparser.add_argument('--family', metavar='<Dfamily>', help="Only devices of this family, E.g. 'SAM D20' (selects from every device in the pack without -d)")
+aparser.add_argument('--pname', metavar='<Pname>', help="Only processors with this Pname, '*' for any (selects from every device in the pack without -d)")
+aparser.add_argument('-j', metavar='<jobs>', type=int, help="Number of parallel worker processes (default: number of CPUs)")
+aparser.add_argument('-o', metavar='<output dir>', default='.', help="Output directory (default: current directory)")
+aparser.add_argument('-c', metavar='<cmsis pack dir>', help="CMSIS pack directory (default: CMSIS pack in --pack-repo)")
+aparser.add_argument('--pack-repo', metavar='<pack repo dir>', help="Directory tree of installed packs, scanned to locate device and CMSIS packs")
+aparser.add_argument('--cmsis-version', metavar='<version>', help="CMSIS pack version to use from --pack-repo (default: newest)")
 aparser.add_argument('--copy-config-files', help="Copy config files (startup_*.c, system_*.c and linker script)", action='store_true')
+aparser.add_argument('--copy-mode', choices=('copy', 'hardlink', 'symlink'), default='copy', help="How config files are materialized: 'copy' (kernel side copy or reflink where available, default), 'hardlink' or 'symlink' (share the pack files, don't edit them in place; the project template is always copied)")
+aparser.add_argument('--config-store', metavar='<store dir>', help="Store the config files (except the template) once by content in this directory and reference them from the generated projects, implies --copy-config-files; see configstore.py to retire pack versions and collect unused files")
+aparser.add_argument('--backend', choices=('make', 'ninja'), default='make', help="Build file to generate: GNU Make (default) or Ninja")
+aparser.add_argument('--template', choices=('basic', 'depend'), default='basic', help="Makefile template: 'basic' or 'depend' (header dependencies, build directory, make -j safe rules)")
+aparser.add_argument('--build-dir', metavar='<dir>', default='build', help="Build directory of the 'depend' template and the Ninja backend (default: build)")
+aparser.add_argument('--pch', help="Precompile the device header (.gch) with the project flags; objects depend on it (Makefile backend)", action='store_true')
+aparser.add_argument('--ccache', help="Compile through ccache ('depend' template and Ninja backend)", action='store_true')
+aparser.add_argument('--incremental', help="Only write the build file and copy config files whose content changed", action='store_true')
+aparser.add_argument('--server', metavar='<socket path>', nargs='?', const=PS.defaultSocketPath(), help="Query a running pdscserver.py instead of parsing the PDSC file (default socket: %s)" %(PS.defaultSocketPath()))
+aparser.add_argument('--stream', help="Stream the PDSC file and keep only the requested device in memory", action='store_true')
+aparser.add_argument('--cache', metavar='<cache dir>', nargs='?', const=PP.defaultCacheDir(), help="Cache the parsed PDSC file (default directory: %s)" %(PP.defaultCacheDir()))
+aparser.add_argument('--svd-fragment', help="Also write a C header (<device>_svd.h) and a linker script fragment (<device>_svd.ld) with peripheral and register addresses from the device SVD file", action='store_true')
+aparser.add_argument('--since', metavar='<old pdsc>', help="Pack updated in place from this version (PDSC file or .pack archive): only regenerate devices whose dependencies or referenced files changed since the last --since or --changed-only run into the output directory (recorded in %s). Generated files hold absolute pack paths, so devices are only skipped when both versions are in the same pack directory; a version installed in its own directory regenerates every device, use --changed-only there" %(manifestName))
+aparser.add_argument('--changed-only', help="Only regenerate devices whose dependencies, referenced files or generator options changed since the last --since or --changed-only run into the output directory (recorded in %s)" %(manifestName), action='store_true')
+aparser.add_argument('--profile', metavar='<report file>', help="Write a timing report of parsing, lookups, file checks, copies and writes")
+aparser.add_argument('--profile-format', choices=('json', 'chrome'), default='json', help="Timing report format: 'json' (summary and counters, default) or 'chrome' (trace events for chrome://tracing)")
 
 makefileHeaderText = """
 #
@@ -70,14 +120,16 @@ OUTPUT_FILE_NAME=$(basename $(OUTPUT_FILE))
 
 """
 
-asflags="""ASFLAGS=-m%s -mcpu=%s -D%s -O1 -ffunction-sections -Wall
-"""
-cflags="""CFLAGS=-x c -m%s -mcpu=%s -D%s -O1 -ffunction-sections -Wall -c -std=gnu99
-"""
-cxxflags="""CXXFLAGS=-x c++ -m%s -mcpu=%s -D%s -O1 -ffunction-sections -Wall -c -std=g++99
-"""
-ldflags="""LDFLAGS=-Wl,--start-group -lm  -Wl,--end-group -Wl,--gc-sections -m%s -mcpu=%s %s %s
-"""
+# compiler and linker flags, shared by the Makefile and Ninja generators
+asflagsValue="-m%s -mcpu=%s -D%s -O1 -ffunction-sections -Wall"
+cflagsValue="-x c -m%s -mcpu=%s -D%s -O1 -ffunction-sections -Wall -c -std=gnu99"
+cxxflagsValue="-x c++ -m%s -mcpu=%s -D%s -O1 -ffunction-sections -Wall -c -std=g++99"
+ldflagsValue="-Wl,--start-group -lm  -Wl,--end-group -Wl,--gc-sections -m%s -mcpu=%s %s %s"
+
+asflags="ASFLAGS="+asflagsValue+"\n"
+cflags="CFLAGS="+cflagsValue+"\n"
+cxxflags="CXXFLAGS="+cxxflagsValue+"\n"
+ldflags="LDFLAGS="+ldflagsValue+"\n"
 incpaths="""INCLUDE_PATHS=%s
 """
 srcfileTemplate="""
@@ -99,14 +151,14 @@ $(OUTPUT_FILE): $(OBJS)
 \t$(SIZE) $(OUTPUT_FILE_NAME).elf
 
 # Compile target(s)
-./%.o: ./%.cpp
-\t$(CXX) $(CXXFLAGS) $(INCLUDE_PATHS) -o $@ $<
+./%.o: ./%.cpp@PCH_CXX@
+\t$(CXX) $(CXXFLAGS)@PCH_CXXFLAGS@ $(INCLUDE_PATHS) -o $@ $<
 
-./%.o: ./%.c
-\t$(CC) $(CFLAGS) $(INCLUDE_PATHS) -o $@ $<
+./%.o: ./%.c@PCH_C@
+\t$(CC) $(CFLAGS)@PCH_CFLAGS@ $(INCLUDE_PATHS) -o $@ $<
 
-startup/%.o: startup/%.c
-\t$(CC) $(CFLAGS) $(INCLUDE_PATHS) -o $@ $<
+startup/%.o: startup/%.c@PCH_C@
+\t$(CC) $(CFLAGS)@PCH_CFLAGS@ $(INCLUDE_PATHS) -o $@ $<
 
 clean:
 \trm -f $(OBJS)
@@ -114,148 +166,946 @@ clean:
 
 """
 
-def createMakefile(device, lang, dep):
+# 'depend' template: objects and outputs in BUILD_DIR, header dependencies
+# through -MMD -MP and one rule per output, so it is safe with make -j
+depbldVars="""
+BUILD_DIR=%s
+CCACHE=%s
+"""
+depbldTemplate="""MKDIR ?= mkdir -p
+DEPFLAGS=-MMD -MP
+BUILD_OBJS=$(addprefix $(BUILD_DIR)/,$(OBJS))
+OUTPUT_BASE=$(BUILD_DIR)/$(OUTPUT_FILE_NAME)
+
+.PHONY: all clean
+
+# All target
+all: $(OUTPUT_BASE).elf $(OUTPUT_BASE).bin $(OUTPUT_BASE).hex $(OUTPUT_BASE).lss $(OUTPUT_BASE).size
+
+# Link target
+$(OUTPUT_BASE).elf: $(BUILD_OBJS)
+\t$(CC) -o $@ $(LDFLAGS) $(BUILD_OBJS)
+
+# Post link targets, rebuilt only when the elf file changes
+$(OUTPUT_BASE).bin: $(OUTPUT_BASE).elf
+\t$(OBJCOPY) -O binary $< $@
+
+$(OUTPUT_BASE).hex: $(OUTPUT_BASE).elf
+\t$(OBJCOPY) -O ihex -R .eeprom -R .fuse -R .lock -R .signature  $< $@
+
+$(OUTPUT_BASE).lss: $(OUTPUT_BASE).elf
+\t$(OBJDUMP) -h -S $< > $@
+
+$(OUTPUT_BASE).size: $(OUTPUT_BASE).elf
+\t$(SIZE) $< > $@
+\t@cat $@
+
+# Compile target(s)
+$(BUILD_DIR)/%.o: %.cpp@PCH_CXX@
+\t-@$(MKDIR) $(@D)
+\t$(CCACHE) $(CXX) $(CXXFLAGS) $(DEPFLAGS)@PCH_CXXFLAGS@ $(INCLUDE_PATHS) -o $@ $<
+
+$(BUILD_DIR)/%.o: %.c@PCH_C@
+\t-@$(MKDIR) $(@D)
+\t$(CCACHE) $(CC) $(CFLAGS) $(DEPFLAGS)@PCH_CFLAGS@ $(INCLUDE_PATHS) -o $@ $<
+
+clean:
+\trm -rf $(BUILD_DIR)
+
+-include $(BUILD_OBJS:.o=.d)
+
+"""
+
+# config files referenced from the config store are found through vpath
+vpathTemplate="""
+# Config files shared through the config store
+vpath %%.c %s
+"""
+
+# precompiled device header: GCC looks for <header>.gch in every include
+# directory before the header itself, so the per language PCH directories go
+# first; the headers are built with the project flags, as PCHs require.
+# -fpch-preprocess lets ccache cache compiles using the PCH (see pchCcache)
+pchVars="""
+MKDIR ?= mkdir -p
+PCH_HEADER=%s
+PCH_DIR=%s
+PCH_C=$(PCH_DIR)/c/%s.gch
+PCH_CXX=$(PCH_DIR)/cxx/%s.gch
+PCH_CFLAGS=-I$(PCH_DIR)/c -Winvalid-pch -fpch-preprocess
+PCH_CXXFLAGS=-I$(PCH_DIR)/cxx -Winvalid-pch -fpch-preprocess
+"""
+# compile rule placeholders of the templates: the precompiled header as a
+# prerequisite and its flags with --pch, nothing otherwise
+pchPlaceholders = (('@PCH_CXXFLAGS@', ' $(PCH_CXXFLAGS)'), ('@PCH_CFLAGS@', ' $(PCH_CFLAGS)'),
+                   ('@PCH_CXX@', ' $(PCH_CXX)'), ('@PCH_C@', ' $(PCH_C)'))
+
+def compileRules(template, pch):
+  for placeholder, value in pchPlaceholders:
+    template = template.replace(placeholder, value if pch else '')
+  return template
+
+# ccache only caches compiles using a PCH with this sloppiness
+pchCcache='CCACHE_SLOPPINESS=pch_defines,time_macros ccache'
+pchTemplate="""
+# Precompiled device header
+$(PCH_C): $(PCH_HEADER)
+\t-@$(MKDIR) $(@D)
+\t$(CC) $(CFLAGS) $(DEPFLAGS) -x c-header $(INCLUDE_PATHS) -o $@ $<
+
+$(PCH_CXX): $(PCH_HEADER)
+\t-@$(MKDIR) $(@D)
+\t$(CXX) $(CXXFLAGS) $(DEPFLAGS) -x c++-header $(INCLUDE_PATHS) -o $@ $<
+
+.PHONY: clean-pch
+clean: clean-pch
+clean-pch:
+\trm -rf $(PCH_DIR)
+
+-include $(PCH_C:.gch=.d) $(PCH_CXX:.gch=.d)
+"""
+
+ninjaHeaderText="""#
+# Ninja build file for %s project of Atmel %s device
+#
+
+ninja_required_version = 1.3
+
+cc = arm-none-eabi-gcc
+cxx = arm-none-eabi-g++
+objcopy = arm-none-eabi-objcopy
+objdump = arm-none-eabi-objdump
+size = arm-none-eabi-size
+
+builddir = %s
+ccache = %s
+
+includes = %s
+asflags = %s
+cflags = %s
+cxxflags = %s
+ldflags = %s
+
+rule cc
+  command = $ccache $cc $cflags -MMD -MF $out.d $includes -o $out $in
+  depfile = $out.d
+  deps = gcc
+  description = CC $out
+
+rule cxx
+  command = $ccache $cxx $cxxflags -MMD -MF $out.d $includes -o $out $in
+  depfile = $out.d
+  deps = gcc
+  description = CXX $out
+
+rule link
+  command = $cc -o $out $ldflags $in
+  description = LINK $out
+
+rule bin
+  command = $objcopy -O binary $in $out
+  description = OBJCOPY $out
+
+rule hex
+  command = $objcopy -O ihex -R .eeprom -R .fuse -R .lock -R .signature $in $out
+  description = OBJCOPY $out
+
+rule lss
+  command = $objdump -h -S $in > $out
+  description = OBJDUMP $out
+
+rule size
+  command = $size $in > $out && cat $out
+  description = SIZE $in
+
+"""
+
+ninjaBuildText="""
+build %(base)s.elf: link %(objs)s
+build %(base)s.bin: bin %(base)s.elf
+build %(base)s.hex: hex %(base)s.elf
+build %(base)s.lss: lss %(base)s.elf
+build %(base)s.size: size %(base)s.elf
+
+default %(base)s.elf %(base)s.bin %(base)s.hex %(base)s.lss %(base)s.size
+"""
+
+# ioctl request of a reflink (Linux, btrfs/XFS/...)
+FICLONE = 0x40049409
+
+# concurrent config file copies per device
+copyThreads = 8
+
+# sha256 digest of a file, None if it doesn't exist
+def fileDigest(path):
   try:
-    pdir = TMP.gettempdir()
-    makefile = pdir+'/Makefile'
-    mfo = open(makefile,'w+')
-    if mfo is None:
-      print ('Could not open make file %s' %(makefile))
-      sys.exit(2)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fo:
+      for chunk in iter(lambda: fo.read(1 << 20), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+  except (IOError, OSError):
+    return None
 
-    output_filename = device.replace(':','_')
-    mfo.write(makefileHeaderText %(lang, device, output_filename.lower()+'-application.elf'))
-
-    templatefile = dep['template'] if 'template' in dep else ''
-    systemfile = dep['system'] if 'system' in dep else ''
-    startupfile = dep['startup'] if 'startup' in dep else ''
-    ldscript = dep['linkerscript'] if 'linkerscript' in dep else ''
-    other_configs = dep['other'] if 'other' in dep else ''
-
-    srcfiles = ''
-    objfiles = ''
-    if copycfg and templatefile != '':
-      shutil.copy2(templatefile, './')
-      templatefile = os.path.basename(templatefile)
-      srcfiles = srcfiles + ' ' + templatefile + ' '
-      objfiles = objfiles + ' ' + os.path.basename(templatefile).replace(lang, 'o') + ' '
-
-    if copycfg and systemfile != '':
-      shutil.copy2(systemfile, './')
+# write content to path through a private temporary file in the same
+# directory, so parallel runs never share or truncate a file; in incremental
+# mode an output with the same content is left untouched.
+# returns True if the file was written
+def writeFile(path, content, incremental=False):
+  data = content.encode('utf-8')
+  if incremental and fileDigest(path) == hashlib.sha256(data).hexdigest():
+    return False
+
+  with PT.span('write.file', path=path):
+    fd, tmpname = TMP.mkstemp(dir=os.path.dirname(path), prefix='.'+os.path.basename(path)+'.')
+    try:
+      with os.fdopen(fd, 'wb') as fo:
+        fo.write(data)
+      os.chmod(tmpname, 0o666 & ~processUmask)
+      os.replace(tmpname, path)
+    except:
+      os.remove(tmpname)
+      raise
+  PT.count('write.bytes', len(data))
+  return True
+
+# copy src to dst inside the kernel: a reflink (FICLONE) shares the blocks on
+# copy-on-write file systems, copy_file_range avoids the round trip through
+# user space (and copies server side on NFS 4.2 / SMB); falls back to a
+# plain copy. returns the number of bytes copied, 0 for a reflink
+def kernelCopy(src, dst):
+  with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+    if fcntl is not None:
+      try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return 0
+      except OSError:
+        pass
+
+    size = os.fstat(fsrc.fileno()).st_size
+    if hasattr(os, 'copy_file_range'):
+      try:
+        copied = 0
+        while copied < size:
+          n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+          if n == 0:
+            break
+          copied += n
+        if copied == size:
+          return copied
+      except OSError as inst:
+        if inst.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+          raise
+      fsrc.seek(0)
+      fdst.seek(0)
+      fdst.truncate()
+
+    shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    return size
+
+# is dst already what materializing src in the given mode would produce
+def isMaterialized(src, dst, mode):
+  if mode == 'symlink':
+    return os.path.islink(dst) and os.readlink(dst) == os.path.abspath(src)
+  if mode == 'hardlink' and os.path.isfile(dst) and os.path.samefile(src, dst):
+    return True
+  return not os.path.islink(dst) and os.path.isfile(dst) \
+         and os.path.getsize(dst) == os.path.getsize(src) and fileDigest(dst) == fileDigest(src)
+
+# materialize a config file in outdir through a temporary file, so concurrent
+# generators never see a partially written file. mode is 'copy', 'hardlink'
+# (falls back to a copy across file systems) or 'symlink'; linked files are
+# shared with the pack and must not be edited in place. in incremental mode
+# an up to date file is left untouched (keeping its mtime for make).
+# a copy gets the current mtime, not the one of the pack file: pack files
+# keep their release dates, which would look older than objects built from
+# the previous content
+# returns True if the file was materialized
+def copyConfigFile(src, outdir, incremental=False, mode='copy'):
+  dst = os.path.join(outdir, os.path.basename(src))
+  if incremental and isMaterialized(src, dst, mode):
+    return False
+
+  with PT.span('copy.file', path=src, mode=mode):
+    tmpname = os.path.join(outdir, '.%s.%s.tmp' %(os.path.basename(src), uuid.uuid4().hex))
+    try:
+      copied = 0
+      if mode == 'symlink':
+        os.symlink(os.path.abspath(src), tmpname)
+      elif mode == 'hardlink' and linkOrFalse(src, tmpname):
+        pass
+      else:
+        copied = kernelCopy(src, tmpname)
+        shutil.copymode(src, tmpname)
+      os.replace(tmpname, dst)
+    except:
+      if os.path.lexists(tmpname):
+        os.remove(tmpname)
+      raise
+  PT.count('copy.bytes', copied)
+  return True
+
+# hard link src to dst, False if they are on different file systems
+def linkOrFalse(src, dst):
+  try:
+    os.link(src, dst)
+    return True
+  except OSError as inst:
+    if inst.errno in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+      return False
+    raise
+
+# materialize config files, given as (src, mode) pairs, in outdir
+# concurrently; on network storage every copy is a round trip, so they are
+# overlapped on a thread pool
+def copyConfigFiles(files, outdir, incremental=False):
+  if len(files) < 2:
+    return [copyConfigFile(src, outdir, incremental, mode) for (src, mode) in files]
+  with concurrent.futures.ThreadPoolExecutor(min(len(files), copyThreads)) as executor:
+    futures = [executor.submit(copyConfigFile, src, outdir, incremental, mode) for (src, mode) in files]
+    return [future.result() for future in futures]
+
+# copy the config files into outdir (if copycfg) and collect the project
+# sources, objects, include, linker script and library options of a device.
+# with a store (configstore) the startup, system, linker script and other
+# files are referenced from the store. the template is meant to be edited, so
+# it is always copied, never linked to the pack or taken from the store
+def prepareProject(lang, dep, outdir, copycfg, incremental, copymode='copy', store=None):
+  templatefile = dep['template'] if 'template' in dep else ''
+  systemfile = dep['system'] if 'system' in dep else ''
+  startupfile = dep['startup'] if 'startup' in dep else ''
+  ldscript = dep['linkerscript'] if 'linkerscript' in dep else ''
+  other_configs = dep['other'] if 'other' in dep else ''
+
+  copies = []
+  stored = []
+  srcfiles = ''
+  objfiles = ''
+  if copycfg and templatefile != '':
+    copies.append((templatefile, 'copy'))
+    templatefile = os.path.basename(templatefile)
+    srcfiles = srcfiles + ' ' + templatefile + ' '
+    objfiles = objfiles + ' ' + os.path.basename(templatefile).replace(lang, 'o') + ' '
+
+  if copycfg and systemfile != '':
+    if store is not None:
+      systemfile = store.add(systemfile)
+      stored.append(systemfile)
+    else:
+      copies.append((systemfile, copymode))
       systemfile = os.path.basename(systemfile)
-      srcfiles = srcfiles + ' ' + systemfile + ' '
-      objfiles = objfiles + ' ' + os.path.basename(systemfile).replace('.c', '.o') + ' '
+    srcfiles = srcfiles + ' ' + systemfile + ' '
+    objfiles = objfiles + ' ' + os.path.basename(systemfile).replace('.c', '.o') + ' '
 
-    if copycfg and startupfile != '':
-      shutil.copy2(startupfile, './')
+  if copycfg and startupfile != '':
+    if store is not None:
+      startupfile = store.add(startupfile)
+      stored.append(startupfile)
+    else:
+      copies.append((startupfile, copymode))
       startupfile = os.path.basename(startupfile)
-      srcfiles = srcfiles + ' ' + startupfile + ' '
-      objfiles = objfiles + ' ' + os.path.basename(startupfile).replace('.c', '.o') + ' '
+    srcfiles = srcfiles + ' ' + startupfile + ' '
+    objfiles = objfiles + ' ' + os.path.basename(startupfile).replace('.c', '.o') + ' '
 
-    ldscript_option = ''
-    if copycfg and ldscript != '':
-      shutil.copy2(ldscript, './')
+  ldscript_option = ''
+  ldsearch_options = ''
+  if copycfg and ldscript != '':
+    if store is not None:
+      ldscript = store.add(ldscript)
+      stored.append(ldscript)
+      ldscript_option = '-T'+ldscript
+      # linker scripts INCLUDE the other files by name, found through -L
+      for other in other_configs:
+        other = store.add(other)
+        stored.append(other)
+        ldsearch_options = ldsearch_options + ' -L ' + os.path.dirname(other)
+    else:
+      copies.append((ldscript, copymode))
       ldscript_option = '-T'+os.path.basename(ldscript)
 
-      for f in other_configs:
-        shutil.copy2(f, './')
+      copies.extend((other, copymode) for other in other_configs)
+
+  copyConfigFiles(copies, outdir, incremental)
+
+  inc_options = "-I"+dep['include']
+  if 'cmsis_include' in dep:
+    inc_options = inc_options + " -I"+dep['cmsis_include']
+
+  lib_options = ""
+  if 'cmsis_lib' in dep:
+    lib_options = "-L %s" %(dep['cmsis_lib'])
+  lib_options = (lib_options + ldsearch_options).strip()
+
+  return {'srcfiles':srcfiles, 'objfiles':objfiles, 'ldscript_option':ldscript_option,
+          'inc_options':inc_options, 'lib_options':lib_options, 'stored':stored}
+
+# template: 'basic' (objects next to the sources, single link recipe) or
+# 'depend' (see depbldTemplate), builddir and ccache apply to 'depend' only
+# pch: precompile the device header (see pchVars)
+# store: configstore the config files are referenced from (see prepareProject)
+def createMakefile(device, lang, dep, outdir='.', copycfg=False, incremental=False,
+                   template='basic', builddir='build', ccache=False, copymode='copy', pch=False,
+                   store=None):
+  try:
+    # the Makefile is rendered in memory and written in one go
+    mfo = []
+
+    output_filename = device.replace(':','_')
+    mfo.append(makefileHeaderText %(lang, device, output_filename.lower()+'-application.elf'))
+
+    proj = prepareProject(lang, dep, outdir, copycfg, incremental, copymode, store)
+    mfo.append(incpaths %(proj['inc_options']))
+
+    mfo.append(asflags %(dep['mode'], dep['cpu'], dep['define']))
+    mfo.append(cflags %(dep['mode'], dep['cpu'], dep['define']))
+    mfo.append(cxxflags %(dep['mode'], dep['cpu'], dep['define']))
+
+    mfo.append(ldflags %(dep['mode'], dep['cpu'], proj['ldscript_option'], proj['lib_options']))
+    mfo.append(srcfileTemplate %(proj['srcfiles'].strip()))
+    mfo.append(objfileTemplate %(proj['objfiles'].strip()))
+    storedsrcs = [src for src in proj['stored'] if src.endswith('.c')]
+    if storedsrcs:
+      mfo.append(vpathTemplate %(' '.join(sorted(set(os.path.dirname(src) for src in storedsrcs)))))
+    pch = pch and 'header' in dep
+    if pch:
+      header = os.path.basename(dep['header'])
+      mfo.append(pchVars %(dep['header'], '$(BUILD_DIR)/pch' if template == 'depend' else 'pch',
+                           header, header))
+    if template == 'depend':
+      mfo.append(depbldVars %(builddir, (pchCcache if pch else 'ccache') if ccache else ''))
+      mfo.append(compileRules(depbldTemplate, pch))
+    else:
+      mfo.append(compileRules(bldTemplate, pch))
+    if pch:
+      mfo.append(pchTemplate)
+    mkname = os.path.join(outdir, output_filename.lower() + '_Makefile')
+    if writeFile(mkname, ''.join(mfo), incremental):
+      print ('Makefile generated (%s).' %(os.path.abspath(mkname)))
+    else:
+      print ('Makefile up to date (%s).' %(os.path.abspath(mkname)))
+    if store is not None:
+      store.addRefs(mkname, proj['stored'])
+
+  except PP.pdscerror:
+    raise
+
+  except Exception as inst:
+    raise generateerror("create makefile: %s:%s" %(type(inst), inst))
+
+# escape a path for use in a ninja build statement
+def ninjaEscape(path):
+  return path.replace('$', '$$').replace(' ', '$ ').replace(':', '$:')
+
+# generate a Ninja build file from the same dependencies as createMakefile;
+# objects and outputs go to builddir, header dependencies come from depfiles
+def createNinjafile(device, lang, dep, outdir='.', copycfg=False, incremental=False,
+                    builddir='build', ccache=False, copymode='copy', store=None):
+  try:
+    output_filename = device.replace(':','_')
+    output_base = '$builddir/' + output_filename.lower() + '-application'
+
+    proj = prepareProject(lang, dep, outdir, copycfg, incremental, copymode, store)
 
-    inc_options = "-I"+dep['include']
-    if 'cmsis_include' in dep:
-      inc_options = inc_options + " -I"+dep['cmsis_include']
-    mfo.write(incpaths %(inc_options))
+    nfo = []
+    nfo.append(ninjaHeaderText %(lang, device, builddir, 'ccache' if ccache else '',
+               proj['inc_options'],
+               asflagsValue %(dep['mode'], dep['cpu'], dep['define']),
+               cflagsValue %(dep['mode'], dep['cpu'], dep['define']),
+               cxxflagsValue %(dep['mode'], dep['cpu'], dep['define']),
+               ldflagsValue %(dep['mode'], dep['cpu'], proj['ldscript_option'], proj['lib_options'])))
 
-    mfo.write(asflags %(dep['mode'], dep['cpu'], dep['define']))
-    mfo.write(cflags %(dep['mode'], dep['cpu'], dep['define']))
-    mfo.write(cxxflags %(dep['mode'], dep['cpu'], dep['define']))
+    # Compile target(s)
+    objs = []
+    for src, obj in zip(proj['srcfiles'].split(), proj['objfiles'].split()):
+      obj = '$builddir/' + ninjaEscape(obj)
+      rule = 'cxx' if src.endswith('.cpp') else 'cc'
+      nfo.append('build %s: %s %s\n' %(obj, rule, ninjaEscape(src)))
+      objs.append(obj)
 
-    lib_options = ""
-    if 'cmsis_lib' in dep:
-      lib_options = "-L %s" %(dep['cmsis_lib'])
+    # Link and post link targets
+    nfo.append(ninjaBuildText %({'base':output_base, 'objs':' '.join(objs)}))
 
-    mfo.write(ldflags %(dep['mode'], dep['cpu'], ldscript_option, lib_options))
-    mfo.write(srcfileTemplate %(srcfiles.strip()))
-    mfo.write(objfileTemplate %(objfiles.strip()))
-    mfo.write(bldTemplate)
-    mfo.close()
-    mkname = output_filename.lower() + '_Makefile'
-    shutil.move(makefile, './' + mkname)
-    print ('Makefile generated (%s).' %(os.path.abspath(mkname)))
+    ninjaname = os.path.join(outdir, output_filename.lower() + '_build.ninja')
+    if writeFile(ninjaname, ''.join(nfo), incremental):
+      print ('Ninja file generated (%s).' %(os.path.abspath(ninjaname)))
+    else:
+      print ('Ninja file up to date (%s).' %(os.path.abspath(ninjaname)))
+    if store is not None:
+      store.addRefs(ninjaname, proj['stored'])
+
+  except PP.pdscerror:
+    raise
 
   except Exception as inst:
-    print ("create makefile: %s:%s" %(type(inst), inst))
+    raise generateerror("create ninja file: %s:%s" %(type(inst), inst))
+
+# write the header and linker script fragments of the device SVD file
+# (a device without a usable svd file keeps its Makefile, with a warning)
+def createSvdFragments(device, outdir, incremental=False):
+  try:
+    svd = SV.svdForDevice(gen['parser'], device, gen['cachedir'])
+  except PP.pdscerror as inst:
+    print ('Warning: no SVD fragments for %s: %s' %(device, inst))
+    return
+  basename = os.path.join(outdir, device.replace(':','_').lower() + '_svd')
+  for path, content in ((basename + '.h', svd.headerFragment()), (basename + '.ld', svd.linkerFragment())):
+    if writeFile(path, content, incremental):
+      print ('SVD fragment generated (%s).' %(os.path.abspath(path)))
+
+# mkstemp creates private files, generated Makefiles get the usual mode.
+# reading the umask means setting it, which is process wide and would race
+# with the copy threads, so it is read once at startup
+def readUmask():
+  mask = os.umask(0)
+  os.umask(mask)
+  return mask
+
+processUmask = readUmask()
+
+# --core, --family and --pname as keyword arguments of findDevices
+def deviceFilters(pargs):
+  filters = {}
+  if pargs.core is not None:
+    filters['core'] = pargs.core
+  if pargs.family is not None:
+    filters['family'] = pargs.family
+  if pargs.pname is not None:
+    filters['pname'] = True if pargs.pname == '*' else pargs.pname
+  return filters
+
+# expand device names, glob patterns (E.g. ATSAMD21*), device list files and
+# --all-devices into the list of devices to generate for, in pack order;
+# filters (see deviceFilters) restrict the selection
+def selectDevices(pparser, patterns, alldevices, filters=None):
+  filters = filters or {}
+  if alldevices:
+    return pparser.findDevices(**filters)
+
+  selected = []
+  for pattern in patterns:
+    if any(c in pattern for c in '*?['):
+      matches = pparser.findDevices(pattern, **filters)
+      if not matches:
+        print ('Warning: no device matches "%s"' %(pattern))
+      selected.extend(matches)
+    elif filters and not pparser.findDevices(pattern, **filters):
+      print ('Warning: device "%s" does not match the device filters' %(pattern))
+    else:
+      selected.append(pattern)
+
+  # drop duplicates, keeping the first occurrence
+  seen = set()
+  return [d for d in selected if not (d in seen or seen.add(d))]
+
+# read device names (one per line, '#' starts a comment) from a list file
+def readDeviceList(listfile):
+  devices = []
+  with open(listfile) as fo:
+    for line in fo:
+      line = line.split('#', 1)[0].strip()
+      if line != '':
+        devices.append(line)
+  return devices
+
+# dependency resolution and Makefile emission for one device; runs either in
+# this process or in a pool worker (set up by initWorker)
+def generateForDevice(device):
+  with PT.span('generate.device', device=device):
+    return _generateForDevice(device)
+
+def _generateForDevice(device):
+  try:
+    dependencies = gen['parser'].getGCCProjectDependencies(device, gen['lang'], 'exe', 'atmel')
+    if dependencies is None:
+      return (device, False)
+    dependencies.update(gen['cmsis'])
+    outdir = deviceOutdir(gen, device)
+    if not os.path.isdir(outdir):
+      os.makedirs(outdir, exist_ok=True)
+    if gen['backend'] == 'ninja':
+      createNinjafile(device, gen['lang'], dependencies, outdir, gen['copycfg'], gen['incremental'],
+                      gen['builddir'], gen['ccache'], gen['copymode'], gen['store'])
+    else:
+      createMakefile(device, gen['lang'], dependencies, outdir, gen['copycfg'], gen['incremental'],
+                     gen['template'], gen['builddir'], gen['ccache'], gen['copymode'], gen['pch'],
+                     gen['store'])
+    if gen['svdfragment']:
+      createSvdFragments(device, outdir, gen['incremental'])
+    return (device, True)
+
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    return (device, False)
+
+# output directory of the project of a device
+def deviceOutdir(state, device):
+  if state['subdirs']:
+    return os.path.join(state['outdir'], device.replace(':','_').lower())
+  return state['outdir']
+
+# build files generated by each backend, as named in the progress messages
+buildFileNames = {'make':'Makefiles', 'ninja':'Ninja files'}
+
+# build file generated for a device (see createMakefile and createNinjafile)
+def buildFilePath(state, device):
+  suffix = '_build.ninja' if state['backend'] == 'ninja' else '_Makefile'
+  return os.path.join(deviceOutdir(state, device), device.replace(':','_').lower() + suffix)
+
+# does a device lack one of the outputs a previous run generated for it: the
+# build file or, with --copy-config-files, a config file copied next to it
+# (see prepareProject; files referenced from a config store are not copied)
+def outputsMissing(state, device):
+  if not os.path.isfile(buildFilePath(state, device)):
+    return True
+  if not state['copycfg']:
+    return False
+  try:
+    dep = state['parser'].getGCCProjectDependencies(device, state['lang'], 'exe', 'atmel')
+  except PP.pdscerror:
+    return True
+  if dep is None:
+    return False
+  fields = ('template',) if state['store'] is not None else ('template', 'system', 'startup', 'linkerscript')
+  files = [dep[field] for field in fields if dep.get(field)]
+  if state['store'] is None and dep.get('linkerscript'):
+    files.extend(dep['other'])
+  outdir = deviceOutdir(state, device)
+  return any(not os.path.lexists(os.path.join(outdir, os.path.basename(f))) for f in files)
+
+# the selected devices plus the candidates skipped as unchanged whose outputs
+# are missing (E.g. a new or cleaned output directory), in candidate order
+def withMissingOutputs(state, candidates, selected):
+  kept = set(selected)
+  missing = set(device for device in candidates if device not in kept and outputsMissing(state, device))
+  if missing:
+    print ('Regenerating %d unchanged device(s) with missing outputs.' %(len(missing)))
+  return [device for device in candidates if device in kept or device in missing]
+
+# record the config store references of a device whose project is kept
+# (skipped by --since or --changed-only) under the current pack, so retiring
+# the pack it was generated from doesn't collect its files
+def refreshStoreRefs(state, device):
+  project = buildFilePath(state, device)
+  if not os.path.isfile(project):
+    return
+  try:
+    dep = state['parser'].getGCCProjectDependencies(device, state['lang'], 'exe', 'atmel')
+    if dep is None:
+      return
+    # the files prepareProject takes from the store
+    files = [dep[field] for field in ('system', 'startup', 'linkerscript') if field in dep]
+    if 'linkerscript' in dep:
+      files.extend(dep['other'])
+    store = state['store']
+    store.addRefs(project, [store.add(f) for f in files])
+  except PP.pdscerror as inst:
+    print ('Warning: config store references of %s not updated: %s' %(device, inst))
+
+# per process generator state, shared by generateForDevice
+gen = {}
+
+def initWorker(state):
+  gen.update(state)
+  # forked workers inherit the spans collected so far by the parent
+  if state.get('profile'):
+    PT.reset()
+    PT.enable()
+
+# pool worker entry point; ships the trace of the worker back with the result
+def generateInWorker(device):
+  result = generateForDevice(device)
+  return result + (PT.collect() if gen.get('profile') else None,)
+
+# parse one pack and generate Makefiles for the selected devices of it;
+# returns (number of selected devices, list of failed devices)
+def generateForPack(pargs, pdscfile, patterns, alldevices, cmsis, outdir, copycfg, subdirs):
+  # streaming needs the device names up front
+  filters = deviceFilters(pargs)
+  literal = not alldevices and not filters and not any(any(c in p for c in '*?[') for p in patterns)
+  if pargs.server is not None:
+    pparser = PS.remoteparser (pdscfile, pargs.server)
+  elif pargs.stream and literal:
+    pparser = PP.pdscparser (pdscfile, patterns, cachedir=pargs.cache)
+  else:
+    if pargs.stream:
+      print ('Warning: --stream ignored, device patterns and filters need the full device list')
+    pparser = PP.pdscparser (pdscfile, cachedir=pargs.cache)
+  pparser.logmsg = True
+
+  selected = selectDevices(pparser, patterns, alldevices, filters)
+  if not selected:
+    raise PP.pdscerror('no device of %s matches the selection' %(pdscfile))
+  state = {'parser':pparser, 'lang':'c', 'cmsis':cmsis, 'outdir':outdir, 'copycfg':copycfg,
+           'subdirs':subdirs, 'incremental':pargs.incremental, 'template':pargs.template,
+           'builddir':pargs.build_dir, 'ccache':pargs.ccache, 'backend':pargs.backend,
+           'copymode':pargs.copy_mode,
+           'svdfragment':pargs.svd_fragment, 'cachedir':pargs.cache, 'pch':pargs.pch,
+           'configstore':pargs.config_store, 'store':None,
+           'profile':pargs.profile is not None}
+
+  if pargs.config_store is not None:
+    state['store'] = CS.configstore(pargs.config_store, CS.packKey(pdscfile, pparser))
+
+  candidates = selected
+
+  # fingerprints of the devices as generated now, and as recorded in the
+  # output directory at the last --since or --changed-only run
+  fingerprints = None
+  if pargs.since is not None or pargs.changed_only:
+    options = manifestOptions(state)
+    manifest = loadManifest(outdir)
+    recorded = manifest['devices'] if manifest['options'] == options else {}
+    fingerprints = {}
+    hasher = PD.filehasher()
+    for device in selected:
+      fingerprints[device] = projectFingerprint(pparser, device, state, hasher)
+
+  # skip devices whose generated project can't have changed. both versions of
+  # a pack updated in place name the same files, so file contents are compared
+  # with the digests recorded at the last generation, not with the old pdsc.
+  # Makefiles hold absolute pack paths, so nothing is skipped when the pack
+  # moved (E.g. a new version in the usual <vendor>/<pack>/<version> layout)
+  if pargs.since is not None:
+    oldparser = PP.pdscparser (pargs.since, cachedir=pargs.cache)
+    if oldparser.getPackDir() != pparser.getPackDir():
+      print ('Pack directory %s -> %s: generated files hold absolute pack paths, regenerating every device'
+             ' (--since only skips devices of packs updated in place)' %(oldparser.getPackDir(),
+             pparser.getPackDir()))
+    else:
+      if not recorded:
+        print ('No generation recorded in %s: regenerating every device' %(outdir))
+      delta = {}
+      for device in selected:
+        fields = PD.compareFingerprints(recorded.get(device), fingerprints[device])
+        if fields:
+          delta[device] = fields
+      print ('Release %s -> %s: %d of %d device(s) changed' %(PD.packRelease(oldparser),
+             PD.packRelease(pparser), len(delta), len(selected)))
+      for device in selected:
+        if device in delta:
+          print ('  %s: %s' %(device, ' '.join(delta[device])))
+      selected = withMissingOutputs(state, candidates,
+                                    [device for device in selected if device in delta])
+
+  if pargs.changed_only:
+    if manifest['options'] != options:
+      changed = selected
+    else:
+      changed = withMissingOutputs(state, selected,
+                                   [device for device in selected
+                                    if PD.compareFingerprints(recorded.get(device), fingerprints[device])])
+    if len(changed) < len(selected):
+      print ('Skipping %d unchanged device(s).' %(len(selected) - len(changed)))
+    selected = changed
+
+  if state['store'] is not None:
+    kept = set(selected)
+    for device in candidates:
+      if device not in kept:
+        refreshStoreRefs(state, device)
+
+  # a single device is generated in process, as before
+  if not selected:
+    results = []
+  elif len(selected) == 1 and pargs.j is None:
+    initWorker(state)
+    results = [generateForDevice(selected[0])]
+  else:
+    pparser.logmsg = False
+    pool = multiprocessing.Pool(pargs.j, initWorker, (state,))
+    try:
+      results = []
+      for (device, ok, trace) in pool.map(generateInWorker, selected):
+        if trace is not None:
+          PT.merge(trace)
+        results.append((device, ok))
+    finally:
+      pool.close()
+      pool.join()
+
+  if fingerprints is not None:
+    manifest = loadManifest(outdir)
+    if manifest['options'] != options:
+      manifest = {'options':options, 'devices':{}}
+    for (device, ok) in results:
+      if ok:
+        manifest['devices'][device] = fingerprints[device]
+      else:
+        manifest['devices'].pop(device, None)
+    saveManifest(outdir, manifest)
+
+  if state['store'] is not None:
+    state['store'].close()
+  return (len(selected), [device for (device, ok) in results if not ok])
+
+# fingerprint of what the generated project of a device depends on (see
+# PD.deviceFingerprint); file names there are pack relative, the generated
+# files hold absolute paths, so the pack directory is part of it. with
+# --svd-fragment the svd file is, too
+def projectFingerprint(pparser, device, state, hasher=None):
+  hasher = hasher or PD.filehasher()
+  fingerprint = PD.deviceFingerprint(pparser, device, state['lang'], hasher=hasher)
+  if fingerprint is None:
+    return None
+  fingerprint['packdir'] = [pparser.getPackDir(), None]
+  if state['svdfragment']:
+    try:
+      svd = pparser.getDeviceSpecifics(device).get('svd')
+      fingerprint['svd'] = [svd, hasher.file(pparser.getPackFile(svd)) if svd else None]
+    except PP.pdscerror as inst:
+      fingerprint['svd'] = [type(inst).__name__, None]
+  return fingerprint
+
+# generator settings that shape every output; when they change, --changed-only
+# regenerates every device
+def manifestOptions(state):
+  return dict((key, state[key]) for key in ('lang', 'cmsis', 'copycfg', 'subdirs', 'template',
+                                            'builddir', 'ccache', 'backend', 'copymode',
+                                            'svdfragment', 'pch', 'configstore'))
+
+# fingerprints of the devices generated into outdir (see packdiff.py)
+def loadManifest(outdir):
+  try:
+    with open(os.path.join(outdir, manifestName)) as fo:
+      manifest = json.load(fo)
+    if manifest.get('version') == manifestFormatVersion:
+      return manifest
+  except (IOError, OSError, ValueError):
+    pass
+  return {'options':None, 'devices':{}}
+
+def saveManifest(outdir, manifest):
+  manifest['version'] = manifestFormatVersion
+  writeFile(os.path.join(outdir, manifestName), json.dumps(manifest, indent=1, sort_keys=True) + '\n')
+
+# group device names and patterns by the pdsc file of the newest pack in the
+# repository providing them
+def resolvePacks(repo, patterns):
+  packdevices = repo.getDevices()
+  jobs = {}
+  for pattern in patterns:
+    if any(c in pattern for c in '*?['):
+      matches = fnmatch.filter(packdevices, pattern)
+      if not matches:
+        print ('Warning: no device matches "%s"' %(pattern))
+    else:
+      matches = [pattern]
+
+    for device in matches:
+      info = repo.findDevice(device)
+      if info is None:
+        print ('Error: Device "%s" not found in pack repository' %(device))
+        sys.exit(2)
+      jobs.setdefault(info['pdsc'], []).append(device)
+  return jobs
+
+def main():
+  #args = vars(aparser.parse_args())
+  #print (args)
+  pargs = aparser.parse_args()
+  if pargs.profile is not None:
+    PT.enable()
+  pdscfile = pargs.f
+  cmsis_packdir = pargs.c
+  copycfg = False
+  if pargs.copy_config_files or pargs.config_store is not None:
+    copycfg = True
+
+  patterns = list(pargs.d or [])
+  if pargs.device_list is not None:
+    patterns.extend(readDeviceList(pargs.device_list))
+  # device filters without names or patterns select from the whole pack
+  alldevices = pargs.all_devices or (not patterns and bool(deviceFilters(pargs)))
+  if not patterns and not alldevices:
+    aparser.error('one of -d, --device-list, --all-devices or a device filter is required')
+  if pdscfile is None and pargs.pack_repo is None:
+    aparser.error('one of -f or --pack-repo is required')
+  if cmsis_packdir is None and pargs.pack_repo is None:
+    aparser.error('one of -c or --pack-repo is required')
+  if pdscfile is None and alldevices:
+    aparser.error('--all-devices (or device filters without -d) requires -f')
+
+  if pargs.pch and pargs.backend == 'ninja':
+    print ('Warning: --pch ignored, precompiled headers are only generated for the Makefile backend')
+
+  outdir = os.path.abspath(pargs.o)
+  if False == os.path.isdir(outdir):
+    print ('output directory \'%s\' doesn\'t exist' %(outdir))
     sys.exit(2)
+  if pargs.config_store is not None:
+    pargs.config_store = os.path.abspath(pargs.config_store)
+    os.makedirs(pargs.config_store, exist_ok=True)
 
-#args = vars(aparser.parse_args())
-#print (args)
-pargs = aparser.parse_args()
-pdscfile = pargs.f
-devicename = pargs.d
-cmsis_packdir = pargs.c
-copycfg = False
-if pargs.copy_config_files:
-  copycfg = True
-
-# process cmsis_packdir
-if False == os.path.exists(cmsis_packdir):
-  print ('cmsis pack directory \'%s\' doesn\'t exist' %(cmsis_packdir))
-  sys.exit(2)
-
-cmsis_packdir = os.path.abspath(cmsis_packdir)
-
-
-print ("#pdscfile: %s ## cmsis_packdir: %s" %(pdscfile, cmsis_packdir))
-
-pparser = PP.pdscparser (pdscfile)
-pparser.logmsg = True
-
-#Test 1
-devices = pparser.getDevices()
-print ('~~~~~~~~~~~~~~~~~~~~~')
-print ('List of devices: %s' %(devices))
-print ('~~~~~~~~~~~~~~~~~~~~~')
-#Test 2
-#print (pparser.getEnvironments(devicename))
-
-#Test 3
-#print (pparser.getDeviceSpecifics(devicename))
-
-#Test 4
-#for l in ('c', 'cpp', 'java'):
-#  for e in ('exe', 'lib', 'nop'):
-#    print ('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-#    dependencies = pparser.getGCCProjectDependencies(devicename, l, e, 'atmel')
-#    print ('Dependencies: ')
-#    if dependencies is None:
-#      continue
-#    for f,value in dependencies.items():
-#      print ('==> %s : %s' %(f, value))
-#
-#print ('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-#print (pparser.getGCCProjectDependencies(devicename, 'java', 'exe', 'atmel'))
-#print ('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-#print (pparser.getGCCProjectDependencies(devicename, 'C', 'lib', 'atmel'))
-#print ('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-#print (pparser.getGCCProjectDependencies(devicename, 'C', 'exe', 'atme'))
-#print ('~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
-
-dependencies = pparser.getGCCProjectDependencies(devicename, 'c', 'exe', 'atmel')
-
-#cmsis_pack_dir = os.path.dirname(os.path.abspath(self._cmsis_pdscfile))
-#self._log('cmsis pack dir: %s' %(cmsis_pack_dir))
-assert(True == os.path.isdir(cmsis_packdir))
-cmsis_inc_dir = cmsis_packdir+'/CMSIS/Include'
-cmsis_lib_dir = cmsis_packdir+'/CMSIS/Lib/GCC'
-
-if False == os.path.isdir(cmsis_inc_dir):
-  print ('Warning: CMSIS include directory "%s" not found.' %(cmsis_inc_dir))
-else:
-  dependencies['cmsis_include'] = cmsis_inc_dir
-
-if False == os.path.isdir(cmsis_lib_dir):
-  print ('Warning: CMSIS lib directory "%s" not found.' %(cmsis_lib_dir))
-else:
-  dependencies['cmsis_lib'] = cmsis_lib_dir
-
-createMakefile (devicename, 'c', dependencies)
+  repo = None
+  if pargs.pack_repo is not None:
+    repo = PR.packrepo(pargs.pack_repo, pargs.j)
+
+  # locate the CMSIS pack in the repository unless given explicitly
+  if cmsis_packdir is None:
+    info = repo.findPack('ARM.CMSIS', pargs.cmsis_version)
+    if info is None:
+      print ('CMSIS pack %s not found in pack repository' %(pargs.cmsis_version or ''))
+      sys.exit(2)
+    cmsis_packdir = os.path.dirname(info['pdsc'])
+
+  # process cmsis_packdir
+  if False == os.path.exists(cmsis_packdir):
+    print ('cmsis pack directory \'%s\' doesn\'t exist' %(cmsis_packdir))
+    sys.exit(2)
+
+  cmsis_packdir = os.path.abspath(cmsis_packdir)
+
+  if pdscfile is not None:
+    jobs = {pdscfile:patterns}
+  else:
+    jobs = resolvePacks(repo, patterns)
+
+  for pdscfile in jobs:
+    print ("#pdscfile: %s ## cmsis_packdir: %s" %(pdscfile, cmsis_packdir))
 
+  #cmsis_pack_dir = os.path.dirname(os.path.abspath(self._cmsis_pdscfile))
+  #self._log('cmsis pack dir: %s' %(cmsis_pack_dir))
+  assert(True == os.path.isdir(cmsis_packdir))
+  cmsis_inc_dir = cmsis_packdir+'/CMSIS/Include'
+  cmsis_lib_dir = cmsis_packdir+'/CMSIS/Lib/GCC'
+
+  cmsis = {}
+  if False == os.path.isdir(cmsis_inc_dir):
+    print ('Warning: CMSIS include directory "%s" not found.' %(cmsis_inc_dir))
+  else:
+    cmsis['cmsis_include'] = cmsis_inc_dir
+
+  if False == os.path.isdir(cmsis_lib_dir):
+    print ('Warning: CMSIS lib directory "%s" not found.' %(cmsis_lib_dir))
+  else:
+    cmsis['cmsis_lib'] = cmsis_lib_dir
+
+  # config files of different devices share names (startup_*.c, flash.ld, ...),
+  # so each device gets its own sub directory when they are copied in batch
+  subdirs = copycfg and (alldevices or bool(deviceFilters(pargs)) or len(jobs) > 1 or
+                         sum(len(p) for p in jobs.values()) > 1 or
+                         any(any(c in p for c in '*?[') for p in patterns))
+
+  total = 0
+  failed = []
+  for pdscfile in jobs:
+    count, packfailed = generateForPack(pargs, pdscfile, jobs[pdscfile], alldevices,
+                                        cmsis, outdir, copycfg, subdirs)
+    total += count
+    failed.extend(packfailed)
+
+  if total > 1:
+    print ('Generated %d of %d %s.' %(total - len(failed), total, buildFileNames[pargs.backend]))
+  if pargs.profile is not None:
+    PT.writeReport(pargs.profile, pargs.profile_format)
+    print ('Timing report written (%s).' %(os.path.abspath(pargs.profile)))
+  if failed:
+    print ('Failed devices: %s' %(' '.join(failed)))
+    sys.exit(2)
+
+if __name__ == '__main__':
+  try:
+    main()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
@@ -0,0 +1,337 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Durable catalog of parsed packs in a local SQLite database, for tools that
+# query devices without parsing XML (IDE plugins, CI dashboards, ...).
+# Re-exporting a pack replaces its rows; packs whose pdsc file is unchanged
+# (size and mtime) are skipped.
+#
+#   python3 packcatalog.py --pack-repo /opt/packs
+#   python3 packcatalog.py --device ATSAMD20E14 --svd ATSAMD20E14.svd
+#
+#   select p.vendor, p.name, p.version from packs p
+#     join processors r on r.pack_id = p.id
+#     where r.name = 'ATSAMD20E14' and r.svd like '%ATSAMD20E14.svd'
+
+import argparse
+import os
+import os.path
+import sqlite3
+import sys
+import time
+import pdscparser as PP
+import packrepo as PR
+import pdsctrace as PT
+
+# bump whenever the schema changes; older catalogs are rebuilt
+catalogFormatVersion = 1
+
+catalogSchema = """
+create table if not exists packs (
+  id integer primary key,
+  pdsc text not null unique,
+  vendor text, name text, version text, description text, url text,
+  size integer, mtime_ns integer, exported real);
+create table if not exists releases (
+  pack_id integer not null references packs(id) on delete cascade,
+  version text, date text, description text);
+create table if not exists devices (
+  id integer primary key,
+  pack_id integer not null references packs(id) on delete cascade,
+  dname text not null, family text, vendor text);
+create table if not exists processors (
+  id integer primary key,
+  pack_id integer not null references packs(id) on delete cascade,
+  device_id integer not null references devices(id) on delete cascade,
+  name text not null, pname text, core text, fpu text, mpu text, endian text, clock text,
+  header text, define text, svd text);
+create table if not exists environments (
+  pack_id integer not null references packs(id) on delete cascade,
+  device_id integer not null references devices(id) on delete cascade,
+  name text not null, project text, pname text);
+create table if not exists components (
+  id integer primary key,
+  pack_id integer not null references packs(id) on delete cascade,
+  cvendor text, cclass text, cgroup text, condition text);
+create table if not exists files (
+  pack_id integer not null references packs(id) on delete cascade,
+  component_id integer not null references components(id) on delete cascade,
+  field text, kind text, lang text, exe text, relpath text, abspath text);
+
+create index if not exists releases_pack on releases(pack_id);
+create index if not exists devices_pack on devices(pack_id);
+create index if not exists devices_dname on devices(dname);
+create index if not exists processors_pack on processors(pack_id);
+create index if not exists processors_device on processors(device_id);
+create index if not exists processors_name on processors(name);
+create index if not exists processors_core on processors(core);
+create index if not exists processors_define on processors(define);
+create index if not exists processors_svd on processors(svd);
+create index if not exists environments_pack on environments(pack_id);
+create index if not exists environments_device on environments(device_id);
+create index if not exists components_pack on components(pack_id);
+create index if not exists components_class on components(cclass, cgroup);
+create index if not exists components_condition on components(condition);
+create index if not exists files_pack on files(pack_id);
+create index if not exists files_component on files(component_id);
+"""
+
+# default location of the catalog database
+def defaultCatalogPath():
+  return os.path.join(PP.defaultCacheDir(), 'catalog.sqlite')
+
+class packcatalog(object):
+  def __init__(self, dbpath=None):
+    self.logmsg = False
+    self._dbpath = os.path.abspath(dbpath or defaultCatalogPath())
+    try:
+      dbdir = os.path.dirname(self._dbpath)
+      if not os.path.isdir(dbdir):
+        os.makedirs(dbdir)
+      self._db = sqlite3.connect(self._dbpath)
+      self._db.execute('pragma foreign_keys = on')
+      version = self._db.execute('pragma user_version').fetchone()[0]
+      if version not in (0, catalogFormatVersion):
+        self._log('rebuilding catalog of format %d' %(version))
+        for table in ('files', 'components', 'environments', 'processors', 'devices',
+                      'releases', 'packs'):
+          self._db.execute('drop table if exists %s' %(table))
+      self._db.executescript(catalogSchema)
+      self._db.execute('pragma user_version = %d' %(catalogFormatVersion))
+      self._db.commit()
+
+    except sqlite3.Error as inst:
+      self._err('catalog %s: %s' %(self._dbpath, inst))
+
+  def close(self):
+    self._db.close()
+
+  # export a pack (pdsc file or .pack archive) unless its catalog entry is up
+  # to date; returns True if the pack was (re)exported
+  def exportPack(self, pdscfile, force=False, cachedir=None):
+    pdscfile = os.path.abspath(pdscfile)
+    try:
+      st = os.stat(pdscfile)
+    except OSError:
+      self._err(pdscfile + ' is not a valid file', PP.pdscfileerror)
+
+    row = self._db.execute('select size, mtime_ns from packs where pdsc = ?', (pdscfile,)).fetchone()
+    if not force and row is not None and tuple(row) == (st.st_size, st.st_mtime_ns):
+      self._log('up to date: %s' %(pdscfile))
+      return False
+
+    parser = PP.pdscparser(pdscfile, cachedir=cachedir)
+    with PT.span('catalog.export', pdsc=pdscfile):
+      try:
+        with self._db:
+          self._exportParsed(pdscfile, st, parser)
+      except sqlite3.Error as inst:
+        self._err('export %s: %s' %(pdscfile, inst))
+    self._log('exported %s' %(pdscfile))
+    return True
+
+  # worker function to replace the rows of a pack (in the caller's transaction)
+  def _exportParsed(self, pdscfile, st, parser):
+    info = parser.getPackInfo()
+    releases = parser.getReleases()
+    version = None
+    if releases:
+      version = max((r['version'] for r in releases), key=PR.versionKey)
+    db = self._db
+    db.execute('insert into packs (pdsc, vendor, name, version, description, url, size, mtime_ns, exported) '
+               'values (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+               'on conflict(pdsc) do update set vendor = excluded.vendor, name = excluded.name, '
+               'version = excluded.version, description = excluded.description, url = excluded.url, '
+               'size = excluded.size, mtime_ns = excluded.mtime_ns, exported = excluded.exported',
+               (pdscfile, info['vendor'], info['name'], version, info['description'], info['url'],
+                st.st_size, st.st_mtime_ns, time.time()))
+    packid = db.execute('select id from packs where pdsc = ?', (pdscfile,)).fetchone()[0]
+
+    # children of the previous export go away (the rest cascades)
+    for table in ('releases', 'devices', 'components'):
+      db.execute('delete from %s where pack_id = ?' %(table), (packid,))
+
+    db.executemany('insert into releases (pack_id, version, date, description) values (?, ?, ?, ?)',
+                   [(packid, r['version'], r['date'], r['description']) for r in releases])
+
+    for device in parser.getDeviceModels():
+      deviceid = db.execute('insert into devices (pack_id, dname, family, vendor) values (?, ?, ?, ?)',
+                            (packid, device.name, device.family, device.vendor)).lastrowid
+      db.executemany('insert into processors (pack_id, device_id, name, pname, core, fpu, mpu, endian, '
+                     'clock, header, define, svd) values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(packid, deviceid, p.fullname, p.pname, p.core, p.fpu, p.mpu, p.endian, p.clock,
+                       p.header, p.define, p.svd) for p in device.processors])
+      envrows = []
+      for env in device.environments.values():
+        if not env.projects:
+          envrows.append((packid, deviceid, env.name, None, None))
+        for proj in env.projects:
+          envrows.append((packid, deviceid, env.name, proj.name, proj.pname))
+      db.executemany('insert into environments (pack_id, device_id, name, project, pname) '
+                     'values (?, ?, ?, ?, ?)', envrows)
+
+    for component in parser.getComponentModels():
+      componentid = db.execute('insert into components (pack_id, cvendor, cclass, cgroup, condition) '
+                               'values (?, ?, ?, ?, ?)',
+                               (packid, component.vendor, component.cclass, component.group,
+                                component.condition)).lastrowid
+      db.executemany('insert into files (pack_id, component_id, field, kind, lang, exe, relpath, abspath) '
+                     'values (?, ?, ?, ?, ?, ?, ?, ?)',
+                     [(packid, componentid, f.field, f.kind,
+                       f.variant[0] if f.variant else None, f.variant[1] if f.variant else None,
+                       f.relpath, f.abspath) for f in component.files])
+
+  # export every pack version of a pack repository; packs the parser can't
+  # read (E.g. other schema versions) are skipped with a warning.
+  # returns the number of (re)exported packs
+  def exportRepo(self, packroot, force=False, cachedir=None, jobs=None):
+    repo = PR.packrepo(packroot, jobs)
+    exported = 0
+    for pack in repo.getPacks():
+      for version in repo.getPackVersions(pack):
+        pdscfile = repo.findPack(pack, version)['pdsc']
+        try:
+          if self.exportPack(pdscfile, force, cachedir):
+            exported += 1
+        except PP.pdscerror as inst:
+          self._warn('skipping %s: %s' %(pdscfile, inst))
+    return exported
+
+  # drop packs whose pdsc file is gone; returns the number of dropped packs
+  def prune(self):
+    gone = [(pdsc,) for (pdsc,) in self._db.execute('select pdsc from packs')
+            if not os.path.isfile(pdsc)]
+    with self._db:
+      self._db.executemany('delete from packs where pdsc = ?', gone)
+    return len(gone)
+
+  def removePack(self, pdscfile):
+    with self._db:
+      self._db.execute('delete from packs where pdsc = ?', (os.path.abspath(pdscfile),))
+
+  # packs providing a device (name "Dname" or "Dname:Pname"), optionally with
+  # an svd file (matched on its file name) or a core; newest version first
+  def findPacks(self, devicename, svd=None, core=None):
+    query = ('select distinct p.vendor, p.name, p.version, p.pdsc from packs p '
+             'join processors r on r.pack_id = p.id where r.name = ?')
+    args = [devicename]
+    if svd is not None:
+      query += ' and (r.svd = ? or r.svd like ?)'
+      args.extend([svd, '%/' + os.path.basename(svd)])
+    if core is not None:
+      query += ' and r.core = ?'
+      args.append(core)
+    rows = self._db.execute(query, args).fetchall()
+    packs = [{'vendor':v, 'name':n, 'version':ver, 'pdsc':pdsc} for (v, n, ver, pdsc) in rows]
+    return sorted(packs, key=lambda p: PR.versionKey(p['version']), reverse=True)
+
+  # processors matching all given attributes: [{name, pack, version, core, define, svd}]
+  def findProcessors(self, core=None, define=None, dname=None):
+    query = ('select r.name, p.vendor || \'.\' || p.name, p.version, r.core, r.define, r.svd '
+             'from processors r join packs p on r.pack_id = p.id')
+    where = []
+    args = []
+    for column, value in (('r.core', core), ('r.define', define)):
+      if value is not None:
+        where.append('%s = ?' %(column))
+        args.append(value)
+    if dname is not None:
+      where.append('r.device_id in (select id from devices where dname = ?)')
+      args.append(dname)
+    if where:
+      query += ' where ' + ' and '.join(where)
+    keys = ('name', 'pack', 'version', 'core', 'define', 'svd')
+    return [dict(zip(keys, row)) for row in self._db.execute(query, args)]
+
+  # components of a class (and group) with the packs providing them
+  def findComponents(self, cclass, cgroup=None):
+    query = ('select c.cvendor, c.cclass, c.cgroup, c.condition, p.vendor || \'.\' || p.name, p.version '
+             'from components c join packs p on c.pack_id = p.id where c.cclass = ?')
+    args = [cclass]
+    if cgroup is not None:
+      query += ' and c.cgroup = ?'
+      args.append(cgroup)
+    keys = ('vendor', 'class', 'group', 'condition', 'pack', 'version')
+    return [dict(zip(keys, row)) for row in self._db.execute(query, args)]
+
+  def _log(self, lmsg):
+    if self.logmsg == False:
+      return
+    print ('==> %s' %(lmsg))
+
+  def _err(self, emsg, errtype=None):
+    raise (errtype or PP.pdscerror)(emsg)
+
+  def _warn(self, wmsg):
+    print ("Warning: %s" %(wmsg))
+
+def main():
+  aparser = argparse.ArgumentParser(description='Export parsed packs into an SQLite catalog and query it.')
+  aparser.add_argument('--db', metavar='<catalog file>', help="Catalog database (default: %s)" %(defaultCatalogPath()))
+  aparser.add_argument('-f', metavar='<pdsc file>', nargs='+', default=[], help="PDSC file(s) or .pack archive(s) to export")
+  aparser.add_argument('--pack-repo', metavar='<pack repo dir>', help="Export every pack of a pack repository")
+  aparser.add_argument('--force', help="Re-export packs even if unchanged", action='store_true')
+  aparser.add_argument('--prune', help="Drop packs whose pdsc file no longer exists", action='store_true')
+  aparser.add_argument('--cache', metavar='<cache dir>', nargs='?', const=PP.defaultCacheDir(), help="Cache the parsed PDSC files (default directory: %s)" %(PP.defaultCacheDir()))
+  aparser.add_argument('--device', metavar='<devicename>', help="List the packs providing a device")
+  aparser.add_argument('--svd', metavar='<svd file>', help="With --device: only packs whose device has this svd file")
+  aparser.add_argument('--core', metavar='<Dcore>', help="List processors with this core (with --device: filter the packs)")
+  pargs = aparser.parse_args()
+
+  catalog = packcatalog(pargs.db)
+  catalog.logmsg = True
+  try:
+    for pdscfile in pargs.f:
+      catalog.exportPack(pdscfile, pargs.force, pargs.cache)
+    if pargs.pack_repo is not None:
+      count = catalog.exportRepo(pargs.pack_repo, pargs.force, pargs.cache)
+      print ('Exported %d pack(s).' %(count))
+    if pargs.prune:
+      print ('Dropped %d pack(s).' %(catalog.prune()))
+
+    if pargs.device is not None:
+      for pack in catalog.findPacks(pargs.device, pargs.svd, pargs.core):
+        print ('%s.%s %s (%s)' %(pack['vendor'], pack['name'], pack['version'], pack['pdsc']))
+    elif pargs.core is not None:
+      for processor in catalog.findProcessors(core=pargs.core):
+        print ('%s %s %s' %(processor['name'], processor['pack'], processor['version']))
+  finally:
+    catalog.close()
+
+if __name__ == '__main__':
+  try:
+    main()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
@@ -0,0 +1,185 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Delta of two pack versions at the level of generated projects: for every
+# device, the dependency values (define, cpu, ...) and the content of the
+# referenced files are fingerprinted. Paths are taken relative to the pack
+# directory, so two versions installed side by side compare equal unless a
+# file really changed.
+#
+#   python3 packdiff.py Atmel.SAMD20_DFP.1.0.0.pack Atmel.SAMD20_DFP.1.1.0.pack
+
+import argparse
+import hashlib
+import json
+import os
+import os.path
+import sys
+import pdscparser as PP
+
+# dependency fields naming a file (include names a directory)
+fileFields = ('header', 'template', 'linkerscript', 'system', 'startup')
+
+# sha256 of files and directory trees, memoized by path, size and mtime
+class filehasher(object):
+  def __init__(self):
+    self._digests = {}
+
+  def file(self, path):
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = self._digests.get(key)
+    if digest is None:
+      sha = hashlib.sha256()
+      with open(path, 'rb') as fo:
+        for chunk in iter(lambda: fo.read(1 << 20), b''):
+          sha.update(chunk)
+      digest = sha.hexdigest()
+      self._digests[key] = digest
+    return digest
+
+  # digest of the names and contents of every file below path
+  def tree(self, path):
+    sha = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+      dirs.sort()
+      for name in sorted(files):
+        filepath = os.path.join(root, name)
+        sha.update(os.path.relpath(filepath, path).encode('utf-8'))
+        sha.update((self.file(filepath) or '').encode('ascii'))
+    return sha.hexdigest()
+
+# path relative to the pack directory, unchanged if outside of it
+def packPath(path, packdir):
+  relpath = os.path.relpath(path, packdir)
+  if relpath.startswith('..'):
+    return path
+  return relpath.replace(os.sep, '/')
+
+# fingerprint of the project of a device: {field: [value, digest]}, 'other'
+# holds a sorted list of them; None if the device has no such project
+def deviceFingerprint(parser, device, lang='c', exe='exe', eextn='atmel', hasher=None):
+  hasher = hasher or filehasher()
+  try:
+    deps = parser.getGCCProjectDependencies(device, lang, exe, eextn)
+  except PP.pdscerror as inst:
+    return {'error':[type(inst).__name__, None]}
+  if deps is None:
+    return None
+
+  packdir = parser.getPackDir()
+  fingerprint = {}
+  for field, value in deps.items():
+    if field == 'other':
+      fingerprint[field] = sorted([packPath(f, packdir), hasher.file(f)] for f in value)
+    elif field == 'include':
+      fingerprint[field] = [packPath(value, packdir), hasher.tree(value)]
+    elif field in fileFields:
+      fingerprint[field] = [packPath(value, packdir), hasher.file(value)]
+    else:
+      fingerprint[field] = [value, None]
+  return fingerprint
+
+# fields whose value or content differs, ['device'] if the device is only
+# known on one side
+def compareFingerprints(old, new):
+  if old is None or new is None:
+    return [] if old == new else ['device']
+  return sorted(field for field in set(old) | set(new) if old.get(field) != new.get(field))
+
+# newest release version of a parsed pack
+def packRelease(parser):
+  releases = parser.getReleases()
+  return releases[0]['version'] if releases else None
+
+# compare two parsed versions of a pack; devices defaults to every device of
+# the new one. returns {'releases': (old, new), 'devices': {device: fields}}
+# listing only devices with changes
+def diffPacks(oldparser, newparser, devices=None, lang='c', exe='exe', eextn='atmel'):
+  hasher = filehasher()
+  olddevices = set(oldparser.getDevices())
+  if devices is None:
+    devices = newparser.getDevices()
+
+  changed = {}
+  for device in devices:
+    new = deviceFingerprint(newparser, device, lang, exe, eextn, hasher)
+    old = None
+    if device in olddevices:
+      old = deviceFingerprint(oldparser, device, lang, exe, eextn, hasher)
+    fields = compareFingerprints(old, new)
+    if fields:
+      changed[device] = fields
+
+  return {'releases':(packRelease(oldparser), packRelease(newparser)), 'devices':changed}
+
+def main():
+  aparser = argparse.ArgumentParser(description='Report devices whose project dependencies changed between two pack versions.')
+  aparser.add_argument('old', metavar='<old pdsc>', help="PDSC file or .pack archive of the old version")
+  aparser.add_argument('new', metavar='<new pdsc>', help="PDSC file or .pack archive of the new version")
+  aparser.add_argument('-d', metavar='<devicename>', nargs='+', help="Device name(s) or glob pattern(s) to compare (default: all devices of the new version)")
+  aparser.add_argument('--lang', choices=('c', 'cpp'), default='c', help="Project language (default: c)")
+  aparser.add_argument('--exe', choices=('exe', 'lib'), default='exe', help="Project type (default: exe)")
+  aparser.add_argument('--json', help="Print the report as JSON", action='store_true')
+  pargs = aparser.parse_args()
+
+  oldparser = PP.pdscparser(pargs.old)
+  newparser = PP.pdscparser(pargs.new)
+  devices = None
+  if pargs.d:
+    devices = []
+    for pattern in pargs.d:
+      devices.extend(d for d in newparser.findDevices(pattern) if d not in devices)
+
+  delta = diffPacks(oldparser, newparser, devices, pargs.lang, pargs.exe)
+  if pargs.json:
+    print (json.dumps(delta, indent=1, sort_keys=True))
+    return
+
+  print ('Release %s -> %s' %delta['releases'])
+  for device in sorted(delta['devices']):
+    print ('%s: %s' %(device, ' '.join(delta['devices'][device])))
+  for device in sorted(set(oldparser.getDevices()) - set(newparser.getDevices())):
+    print ('%s: removed' %(device))
+  print ('%d device(s) changed.' %(len(delta['devices'])))
+
+if __name__ == '__main__':
+  try:
+    main()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
@@ -0,0 +1,310 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+import os
+import os.path
+import posixpath
+import shutil
+import threading
+import time
+import zipfile
+import pdsctrace as PT
+
+# seconds a snapshot is trusted before directory mtimes are checked again
+snapshotCheckInterval = 2.0
+
+# (packdir, extractdir) -> packsnapshot or packarchive
+_snapshots = {}
+_snapshotsLock = threading.Lock()
+
+# normalized pack relative path ('/' separated) of a pdsc file name,
+# None if it points outside of the pack
+def normPackPath(name):
+  relpath = posixpath.normpath(name.replace('\\', '/').strip())
+  if relpath == '.':
+    return ''
+  if relpath.startswith('../') or relpath == '..' or relpath.startswith('/'):
+    return None
+  return relpath
+
+# is path a zipped pack (.pack archive) rather than a pack directory
+def isPackArchive(path):
+  return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+# get the (cached) snapshot of a pack directory or a .pack archive; files of
+# an archive are extracted on demand into extractdir
+def getSnapshot(packdir, extractdir=None):
+  packdir = os.path.abspath(packdir)
+  key = (packdir, extractdir)
+  with _snapshotsLock:
+    snapshot = _snapshots.get(key)
+  if snapshot is None:
+    # scanned outside the lock, the first snapshot published wins
+    if extractdir is not None:
+      snapshot = packarchive(packdir, extractdir)
+    else:
+      snapshot = packsnapshot(packdir)
+    with _snapshotsLock:
+      snapshot = _snapshots.setdefault(key, snapshot)
+  else:
+    snapshot.revalidate()
+  return snapshot
+
+# drop cached snapshots (all of them if packdir is None)
+def invalidate(packdir=None):
+  with _snapshotsLock:
+    if packdir is None:
+      _snapshots.clear()
+    else:
+      packdir = os.path.abspath(packdir)
+      for key in [key for key in _snapshots if key[0] == packdir]:
+        del _snapshots[key]
+
+# files and directories of a pack directory, collected with a single
+# recursive scandir; existence checks are answered without touching the disk
+class packsnapshot(object):
+  def __init__(self, packdir):
+    self._packdir = packdir
+    self._lock = threading.Lock()
+    # incremented on every (re)scan, lets users of the snapshot notice changes
+    self.generation = 0
+    self._scan()
+
+  # worker function to scan the pack directory; the tables are replaced as a
+  # whole, so concurrent lookups never see a partial scan
+  def _scan(self):
+    # relpath -> True for directories, False for files
+    entries = {'':True}
+    # relpath -> mtime of every scanned directory
+    dirMtimes = {}
+    # (st_dev, st_ino) of the scanned directories, symlinked directories are
+    # followed but never scanned twice (symlink cycles)
+    scanned = set()
+    pending = ['']
+    with PT.span('fs.scan', packdir=self._packdir):
+      while pending:
+        reldir = pending.pop()
+        absdir = os.path.join(self._packdir, reldir) if reldir else self._packdir
+        PT.count('fs.stat')
+        PT.count('fs.scandir')
+        try:
+          st = os.stat(absdir)
+          if (st.st_dev, st.st_ino) in scanned:
+            continue
+          scanned.add((st.st_dev, st.st_ino))
+          dirMtimes[reldir] = st.st_mtime_ns
+          direntries = list(os.scandir(absdir))
+        except OSError:
+          continue
+        for entry in direntries:
+          relpath = reldir + '/' + entry.name if reldir else entry.name
+          try:
+            isdir = entry.is_dir()
+            if not isdir and not entry.is_file():
+              continue
+          except OSError:
+            continue
+          entries[relpath] = isdir
+          if isdir:
+            pending.append(relpath)
+    self._entries = entries
+    self._dirMtimes = dirMtimes
+    self._checked = time.time()
+    self.generation += 1
+
+  # rescan if any directory changed since the last scan
+  def revalidate(self, force=False):
+    if not force and time.time() - self._checked < snapshotCheckInterval:
+      return
+    with self._lock:
+      if not force and time.time() - self._checked < snapshotCheckInterval:
+        return
+      for reldir, mtime in self._dirMtimes.items():
+        absdir = os.path.join(self._packdir, reldir) if reldir else self._packdir
+        PT.count('fs.stat')
+        try:
+          changed = os.stat(absdir).st_mtime_ns != mtime
+        except OSError:
+          changed = True
+        if changed:
+          self._scan()
+          return
+      self._checked = time.time()
+
+  # paths missing from the snapshot are checked on disk: the pdsc file may
+  # name them in a different case (case insensitive file systems), or they
+  # sit below a symlink cycle
+  def isfile(self, relpath):
+    isdir = self._entries.get(relpath)
+    if isdir is None:
+      PT.count('fs.stat')
+      return os.path.isfile(os.path.join(self._packdir, relpath))
+    return isdir is False
+
+  def isdir(self, relpath):
+    isdir = self._entries.get(relpath)
+    if isdir is None:
+      PT.count('fs.stat')
+      return os.path.isdir(os.path.join(self._packdir, relpath))
+    return isdir is True
+
+# files and directories of a .pack (zip) archive, taken from its central
+# directory; nothing is extracted until extract() asks for it
+class packarchive(object):
+  def __init__(self, archive, extractdir):
+    self._archive = archive
+    self._extractdir = extractdir
+    self._lock = threading.Lock()
+    self.generation = 0
+    self._scan()
+
+  # worker function to read the central directory of the archive
+  def _scan(self):
+    with PT.span('fs.scan', packdir=self._archive):
+      PT.count('fs.stat')
+      st = os.stat(self._archive)
+      self._stamp = (st.st_size, st.st_mtime_ns)
+      # relpath -> True for directories, False for files
+      self._entries = {'':True}
+      # relpath of a file -> ZipInfo of its archive member
+      self._members = {}
+      with zipfile.ZipFile(self._archive) as zf:
+        for info in zf.infolist():
+          relpath = normPackPath(info.filename)
+          if relpath is None or relpath == '':
+            continue
+          isdir = info.filename.endswith('/')
+          self._entries[relpath] = isdir
+          if not isdir:
+            self._members[relpath] = info
+          # directories are not always stored as members of their own
+          parent = posixpath.dirname(relpath)
+          while parent != '' and parent not in self._entries:
+            self._entries[parent] = True
+            parent = posixpath.dirname(parent)
+    self._checked = time.time()
+    self.generation += 1
+
+  # rescan if the archive changed since the last scan
+  def revalidate(self, force=False):
+    if not force and time.time() - self._checked < snapshotCheckInterval:
+      return
+    PT.count('fs.stat')
+    try:
+      st = os.stat(self._archive)
+      changed = (st.st_size, st.st_mtime_ns) != self._stamp
+    except OSError:
+      changed = True
+    if changed:
+      with self._lock:
+        self._scan()
+      return
+    self._checked = time.time()
+
+  def isfile(self, relpath):
+    return self._entries.get(relpath) is False
+
+  def isdir(self, relpath):
+    return self._entries.get(relpath) is True
+
+  # names of the pdsc files in the top level directory of the archive
+  def pdscFiles(self):
+    return sorted(relpath for relpath in self._members
+                  if '/' not in relpath and relpath.lower().endswith('.pdsc'))
+
+  # open an archive member for reading
+  def open(self, relpath):
+    zf = zipfile.ZipFile(self._archive)
+    try:
+      fo = zf.open(self._members[relpath])
+    finally:
+      # the member keeps its own reference to the archive file
+      zf.close()
+    return fo
+
+  # CRC of an archive member, identifies its content without reading it
+  def crc(self, relpath):
+    return self._members[relpath].CRC
+
+  # extract a file (or every file below a directory) into extractdir, unless
+  # the file on disk already matches its member (size and mtime, so other
+  # processes and earlier runs share extracted files and deleted ones are
+  # restored); returns the extracted path
+  def extract(self, relpath):
+    with self._lock:
+      if self.isdir(relpath):
+        prefix = relpath + '/' if relpath else ''
+        names = [name for name in self._members if name.startswith(prefix)]
+      else:
+        names = [relpath]
+      names = [name for name in names if not self._isExtracted(name)]
+      if names:
+        with PT.span('fs.extract', path=relpath):
+          with zipfile.ZipFile(self._archive) as zf:
+            for name in names:
+              self._extractMember(zf, name)
+    return os.path.join(self._extractdir, relpath)
+
+  # modification time of an archive member (zip times are local times)
+  def _memberMtime(self, relpath):
+    return time.mktime(self._members[relpath].date_time + (0, 0, -1))
+
+  # is the extracted file of a member up to date
+  def _isExtracted(self, relpath):
+    PT.count('fs.stat')
+    try:
+      st = os.stat(os.path.join(self._extractdir, relpath))
+    except OSError:
+      return False
+    return st.st_size == self._members[relpath].file_size \
+           and int(st.st_mtime) == int(self._memberMtime(relpath))
+
+  # worker function to extract one member through a temporary file
+  def _extractMember(self, zf, relpath):
+    dst = os.path.join(self._extractdir, relpath)
+    dstdir = os.path.dirname(dst)
+    if not os.path.isdir(dstdir):
+      os.makedirs(dstdir, exist_ok=True)
+    tmpname = '%s.%d.tmp' %(dst, os.getpid())
+    try:
+      with zf.open(self._members[relpath]) as fsrc, open(tmpname, 'wb') as fdst:
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+      mtime = self._memberMtime(relpath)
+      os.utime(tmpname, (mtime, mtime))
+      os.replace(tmpname, dst)
+    except:
+      if os.path.exists(tmpname):
+        os.remove(tmpname)
+      raise
+    PT.count('fs.extracted')
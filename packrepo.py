@@ -0,0 +1,174 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+import os
+import os.path
+import multiprocessing
+import xml.etree.ElementTree as ET
+import pdscparser as PP
+
+# sort key for pack versions (E.g. 1.2.10 > 1.2.9, 1.0.0 > 1.0.0-rc1)
+def versionKey(version):
+  release, _, prerelease = (version or '').partition('-')
+  parts = []
+  for part in release.split('.'):
+    parts.append(int(part) if part.isdigit() else -1)
+  return (parts, prerelease == '', prerelease)
+
+# worker function to read vendor, name, newest release version and device
+# names of a pdsc file; only the header and the device tags are kept while
+# streaming, so any schema version (E.g. the ARM CMSIS pack) can be scanned
+def scanPdscFile(pdscfile):
+  try:
+    info = {'pdsc':os.path.abspath(pdscfile), 'vendor':None, 'name':None,
+            'version':None, 'devices':[]}
+    versions = []
+    stack = []
+    for event, elem in ET.iterparse(pdscfile, events=('start', 'end')):
+      if event == 'start':
+        stack.append(elem)
+        continue
+
+      stack.pop()
+      if len(stack) == 1 and elem.tag in ('vendor', 'name'):
+        info[elem.tag] = (elem.text or '').strip()
+      elif elem.tag == 'release' and len(stack) == 2:
+        versions.append(elem.attrib.get('version'))
+      elif elem.tag == 'device':
+        info['devices'].extend(PP.deviceNames(elem))
+        elem.clear()
+      elif len(stack) == 1:
+        stack[0].remove(elem)
+
+    if versions:
+      info['version'] = max(versions, key=versionKey)
+    return info
+
+  except Exception as inst:
+    return {'pdsc':os.path.abspath(pdscfile), 'error':'%s:%s' %(type(inst), inst)}
+
+class packrepo(object):
+  # packroot: directory tree of installed packs (E.g. <vendor>/<pack>/<version>/)
+  # jobs: number of worker processes used to scan pdsc files
+  def __init__(self, packroot, jobs=None):
+    self.logmsg = False
+    if False == os.path.isdir(packroot):
+      self._err(packroot + ' is not a valid directory')
+    self._packroot = os.path.abspath(packroot)
+
+    pdscfiles = self._findPdscFiles()
+    self._log('found %d pdsc files in %s' %(len(pdscfiles), self._packroot))
+    if len(pdscfiles) > 1 and jobs != 1:
+      pool = multiprocessing.Pool(jobs)
+      try:
+        infos = pool.map(scanPdscFile, pdscfiles, chunksize=8)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      infos = [scanPdscFile(f) for f in pdscfiles]
+
+    # pack ("Vendor.Name") -> {version -> pack info}
+    self._packs = {}
+    # device name -> list of pack infos providing it
+    self._devices = {}
+    for info in infos:
+      if 'error' in info:
+        self._warn('skipping %s: %s' %(info['pdsc'], info['error']))
+        continue
+      self._packs.setdefault('%s.%s' %(info['vendor'], info['name']), {})[info['version']] = info
+      for device in info['devices']:
+        self._devices.setdefault(device, []).append(info)
+
+  # worker function to find every pdsc file below the pack root
+  def _findPdscFiles(self):
+    _files = []
+    for dirpath, dirnames, filenames in os.walk(self._packroot):
+      dirnames.sort()
+      for filename in sorted(filenames):
+        if filename.endswith('.pdsc'):
+          _files.append(os.path.join(dirpath, filename))
+    return _files
+
+  # get list of packs ("Vendor.Name")
+  def getPacks(self):
+    return sorted(self._packs)
+
+  # get list of versions of a pack, newest first
+  def getPackVersions(self, packname):
+    versions = self._findPackVersions(packname)
+    return sorted(versions, key=versionKey, reverse=True)
+
+  # get list of device names provided by any pack
+  def getDevices(self):
+    return sorted(self._devices)
+
+  # pack versions by "Vendor.Name" or, if unambiguous, by just the pack name
+  def _findPackVersions(self, packname):
+    if packname in self._packs:
+      return self._packs[packname]
+    matches = [p for p in self._packs if p.split('.', 1)[-1] == packname]
+    if len(matches) > 1:
+      self._err('Pack name "%s" is ambiguous: %s' %(packname, ', '.join(sorted(matches))))
+    if not matches:
+      return {}
+    return self._packs[matches[0]]
+
+  # pack info {'pdsc', 'vendor', 'name', 'version', 'devices'} of the given
+  # pack version, the newest one if version is None; None if not installed
+  def findPack(self, packname, version=None):
+    versions = self._findPackVersions(packname)
+    if not versions:
+      return None
+    if version is None:
+      version = max(versions, key=versionKey)
+    return versions.get(version)
+
+  # pack info of the newest pack providing the device, None if unknown
+  def findDevice(self, devicename):
+    infos = self._devices.get(devicename)
+    if not infos:
+      return None
+    return max(infos, key=lambda info: versionKey(info['version']))
+
+  def _log(self, lmsg):
+    if self.logmsg == False:
+      return
+    print ('==> %s' %(lmsg))
+
+  def _err(self, emsg):
+    raise PP.pdscerror(emsg)
+
+  def _warn(self, wmsg):
+    print ("Warning: %s" %(wmsg))
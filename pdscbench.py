@@ -0,0 +1,292 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Benchmarks of the pdsc parser and the Makefile generator on synthetic packs
+# (see pdscgen.py). Results can be stored as a baseline and later runs
+# compared against it. A benchmark slower (or larger) than the baseline by
+# more than the tolerance, and by more than an absolute floor that keeps timer
+# noise out, is measured again (--recheck); if it stays slower in every run,
+# the run exits with status 1. Timings depend on the machine: --baseline
+# compares with the baseline recorded on this machine (in the cache
+# directory), bench_baseline.json is the reference baseline kept with the
+# sources and is only used until a local one is recorded.
+#
+#   python3 pdscbench.py --save-baseline
+#   python3 pdscbench.py --baseline
+
+import argparse
+import collections
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import os.path
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pdscgen
+import pdscparser as PP
+
+baselineFormatVersion = 1
+
+# baseline of this machine
+defaultBaselineFile = os.path.join(PP.defaultCacheDir(), 'bench_baseline.json')
+
+# reference baseline stored with the sources
+referenceBaselineFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# calls of the getDevices benchmark, enough for a time well above timer noise
+getDevicesCalls = 10000
+
+# smallest difference to the baseline reported as a regression
+minTimeDelta = 0.001
+minBytesDelta = 64 * 1024
+
+# load genmake-arm.py, whose name is not a valid module name
+def loadGenmake():
+  path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'genmake-arm.py')
+  spec = importlib.util.spec_from_file_location('genmake_arm', path)
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+  return module
+
+# median wall clock time of repeat runs of func; setup (untimed) runs before
+# each of them and its result is passed to func
+def timeit(func, repeat, setup=None):
+  times = []
+  for i in range(repeat):
+    arg = setup() if setup is not None else None
+    start = time.perf_counter()
+    func(arg)
+    times.append(time.perf_counter() - start)
+  return statistics.median(times)
+
+# peak traced memory (bytes) of one run of func
+def peakmemory(func, setup=None):
+  arg = setup() if setup is not None else None
+  tracemalloc.start()
+  try:
+    func(arg)
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+class pdscbench:
+  def __init__(self, workdir, devices, processors, components, files, repeat):
+    self._workdir = workdir
+    self._repeat = repeat
+    self._packdir = os.path.join(workdir, 'pack')
+    self._cachedir = os.path.join(workdir, 'cache')
+    self._outdir = os.path.join(workdir, 'out')
+    self._pdscfile = pdscgen.generatePack(self._packdir, devices, processors, components, files)
+    self._genmake = loadGenmake()
+    self._devicenames = PP.pdscparser(self._pdscfile).getDevices()
+    self.config = {'devices':devices, 'processors':processors,
+                   'components':components, 'files':files}
+
+  def _parser(self, arg=None):
+    return PP.pdscparser(self._pdscfile)
+
+  def _cachedParser(self, arg=None):
+    return PP.pdscparser(self._pdscfile, cachedir=self._cachedir)
+
+  def _streamedParser(self, arg=None):
+    return PP.pdscparser(self._pdscfile, devices=self._devicenames[:1])
+
+  def _clearCache(self):
+    shutil.rmtree(self._cachedir, ignore_errors=True)
+
+  # all language / project type combinations of every device
+  def _getDependencies(self, parser):
+    deps = []
+    for device in self._devicenames:
+      for lang in ('c', 'c++'):
+        for exe in ('exe', 'lib'):
+          deps.append(parser.getGCCProjectDependencies(device, lang, exe, 'atmel'))
+    return deps
+
+  def _getDevices(self, parser):
+    for i in range(getDevicesCalls):
+      parser.getDevices()
+
+  # the same combinations through the bulk resolver
+  def _getAllDependencies(self, parser):
+    return parser.getAllGCCProjectDependencies(self._devicenames, 'atmel', ('c', 'c++'))
+
+  # dependencies of every device and an empty output directory; the files
+  # of the previous run are flushed, so their writeback isn't timed
+  def _dependencies(self):
+    parser = self._parser()
+    shutil.rmtree(self._outdir, ignore_errors=True)
+    os.makedirs(self._outdir)
+    if hasattr(os, 'sync'):
+      os.sync()
+    return [parser.getGCCProjectDependencies(device, 'c', 'exe', 'atmel')
+            for device in self._devicenames]
+
+  def _createMakefiles(self, deps):
+    with contextlib.redirect_stdout(io.StringIO()):
+      for device, dep in zip(self._devicenames, deps):
+        self._genmake.createMakefile(device, 'c', dep, self._outdir, copycfg=True)
+
+  # a parser that has answered every query once
+  def _warmParser(self, arg=None):
+    parser = self._parser()
+    self._getDependencies(parser)
+    return parser
+
+  # benchmark name -> function measuring it
+  def _benchmarks(self):
+    repeat = self._repeat
+    return collections.OrderedDict((
+      ('parse', lambda: timeit(self._parser, repeat)),
+      ('parse_stream', lambda: timeit(self._streamedParser, repeat)),
+      ('parse_cache_store', lambda: timeit(self._cachedParser, repeat, self._clearCache)),
+      ('parse_cache_load', lambda: timeit(self._cachedParser, repeat, self._cachedParser)),
+      ('getDevices_x%d' %(getDevicesCalls), lambda: timeit(self._getDevices, repeat, self._parser)),
+      ('dependencies_cold', lambda: timeit(self._getDependencies, repeat, self._parser)),
+      ('dependencies_bulk', lambda: timeit(self._getAllDependencies, repeat, self._parser)),
+      ('dependencies_memoized', lambda: timeit(self._getDependencies, repeat, self._warmParser)),
+      ('createMakefile', lambda: timeit(self._createMakefiles, repeat, self._dependencies)),
+      ('parse_peak_bytes', lambda: peakmemory(self._parser)),
+      ('dependencies_peak_bytes', lambda: peakmemory(self._getDependencies, self._parser)),
+      ('createMakefile_peak_bytes', lambda: peakmemory(self._createMakefiles, self._dependencies)),
+    ))
+
+  # run all benchmarks, or the given ones
+  def run(self, names=None):
+    benchmarks = self._benchmarks()
+    return dict((name, benchmarks[name]()) for name in (names or benchmarks))
+
+# compare results with a baseline, return the list of regressions
+def compareBaseline(baseline, config, results, tolerance):
+  if baseline.get('version') != baselineFormatVersion:
+    raise PP.pdscerror('Unsupported baseline format')
+  if baseline.get('config') != config:
+    raise PP.pdscerror('Baseline was recorded with a different configuration: %s' %(baseline.get('config')))
+  regressions = []
+  for name, value in sorted(results.items()):
+    reference = baseline['results'].get(name)
+    if reference is None:
+      continue
+    floor = minBytesDelta if name.endswith('_bytes') else minTimeDelta
+    if value > reference * (1.0 + tolerance) and value - reference > floor:
+      regressions.append((name, reference, value))
+  return regressions
+
+def formatValue(name, value):
+  if name.endswith('_bytes'):
+    return '%10.1f KiB' %(value / 1024.0)
+  return '%10.3f ms ' %(value * 1000.0)
+
+def main():
+  aparser = argparse.ArgumentParser(description='Benchmark the pdsc parser and Makefile generator.')
+  aparser.add_argument('--devices', type=int, default=200, help="Number of devices (default: 200)")
+  aparser.add_argument('--processors', type=int, default=1, help="Processors per device (default: 1)")
+  aparser.add_argument('--components', type=int, default=2, help="Components per device processor (default: 2)")
+  aparser.add_argument('--files', type=int, default=20, help="Files per component (default: 20)")
+  aparser.add_argument('--repeat', type=int, default=11, help="Runs per benchmark, the median is kept (default: 11)")
+  aparser.add_argument('--baseline', metavar='<file>', nargs='?', const=defaultBaselineFile, help="Compare the results with a stored baseline (default: %s, %s until that is recorded)" %(defaultBaselineFile, os.path.basename(referenceBaselineFile)))
+  aparser.add_argument('--save-baseline', metavar='<file>', nargs='?', const=defaultBaselineFile, help="Store the results as a baseline (default: %s)" %(defaultBaselineFile))
+  aparser.add_argument('--recheck', type=int, default=2, help="Times a regressed benchmark is measured again; only a regression seen in every run is reported (default: 2)")
+  aparser.add_argument('--tolerance', type=float, default=0.25,
+                       help="Allowed slowdown relative to the baseline (default: 0.25), differences below %g ms or %d KiB are ignored" %(minTimeDelta * 1000, minBytesDelta // 1024))
+  pargs = aparser.parse_args()
+
+  baseline = None
+  if pargs.baseline == defaultBaselineFile and not os.path.isfile(defaultBaselineFile):
+    print ('No baseline recorded on this machine, comparing with the reference baseline'
+           ' (record one with --save-baseline)')
+    pargs.baseline = referenceBaselineFile
+  if pargs.baseline:
+    try:
+      with open(pargs.baseline) as fo:
+        baseline = json.load(fo)
+    except (IOError, OSError) as inst:
+      raise PP.pdscerror('No baseline, record one with --save-baseline: %s' %(inst))
+
+  workdir = tempfile.mkdtemp(prefix='pdscbench-')
+  try:
+    bench = pdscbench(workdir, pargs.devices, pargs.processors, pargs.components,
+                      pargs.files, pargs.repeat)
+    results = bench.run()
+
+    for name in sorted(results):
+      print ('%-28s %s' %(name, formatValue(name, results[name])))
+
+    # a slow run of the machine is no regression, so each one must reproduce;
+    # the best of the runs is kept
+    regressions = []
+    if baseline is not None:
+      regressions = compareBaseline(baseline, bench.config, results, pargs.tolerance)
+      for i in range(pargs.recheck):
+        if not regressions:
+          break
+        names = [name for name, reference, value in regressions]
+        print ('Rechecking %s' %(' '.join(names)))
+        for name, value in bench.run(names).items():
+          results[name] = min(results[name], value)
+        regressions = compareBaseline(baseline, bench.config, results, pargs.tolerance)
+  finally:
+    shutil.rmtree(workdir, ignore_errors=True)
+
+  if pargs.save_baseline:
+    baselinedir = os.path.dirname(os.path.abspath(pargs.save_baseline))
+    if not os.path.isdir(baselinedir):
+      os.makedirs(baselinedir)
+    with open(pargs.save_baseline, 'w') as fo:
+      json.dump({'version':baselineFormatVersion, 'config':bench.config, 'results':results},
+                fo, indent=2, sort_keys=True)
+      fo.write('\n')
+    print ('Baseline saved (%s).' %(os.path.abspath(pargs.save_baseline)))
+
+  if baseline is not None:
+    for name, reference, value in regressions:
+      print ('REGRESSION: %s %s -> %s (%+.0f%%)' %(name, formatValue(name, reference).strip(),
+             formatValue(name, value).strip(), (value / reference - 1.0) * 100.0))
+    if regressions:
+      sys.exit(1)
+    print ('No regressions against %s.' %(pargs.baseline))
+
+if __name__ == '__main__':
+  try:
+    main()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
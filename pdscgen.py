@@ -0,0 +1,170 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Generator of synthetic schema 1.3 packs with Atmel extensions, used by the
+# benchmarks (pdscbench.py). Every device gets the files a GCC project needs
+# (include directory, header, linker script, startup, system and other files)
+# on disk, so the generated pack passes all existence checks.
+
+import argparse
+import os
+import os.path
+
+atmelExtension = 'http://www.atmel.com/schemas/pack-device-atmel-extension'
+
+# device name of the n-th synthetic device
+def syntheticDeviceName(n):
+  return 'ATSAMX%04dA' %(n)
+
+# write a synthetic pack to packdir and return the path of its pdsc file
+#   devices: number of devices
+#   processors: processors per device (more than one gives "Dname:Pname" names)
+#   components: components per device processor
+#   files: files per component (at least the GCC project files of a device)
+def generatePack(packdir, devices=10, processors=1, components=1, files=10):
+  if not os.path.isdir(packdir):
+    os.makedirs(packdir)
+  _writeFile(os.path.join(packdir, 'templates', 'main.c'), 'int main(void) { return 0; }\n')
+  _writeFile(os.path.join(packdir, 'templates', 'main.cpp'), 'int main() { return 0; }\n')
+  _writeFile(os.path.join(packdir, 'templates', 'library.c'), 'int lib(void) { return 0; }\n')
+  _writeFile(os.path.join(packdir, 'templates', 'library.cpp'), 'int lib() { return 0; }\n')
+
+  pdsc = []
+  pdsc.append('<?xml version="1.0" encoding="UTF-8"?>')
+  pdsc.append('<package schemaVersion="1.3" xmlns:atmel="%s">' %(atmelExtension))
+  pdsc.append('  <vendor>Atmel</vendor>')
+  pdsc.append('  <name>SAMX_DFP</name>')
+  pdsc.append('  <description>Synthetic device family pack</description>')
+  pdsc.append('  <releases>')
+  pdsc.append('    <release version="1.0.0" date="2015-01-01">Synthetic release</release>')
+  pdsc.append('  </releases>')
+  pdsc.append('  <devices>')
+  pdsc.append('    <family Dfamily="SAM X" Dvendor="Atmel:3">')
+
+  componentTags = []
+  for d in range(devices):
+    dname = syntheticDeviceName(d)
+    pnames = [''] if processors == 1 else [str(p) for p in range(processors)]
+    core = ('Cortex-M0+', 'Cortex-M4', 'Cortex-M7')[d % 3]
+    pdsc.append('      <device Dname="%s">' %(dname))
+    projects = []
+    for pname in pnames:
+      pattr = ' Pname="%s"' %(pname) if pname != '' else ''
+      fullname = dname + ':' + pname if pname != '' else dname
+      devdir = 'samx/%s%s' %(dname.lower(), pname)
+      pdsc.append('        <processor%s Dcore="%s" Dfpu="NO_FPU" Dendian="Little-endian" Dclock="48000000"/>' %(pattr, core))
+      pdsc.append('        <compile%s header="%s/include/samx.h" define="__%s%s__"/>' %(pattr, devdir, dname, pname))
+      pdsc.append('        <debug%s svd="%s/svd/%s.svd"/>' %(pattr, devdir, dname))
+      for lang in ('C', 'C++'):
+        projects.append('            <atmel:project name="GCC %s Executable Project"%s>' %(lang, pattr))
+        for c in range(components):
+          projects.append('              <atmel:component Cvendor="Atmel" Cclass="Device" Cgroup="%s"/>' %(_groupName(c)))
+        projects.append('            </atmel:project>')
+      for c in range(components):
+        componentTags.extend(_component(packdir, fullname, devdir, c, files))
+
+    pdsc.append('        <environment name="atmel">')
+    pdsc.append('          <atmel:extension>')
+    pdsc.extend(projects)
+    pdsc.append('          </atmel:extension>')
+    pdsc.append('        </environment>')
+    pdsc.append('      </device>')
+
+  pdsc.append('    </family>')
+  pdsc.append('  </devices>')
+  pdsc.append('  <components>')
+  pdsc.extend(componentTags)
+  pdsc.append('  </components>')
+  pdsc.append('</package>')
+
+  pdscfile = os.path.join(packdir, 'Atmel.SAMX_DFP.pdsc')
+  _writeFile(pdscfile, '\n'.join(pdsc) + '\n')
+  return pdscfile
+
+def _groupName(c):
+  return 'Startup' if c == 0 else 'Group%d' %(c)
+
+# component tag lines of one device processor; the first component carries
+# the GCC project files, the remaining files are unclassified sources
+def _component(packdir, condition, devdir, c, files):
+  lines = []
+  lines.append('    <component Cvendor="Atmel" Cclass="Device" Cgroup="%s" Cversion="1.0.0" condition="%s">' %(_groupName(c), condition))
+  lines.append('      <files>')
+  count = 0
+  if c == 0:
+    projectFiles = [('include', 'C', devdir + '/include/'),
+                    ('header', 'C', devdir + '/include/samx.h'),
+                    ('source', 'C Exe', 'templates/main.c'),
+                    ('source', 'C Exe', 'templates/main.cpp'),
+                    ('source', 'C Lib', 'templates/library.c'),
+                    ('source', 'C Lib', 'templates/library.cpp'),
+                    ('linkerScript', 'GCC Exe', devdir + '/gcc/samx_flash.ld'),
+                    ('source', 'GCC Exe', devdir + '/gcc/startup_samx.c'),
+                    ('source', 'GCC Exe', devdir + '/gcc/system_samx.c'),
+                    ('other', 'GCC Exe', devdir + '/gcc/samx_common.ld')]
+    for category, fcondition, name in projectFiles:
+      if not name.startswith('templates/') and not name.endswith('/'):
+        _writeFile(os.path.join(packdir, name), '/* %s */\n' %(name))
+      lines.append('        <file category="%s" condition="%s" name="%s"/>' %(category, fcondition, name))
+      count += 1
+    _makeDir(os.path.join(packdir, devdir, 'include'))
+
+  while count < files:
+    lines.append('        <file category="source" condition="C" name="%s/src/group%d_file%d.c"/>' %(devdir, c, count))
+    count += 1
+  lines.append('      </files>')
+  lines.append('    </component>')
+  return lines
+
+def _makeDir(path):
+  if not os.path.isdir(path):
+    os.makedirs(path)
+
+def _writeFile(path, content):
+  _makeDir(os.path.dirname(path))
+  with open(path, 'w') as fo:
+    fo.write(content)
+
+def main():
+  aparser = argparse.ArgumentParser(description='Generate a synthetic Atmel device family pack.')
+  aparser.add_argument('-o', metavar='<pack dir>', help="Output pack directory", required=True)
+  aparser.add_argument('--devices', type=int, default=10, help="Number of devices (default: 10)")
+  aparser.add_argument('--processors', type=int, default=1, help="Processors per device (default: 1)")
+  aparser.add_argument('--components', type=int, default=1, help="Components per device processor (default: 1)")
+  aparser.add_argument('--files', type=int, default=10, help="Files per component (default: 10)")
+  pargs = aparser.parse_args()
+  print (generatePack(pargs.o, pargs.devices, pargs.processors, pargs.components, pargs.files))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,117 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Compact, slotted object model of a parsed pdsc file. pdscparser builds it
+# once and drops the ElementTree afterwards; names that repeat across devices
+# (cores, vendors, conditions, ...) are interned.
+
+import sys
+
+# intern a pdsc attribute value (None stays None)
+def intern(value):
+  if value is None:
+    return None
+  return sys.intern(value)
+
+class Device(object):
+  __slots__ = ('name', 'family', 'vendor', 'processors', 'environments')
+
+  # processors: tuple of Processor, environments: {name -> Environment}
+  def __init__(self, name, family, vendor, processors=(), environments=None):
+    self.name = intern(name)
+    self.family = intern(family)
+    self.vendor = intern(vendor)
+    self.processors = processors
+    self.environments = environments if environments is not None else {}
+
+class Processor(object):
+  __slots__ = ('dname', 'pname', 'fullname', 'core', 'fpu', 'mpu', 'endian', 'clock',
+               'header', 'define', 'svd')
+
+  # attributes of the processor tag and of the matching compile and debug tags
+  # (None if the device has no such tag)
+  def __init__(self, dname, pname, processorAttrib, compileAttrib, debugAttrib):
+    self.dname = intern(dname)
+    self.pname = intern(pname)
+    self.fullname = intern(dname + ':' + pname) if pname != '' else self.dname
+    self.core = intern(processorAttrib.get('Dcore'))
+    self.fpu = intern(processorAttrib.get('Dfpu'))
+    self.mpu = intern(processorAttrib.get('Dmpu'))
+    self.endian = intern(processorAttrib.get('Dendian'))
+    self.clock = intern(processorAttrib.get('Dclock'))
+    self.header = compileAttrib.get('header') if compileAttrib is not None else None
+    self.define = intern(compileAttrib.get('define')) if compileAttrib is not None else None
+    self.svd = debugAttrib.get('svd') if debugAttrib is not None else None
+
+class Environment(object):
+  __slots__ = ('name', 'projects')
+
+  # projects: tuple of Project
+  def __init__(self, name, projects=()):
+    self.name = intern(name)
+    self.projects = projects
+
+class Project(object):
+  __slots__ = ('name', 'pname', 'components')
+
+  # components: tuple of (Cvendor, Cclass, Cgroup) keys
+  def __init__(self, name, pname, components=()):
+    self.name = intern(name)
+    self.pname = intern(pname)
+    self.components = components
+
+class Component(object):
+  __slots__ = ('vendor', 'cclass', 'group', 'condition', 'files')
+
+  # files: tuple of PackFile
+  def __init__(self, vendor, cclass, group, condition, files=()):
+    self.vendor = intern(vendor)
+    self.cclass = intern(cclass)
+    self.group = intern(group)
+    self.condition = intern(condition)
+    self.files = files
+
+class PackFile(object):
+  __slots__ = ('field', 'kind', 'variant', 'abspath', 'relpath')
+
+  # field: dependency it provides (include, header, template, ...)
+  # kind: 'file' or 'dir'
+  # variant: (lang, exe) it is restricted to, None for all projects
+  # relpath: normalized pack relative path, None if outside of the pack
+  def __init__(self, field, kind, variant, abspath, relpath):
+    self.field = intern(field)
+    self.kind = intern(kind)
+    self.variant = variant
+    self.abspath = abspath
+    self.relpath = relpath
@@ -32,44 +32,306 @@
 #
 ##############################################################################
 
-import sys
 import xml.etree.ElementTree as ET
-import argparse
 import os.path
+import hashlib
+import pickle
+import tempfile
+import copy
+import time
+import collections
+import threading
+import packfs
+import pdscmodel as PM
+import pdsctrace as PT
+import devicesearch as DS
+
+# bump whenever the layout of the cached model changes
+cacheFormatVersion = 4
+
+# default directory for parsed pack snapshots
+def defaultCacheDir():
+  cachehome = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+  return os.path.join(cachehome, 'pack-utils')
+
+# default directory for files extracted on demand from a .pack archive
+def defaultExtractDir(archive):
+  archive = os.path.abspath(archive)
+  return os.path.join(defaultCacheDir(), 'packs', '%s-%s'
+                      %(os.path.basename(archive), hashlib.sha1(archive.encode('utf-8')).hexdigest()[:12]))
+
+# errors raised by the parser; pdscerror is the base of all of them
+class pdscerror(Exception):
+  pass
+
+# pdsc file is missing or not a file
+class pdscfileerror(pdscerror):
+  pass
+
+# pdsc file uses an unsupported schema version
+class unsupportedschema(pdscerror):
+  pass
+
+# device is not part of the pack (or was not requested when streaming)
+class devicenotfound(pdscerror):
+  pass
+
+# device has no environment for the requested extension
+class extensionnotfound(pdscerror):
+  pass
+
+# a file or directory referenced by the pdsc file is missing in the pack
+class packfilenotfound(pdscerror):
+  pass
+
+# SVD file can't be read, or has no such peripheral, register or field
+class svderror(pdscerror):
+  pass
+
+# bounded LRU table of query results with hit/miss counters; shared by the
+# handler threads of pdscserver, so every operation holds a lock
+class resultcache(object):
+  def __init__(self, maxsize):
+    self._maxsize = maxsize
+    self._lock = threading.Lock()
+    self._entries = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  # (True, result) on a hit, (False, None) on a miss
+  def get(self, key):
+    with self._lock:
+      if key in self._entries:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return (True, self._entries[key])
+      self.misses += 1
+      return (False, None)
+
+  def put(self, key, result):
+    if self._maxsize <= 0:
+      return
+    with self._lock:
+      self._entries[key] = result
+      self._entries.move_to_end(key)
+      while len(self._entries) > self._maxsize:
+        self._entries.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+
+  def stats(self):
+    with self._lock:
+      return {'hits':self.hits, 'misses':self.misses, 'size':len(self._entries),
+              'maxsize':self._maxsize}
+
+  # locks don't pickle (spawned pool workers), a copy gets its own
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state['_lock']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+# device names ("Dname" or "Dname:Pname") provided by a device tag
+def deviceNames(devTag):
+  devname = devTag.attrib.get('Dname')
+  processors = devTag.findall('processor')
+  pname = []
+  for p in processors:
+    pname.append(p.attrib.get('Pname'))
+
+  _names = []
+  for pn in pname:
+    if pn is not None:
+      _names.append(devname + ':' + pn)
+    else:
+      _names.append(devname)
+  return _names
 
 class pdscparser(object):
   #def __init__(self, pdscfile, cmsis_pdscfile):
-  def __init__(self, pdscfile):
+  # devices: optional list of device names; when given, the pdsc file is
+  # streamed and only those devices (and their components) are kept in memory
+  # cachedir: optional directory holding snapshots of the parsed model
+  # resultcachesize: number of memoized query results (0 disables, default:
+  # every lang / exe combination of every device, at least 256)
+  # pdscfile may also be a .pack archive; its pdsc file is read in place and
+  # the files a project needs are extracted on demand into extractdir
+  # (default: see defaultExtractDir)
+  def __init__(self, pdscfile, devices=None, cachedir=None, resultcachesize=None,
+               extractdir=None):
     try:
       self.logmsg = False
+      # memoized query results and resolved devices (see _getResolved), sized
+      # once the device list is known (see _createResultCaches)
+      self._results = None
+      self._resolved = None
+      # serializes memoized queries and the lazy indexes of handler threads
+      # sharing this parser (pdscserver)
+      self._lock = threading.RLock()
+      self._resultsStamp = None
+      self._resultsChecked = 0
+      self._search = None
       self._supportedSchemaVersions = ['1.3']
       self._supportedExtensions = {'atmel':'http://www.atmel.com/schemas/pack-device-atmel-extension'}
+      self._fileDescriptions = {'include':'include directory', 'header':'header file',
+                                'template':'template file', 'linkerscript':'linker script',
+                                'system':'system file', 'startup':'startup file',
+                                'other':'other config file'}
 
       # process pdscfile
       if False == os.path.isfile(pdscfile):
-        self._err(pdscfile + ' is not a valid file')
+        self._err(pdscfile + ' is not a valid file', pdscfileerror)
       self._pdscfile = os.path.abspath(pdscfile)
       self._packdir = os.path.dirname(self._pdscfile)
+      self._archive = None
+      self._pdscmember = None
+      if packfs.isPackArchive(self._pdscfile):
+        self._archive = self._pdscfile
+        self._packdir = os.path.abspath(extractdir or defaultExtractDir(self._archive))
+        pdscs = self._getSnapshot().pdscFiles()
+        if not pdscs:
+          self._err('No pdsc file found in %s' %(self._archive), pdscfileerror)
+        self._pdscmember = pdscs[0]
+        self._log('reading %s from %s' %(self._pdscmember, self._archive))
+      self._root = None
+      self._streamed = False
+
+      # load parsed model from a valid snapshot, skipping XML entirely
+      self._cachefile = None
+      if cachedir is not None:
+        self._cachefile = os.path.join(os.path.abspath(cachedir), '%s-%s.cache'
+                          %(os.path.basename(self._pdscfile),
+                            hashlib.sha1(self._pdscfile.encode('utf-8')).hexdigest()[:12]))
+        self._cachekey = self._getCacheKey()
+        with PT.span('cache.load'):
+          loaded = self._loadCache()
+        if loaded:
+          self._log('loaded parsed model from %s' %(self._cachefile))
+          self._createResultCaches(resultcachesize)
+          return
 
       # parse pdscfile
-      tree = ET.parse(self._pdscfile)
-      self._root = tree.getroot()
+      self._streamed = devices is not None
+      with PT.span('parse.xml', file=self._pdscfile, streamed=self._streamed):
+        if self._streamed:
+          self._root, self._devices = self._parseStreaming(devices)
+        else:
+          with self._openPdsc() as fo:
+            tree = ET.parse(fo)
+          self._root = tree.getroot()
 
       # check supported schema
-      schemaVer = self._root.attrib.get('schemaVersion')
-      if schemaVer not in self._supportedSchemaVersions:
-        self._err('Supports only schema version %s' %(self._supportedSchemaVersions))
+      with PT.span('parse.schema'):
+        schemaVer = self._root.attrib.get('schemaVersion')
+        if schemaVer not in self._supportedSchemaVersions:
+          self._err('Supports only schema version %s' %(self._supportedSchemaVersions), unsupportedschema)
       self._log('verified schema version')
 
       # get list of releases
-      self._releases = self._getReleases()
+      with PT.span('parse.releases'):
+        self._releases = self._getReleases()
+        self._packInfo = self._getPackInfo()
+
+      # parse list of devices (already collected while streaming)
+      if not self._streamed:
+        with PT.span('parse.devices'):
+          self._devices = self._getDevices()
+
+      # build lookup tables for devices, processors and environments
+      with PT.span('parse.indexes'):
+        self._buildIndexes()
+
+      # build lookup table for components and their classified files
+      with PT.span('parse.components'):
+        self._componentIndex = self._getComponents()
 
-      # parse list of devices
-      self._devices = self._getDevices()
+      # everything needed is in the object model now, release the tree
+      self._root = None
+      self._createResultCaches(resultcachesize)
+
+      # a streamed model is partial and must not be cached
+      if self._cachefile is not None and not self._streamed:
+        with PT.span('cache.save'):
+          self._saveCache()
+
+    except pdscerror:
+      raise
 
     except Exception as inst:
       self._err("initialization: %s:%s" %(type(inst), inst))
 
+  # cache key of the pdsc file: path, size, mtime and content hash (the CRC
+  # of the pdsc member of an archive); the pack directory is part of it as
+  # file paths in the model are absolute
+  def _getCacheKey(self):
+    PT.count('fs.stat')
+    st = os.stat(self._pdscfile)
+    if self._archive is not None:
+      digest = '%s:%08x' %(self._pdscmember, self._getSnapshot().crc(self._pdscmember))
+    else:
+      sha = hashlib.sha256()
+      with open(self._pdscfile, 'rb') as fo:
+        for chunk in iter(lambda: fo.read(1 << 20), b''):
+          sha.update(chunk)
+      digest = sha.hexdigest()
+    return (self._pdscfile, self._packdir, st.st_size, st.st_mtime_ns, digest)
+
+  # the pdsc file (or its member of a .pack archive) opened for parsing
+  def _openPdsc(self):
+    if self._archive is not None:
+      return self._getSnapshot().open(self._pdscmember)
+    return open(self._pdscfile, 'rb')
+
+  # snapshot of the pack directory or archive answering existence checks
+  def _getSnapshot(self):
+    if self._archive is not None:
+      return packfs.getSnapshot(self._archive, self._packdir)
+    return packfs.getSnapshot(self._packdir)
+
+  # parsed model that is stored in (and restored from) a snapshot
+  _cachedAttributes = ('_releases', '_packInfo', '_devices', '_deviceIndex', '_processorIndex',
+                       '_componentIndex')
+
+  # restore the parsed model from the snapshot, False if missing or stale
+  def _loadCache(self):
+    try:
+      with open(self._cachefile, 'rb') as fo:
+        version, key, model = pickle.load(fo)
+    except Exception:
+      return False
+
+    if version != cacheFormatVersion or key != self._cachekey:
+      self._log('stale cache %s' %(self._cachefile))
+      return False
+
+    for attr in self._cachedAttributes:
+      setattr(self, attr, model[attr])
+    return True
+
+  # write the parsed model to the snapshot; cache failures are not fatal
+  def _saveCache(self):
+    try:
+      cachedir = os.path.dirname(self._cachefile)
+      if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+      model = {}
+      for attr in self._cachedAttributes:
+        model[attr] = getattr(self, attr)
+
+      fd, tmpname = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+      with os.fdopen(fd, 'wb') as fo:
+        pickle.dump((cacheFormatVersion, self._cachekey, model), fo, pickle.HIGHEST_PROTOCOL)
+      os.replace(tmpname, self._cachefile)
+      self._log('saved parsed model to %s' %(self._cachefile))
+
+    except Exception as inst:
+      self._warn('could not write cache %s: %s' %(self._cachefile, inst))
+
   # get list of releases
   def getReleases(self):
     return self._releases
@@ -78,6 +340,7 @@ class pdscparser(object):
   def _getReleases(self):
     try:
       _releases = []
+      PT.count('xpath.lookups')
       lreleases = self._root.findall('releases/release')
       for lrelease in lreleases:
         _releases.append({'version':lrelease.attrib.get('version'),
@@ -86,39 +349,316 @@ class pdscparser(object):
 
       return _releases
 
+    except pdscerror:
+      raise
+
     except Exception as inst:
       self._err('get releases: %s:%s' %(type(inst), inst))
 
+  # get vendor, name, description and url of the pack
+  def getPackInfo(self):
+    return dict(self._packInfo)
+
+  # worker function to read the pack header
+  def _getPackInfo(self):
+    _info = {}
+    for tag in ('vendor', 'name', 'description', 'url'):
+      PT.count('xpath.lookups')
+      elem = self._root.find(tag)
+      _info[tag] = (elem.text or '').strip() if elem is not None else None
+    return _info
+
+  # object model of the parsed devices (pdscmodel.Device), in pack order
+  def getDeviceModels(self):
+    return list(self._deviceIndex.values())
+
+  # object model of the parsed components (pdscmodel.Component)
+  def getComponentModels(self):
+    return list(self._componentIndex.values())
+
+  # directory holding the pack files (the extraction directory of an archive)
+  def getPackDir(self):
+    return self._packdir
+
+  # absolute path of a file named by the pdsc file (E.g. the svd of
+  # getDeviceSpecifics), extracted on demand from a .pack archive
+  def getPackFile(self, name):
+    try:
+      relpath = packfs.normPackPath(name)
+      abspath = self._packdir + '/' + name
+      if relpath is None:
+        found = os.path.isfile(abspath)
+      else:
+        snapshot = self._getSnapshot()
+        found = snapshot.isfile(relpath)
+        if found and self._archive is not None:
+          abspath = snapshot.extract(relpath)
+      if False == found:
+        self._err('Could not find file "%s"' %(abspath), packfilenotfound)
+      return abspath
+
+    except pdscerror:
+      raise
+
+    except Exception as inst:
+      self._err("getPackFile: %s:%s" %(type(inst), inst))
+
   # get list of devices
   def getDevices(self):
     return self._devices
 
+  # find devices by glob pattern (E.g. 'ATSAME70*') and attributes: core
+  # (Dcore), family (Dfamily) and pname (Pname, True for any); attributes of
+  # a streamed pack are only known for the requested devices
+  def findDevices(self, pattern=None, core=None, family=None, pname=None):
+    try:
+      with self._lock:
+        if self._search is None:
+          with PT.span('query.searchindex'):
+            self._search = DS.devicesearch(self._devices, self._processorIndex.values(),
+                                           self._deviceIndex)
+      return self._search.find(pattern, core, family, pname)
+
+    except pdscerror:
+      raise
+
+    except Exception as inst:
+      self._err("findDevices: %s:%s" %(type(inst), inst))
+
   # worker function to find the list of devices
   def _getDevices(self):
     try:
 
+      PT.count('xpath.lookups')
       devicesTag = self._root.findall('devices/family/device')
 
       _devices = []
 
       for devTag in devicesTag:
-        devname = devTag.attrib.get('Dname')
-        processors = devTag.findall('processor')
-        pname = []
-        for p in processors:
-          pname.append(p.attrib.get('Pname'))
-
-        for pn in pname:
-          if pn is not None:
-            _devices.append(devname + ':' + pn)
-          else:
-            _devices.append(devname)
+        _devices.extend(deviceNames(devTag))
 
       return _devices
 
+    except pdscerror:
+      raise
+
     except Exception as inst:
       self._err("getDevices: %s:%s" %(type(inst), inst))
 
+  # worker function to stream the pdsc file, keeping releases, the list of
+  # device names and only the device and component tags of requested devices
+  def _parseStreaming(self, ldevices):
+    try:
+      wantedDevices = set()
+      for ldevicename in ldevices:
+        wantedDevices.add(self._splitDeviceName(ldevicename)['device'])
+      wantedConditions = set(ldevices)
+      keptSections = ('vendor', 'name', 'description', 'url', 'releases', 'devices', 'components')
+
+      # stack of (element, drop): drop is True when the children of the element
+      # are dropped as soon as they are parsed (sections that are not kept,
+      # components of other devices), 'names' for a device that is not
+      # requested, whose processor tags are kept for its device names only
+      _root = None
+      _devices = []
+      stack = []
+      with self._openPdsc() as fo:
+        for event, elem in ET.iterparse(fo, events=('start', 'end')):
+          if event == 'start':
+            if _root is None:
+              _root = elem
+              stack.append((elem, False))
+              continue
+            parent, pdrop = stack[-1]
+            if pdrop is True or pdrop == 'names':
+              drop = True
+            elif parent is _root:
+              drop = elem.tag not in keptSections
+            elif elem.tag == 'device' and parent.tag == 'family':
+              drop = 'names' if elem.attrib.get('Dname') not in wantedDevices else False
+            elif elem.tag == 'component' and parent.tag == 'components':
+              drop = elem.attrib.get('condition') not in wantedConditions
+            else:
+              drop = False
+            stack.append((elem, drop))
+            continue
+
+          stack.pop()
+          if not stack:
+            continue
+          parent, pdrop = stack[-1]
+
+          if pdrop is True or (pdrop == 'names' and elem.tag != 'processor'):
+            parent.remove(elem)
+
+          elif elem.tag == 'device' and parent.tag == 'family':
+            _devices.extend(deviceNames(elem))
+            if elem.attrib.get('Dname') not in wantedDevices:
+              parent.remove(elem)
+
+          elif elem.tag == 'component' and parent.tag == 'components':
+            if elem.attrib.get('condition') not in wantedConditions:
+              parent.remove(elem)
+
+          elif parent is _root and elem.tag not in keptSections:
+            parent.remove(elem)
+
+      self._log('streamed %d devices, kept %s' %(len(_devices), sorted(wantedDevices)))
+      return (_root, _devices)
+
+    except pdscerror:
+      raise
+
+    except Exception as inst:
+      self._err("parseStreaming: %s:%s" %(type(inst), inst))
+
+  # worker function to build the device and processor lookup tables
+  def _buildIndexes(self):
+    try:
+      # Dname -> Device
+      self._deviceIndex = {}
+      # device name ("Dname" or "Dname:Pname") -> Processor
+      self._processorIndex = {}
+
+      PT.count('xpath.lookups')
+      for familyTag in self._root.findall('devices/family'):
+        PT.count('xpath.lookups')
+        for devTag in familyTag.findall('device'):
+          devname = devTag.attrib.get('Dname')
+          PT.count('xpath.lookups', 4)
+
+          compileTags = self._indexByPname(devTag.findall('compile'))
+          debugTags = self._indexByPname(devTag.findall('debug'))
+          processors = []
+          for p in devTag.findall('processor'):
+            pname = p.attrib.get('Pname', '')
+            processor = PM.Processor(devname, pname, p.attrib,
+                                     compileTags.get(pname, compileTags.get('')),
+                                     debugTags.get(pname, debugTags.get('')))
+            self._processorIndex[processor.fullname] = processor
+            processors.append(processor)
+
+          envs = {}
+          for env in devTag.findall('environment'):
+            envname = env.attrib.get('name')
+            if envname not in envs:
+              envs[envname] = PM.Environment(envname, self._getProjects(env))
+
+          self._deviceIndex[devname] = PM.Device(devname, familyTag.attrib.get('Dfamily'),
+                                                 familyTag.attrib.get('Dvendor'),
+                                                 tuple(processors), envs)
+
+    except pdscerror:
+      raise
+
+    except Exception as inst:
+      self._err("buildIndexes: %s:%s" %(type(inst), inst))
+
+  # projects of a supported environment extension
+  def _getProjects(self, env):
+    _projects = []
+    lextn = env.attrib.get('name')
+    if lextn not in self._supportedExtensions:
+      return tuple(_projects)
+
+    namespace = {'at':self._supportedExtensions[lextn]}
+    PT.count('xpath.lookups')
+    for proj in env.findall('at:extension/at:project', namespace):
+      PT.count('xpath.lookups')
+      components = []
+      for prcomp in proj.findall('at:component', namespace):
+        components.append((PM.intern(prcomp.attrib.get('Cvendor')), PM.intern(prcomp.attrib.get('Cclass')),
+                           PM.intern(prcomp.attrib.get('Cgroup'))))
+      _projects.append(PM.Project(proj.attrib.get('name') or '', proj.attrib.get('Pname', ''),
+                                  tuple(components)))
+    return tuple(_projects)
+
+  # worker function to index components by (Cvendor, Cclass, Cgroup, condition)
+  def _getComponents(self):
+    try:
+      _components = {}
+      PT.count('xpath.lookups')
+      for component in self._root.findall('components/component'):
+        lcomponent = PM.Component(component.attrib.get('Cvendor'), component.attrib.get('Cclass'),
+                                  component.attrib.get('Cgroup'), component.attrib.get('condition'))
+        key = (lcomponent.vendor, lcomponent.cclass, lcomponent.group, lcomponent.condition)
+        if key in _components:
+          continue
+        lcomponent.files = self._classifyFiles(component)
+        _components[key] = lcomponent
+
+      return _components
+
+    except pdscerror:
+      raise
+
+    except Exception as inst:
+      self._err("getComponents: %s:%s" %(type(inst), inst))
+
+  # classify component files into PackFile entries
+  def _classifyFiles(self, component):
+    _files = []
+    PT.count('xpath.lookups')
+    for f in component.findall('files/file'):
+      condition = (f.attrib.get('condition') or '').lower()
+      category = (f.attrib.get('category') or '').lower()
+      name = f.attrib.get('name') or ''
+      name_abspath = self._packdir + '/' + name
+      entry = None
+
+      if condition == 'c' and category == 'include':
+        entry = ('include', 'dir', None)
+
+      elif condition == 'c' and category == 'header':
+        entry = ('header', 'file', None)
+
+      elif condition == 'c exe' and name.rstrip().endswith('main.c'):
+        entry = ('template', 'file', ('c', 'exe'))
+
+      elif condition == 'c exe' and name.rstrip().endswith('main.cpp'):
+        entry = ('template', 'file', ('cpp', 'exe'))
+
+      elif condition == 'c lib' and name.rstrip().endswith('library.c'):
+        entry = ('template', 'file', ('c', 'lib'))
+
+      elif condition == 'c lib' and name.rstrip().endswith('library.cpp'):
+        entry = ('template', 'file', ('cpp', 'lib'))
+
+      elif condition == 'gcc exe' and category == 'linkerscript':
+        entry = ('linkerscript', 'file', None)
+
+      elif condition == 'gcc exe' and category == 'source' and ('system_' in name):
+        entry = ('system', 'file', None)
+
+      elif condition == 'gcc exe' and category == 'source' and ('startup_' in name):
+        entry = ('startup', 'file', None)
+
+      # dual core devices uses nested linker scripts that is listed in other category
+      elif condition == 'gcc exe' and category == 'other':
+        entry = ('other', 'file', None)
+
+      if entry is not None:
+        _files.append(PM.PackFile(entry[0], entry[1], entry[2], name_abspath, packfs.normPackPath(name)))
+
+    return tuple(_files)
+
+  # map Pname of the given tags to the attributes of the first tag carrying it
+  # ('' for untagged)
+  def _indexByPname(self, tags):
+    _tags = {}
+    for tag in tags:
+      _tags.setdefault(tag.attrib.get('Pname', ''), tag.attrib)
+    if tags:
+      _tags.setdefault('', tags[0].attrib)
+    return _tags
+
+  # get Processor of the given device, None if device is not known
+  def _getProcessorRecord(self, ldevicename):
+    record = self._processorIndex.get(ldevicename)
+    if record is None and self._streamed and ldevicename in self._devices:
+      self._err('Device "%s" was not requested when streaming %s' %(ldevicename, self._pdscfile), devicenotfound)
+    return record
+
   def _splitDeviceName(self, ldevicename):
     justdevicename = ldevicename
     pname = ''
@@ -128,80 +668,107 @@ class pdscparser(object):
     return {'device':justdevicename,'pname':pname}
      
   def getEnvironments(self, devicename):
-    try:
-      if devicename not in self.getDevices():
-        self._err('Device %s not found' %(devicename))
+    return self._memoized('getEnvironments', (devicename,), self._getEnvironments)
 
-      device_split = self._splitDeviceName(devicename)
-      deviceTag = self._root.find('devices/family/device[@Dname="%s"]' %(device_split['device']))
+  def _getEnvironments(self, devicename):
+    try:
+      record = self._getProcessorRecord(devicename)
+      if record is None:
+        self._err('Device %s not found' %(devicename), devicenotfound)
 
-      envs = deviceTag.findall('environment')
-      _environments = []
-      for env in envs:
-        _environments.append(env.attrib.get('name'))
+      return list(self._deviceIndex[record.dname].environments)
 
-      return _environments
+    except pdscerror:
+      raise
 
     except Exception as inst:
       self._err("getEnvironments: %s:%s" %(type(inst), inst))
 
   def _getDeviceTag(self, ldevicename):
     try:
-      if ldevicename not in self.getDevices():
-        self._err('Device "%s" not found' %(ldevicename))
-      device_split = self._splitDeviceName(ldevicename)
-      self._log('Device: %s Pname: %s' %(device_split['device'], device_split['pname']))
+      PT.count('device.lookups')
+      record = self._getProcessorRecord(ldevicename)
+      if record is None:
+        self._err('Device "%s" not found' %(ldevicename), devicenotfound)
+      self._log('Device: %s Pname: %s' %(record.dname, record.pname))
+
+      ldeviceRecord = self._deviceIndex.get(record.dname)
+      assert(ldeviceRecord is not None)
+      return ldeviceRecord
 
-      ldeviceTag = self._root.find('devices/family/device[@Dname="%s"]' %(device_split['device']))
-      assert(ldeviceTag is not None)
-      return ldeviceTag
+    except pdscerror:
+      raise
 
     except Exception as inst:
       self._err("getDeviceTag: %s:%s" %(type(inst), inst))
 
   def getDeviceSpecifics(self, ldevicename):
+    return self._memoized('getDeviceSpecifics', (ldevicename,), self._getDeviceSpecifics)
+
+  def _getDeviceSpecifics(self, ldevicename):
     try:
-      deviceTag = _getDeviceTag(ldevicename)
-      device_split = self._splitDeviceName(ldevicename)
-      just_device_name = device_split['device']
-      pname = device_split['pname']
-      self._log('Device: %s Pname: %s' %(just_device_name, pname))
+      self._getDeviceTag(ldevicename)
+      record = self._getProcessorRecord(ldevicename)
       device_specifics = {}
-      if pname != '':
-        compileTags = deviceTag.findall('compile[@Pname="%s"]' %(pname))
-        debugTags = deviceTag.findall('debug[@Pname="%s"]' %(pname))
-      else:
-        compileTags = deviceTag.findall('compile')
-        debugTags = deviceTag.findall('debug')
-
-      if compileTags is not None:
-        for compileTag in compileTags:
-          device_specifics['header'] = compileTag.attrib.get('header')
-          device_specifics['define'] = compileTag.attrib.get('define')
+      if record.header is not None or record.define is not None:
+        device_specifics['header'] = record.header
+        device_specifics['define'] = record.define
 
-      if debugTags is not None:
-        for debugTag in debugTags:
-          device_specifics['svd'] = debugTag.attrib.get('svd')
+      if record.svd is not None:
+        device_specifics['svd'] = record.svd
             
       return device_specifics
 
+    except pdscerror:
+      raise
+
     except Exception as inst:
       self._err("getDeviceSpecifics: %s:%s" %(type(inst), inst))
 
-  def _getEnvExtension(self, devTag, lextn):
+  def _getEnvExtension(self, ldevicename, lextn):
     try:
-      env = devTag.find('environment[@name="%s"]' %(lextn))
+      env = self._deviceIndex[ldevicename].environments.get(lextn)
       if env is None:
-        self._err('Environment extension "%s" is not found.' %(lextn))
-      return env
+        self._err('Environment extension "%s" is not found.' %(lextn), extensionnotfound)
+      return env.projects
+
+    except pdscerror:
+      raise
 
     except Exception as inst:
       self._err("getEnvExtension: %s:%s" %(type(inst), inst))
 
   def getGCCProjectDependencies(self, devicename, lang, exe, eextn):
+    dependencies = self._memoized('getGCCProjectDependencies', (devicename, lang, exe, eextn),
+                                  self._getGCCProjectDependencies)
+    self._extractDependencies(dependencies)
+    return dependencies
+
+  # extract the files of resolved dependencies from a .pack archive; done on
+  # every query, outside of the memoized results, so deleted files come back
+  def _extractDependencies(self, dependencies):
+    if self._archive is None or not dependencies:
+      return
+    try:
+      snapshot = self._getSnapshot()
+      for field, value in dependencies.items():
+        if field not in self._fileDescriptions:
+          continue
+        for path in (value if isinstance(value, list) else [value]):
+          relpath = packfs.normPackPath(os.path.relpath(path, self._packdir))
+          if relpath is not None:
+            snapshot.extract(relpath)
+
+    except Exception as inst:
+      self._err("extract: %s:%s" %(type(inst), inst))
+
+  # view of one lang / exe combination of the resolved device (see
+  # _resolveDevice)
+  def _getGCCProjectDependencies(self, devicename, lang, exe, eextn):
     try:
       self._log('Find GCC project dependencies')
-      deviceTag = self._getDeviceTag(devicename)
+      with PT.span('query.device', device=devicename):
+        self._getDeviceTag(devicename)
       lang = lang.lower()
       exe = exe.lower()
       if exe not in ('exe', 'lib'):
@@ -210,121 +777,219 @@ class pdscparser(object):
 
       self._log('device: %s lang: %s exe: %s' %(devicename, lang, exe))
 
-      if eextn in self._supportedExtensions:
-        namespace = {'at':self._supportedExtensions[eextn]}
-      else:
+      if eextn not in self._supportedExtensions:
         self._warn('Extension "%s" is not supported by the parser' %(eextn))
         return None
 
-      assert namespace != ''
-      envextn = self._getEnvExtension(deviceTag, eextn)
-
-      device_split = self._splitDeviceName(devicename)
-      just_device_name = device_split['device']
-      pname = device_split['pname']
-      if pname == '':
-        projs = envextn.findall('at:extension/at:project', namespace)
-      else:
-        projs = envextn.findall('at:extension/at:project[@Pname="%s"]' %(pname), namespace)
-      if projs is None:
-        self._warn('Project not found for device %s' %(devicename))
-        return None
-      langstr = ' '+lang+' '
-      found = False
-      for proj in projs:
-        if langstr not in proj.attrib.get('name').lower():
-          continue
-        found = True
-        break
-
-      if found == False:
+      dependencies = self._getResolved(devicename, eextn, lang)[(lang, exe)]
+      if dependencies is None:
         self._warn('Could not find \'%s\' project in pdsc file.' %(lang))
         return None
+      if isinstance(dependencies, pdscerror):
+        self._err(str(dependencies), type(dependencies))
+      return dependencies
 
-      dependencies = {}
+    except pdscerror:
+      raise
 
-      dependencies['mode'] = 'thumb'
-      dependencies['other'] = []
+    except Exception as inst:
+      self._err("getGCCProjectDependencies: %s:%s" %(type(inst), inst))
 
-      if pname == '':
-        dependencies['define'] = deviceTag.find('compile').attrib.get('define')
-        dependencies['cpu'] = deviceTag.find('processor').attrib.get('Dcore').replace('+', 'plus')
-      else:
-        dependencies['define'] = deviceTag.find('compile[@Pname="%s"]' %(pname)).attrib.get('define')
-        dependencies['cpu'] = deviceTag.find('processor[@Pname="%s"]' %(pname)).attrib.get('Dcore').replace('+', 'plus')
+  # dependencies of every lang x exe combination of the given devices (all
+  # devices of the pack by default), each device's components are walked
+  # once: {device: {lang: {exe: dependencies}}}. combinations without a
+  # project or with missing files are None and reported as warnings
+  def getAllGCCProjectDependencies(self, devicenames=None, eextn='atmel',
+                                   langs=('c', 'cpp'), exes=('exe', 'lib')):
+    try:
+      if eextn not in self._supportedExtensions:
+        self._warn('Extension "%s" is not supported by the parser' %(eextn))
+        return None
+      with self._lock:
+        self._checkResults()
+      if devicenames is None:
+        devicenames = list(self._processorIndex)
+      langs = [lang.lower() for lang in langs]
+      exes = [exe.lower() for exe in exes]
+
+      _all = {}
+      for devicename in devicenames:
+        _all[devicename] = {}
+        try:
+          resolved = self._getResolved(devicename, eextn, *langs)
+        except pdscerror as inst:
+          self._warn(str(inst))
+          resolved = {}
+        for lang in langs:
+          _all[devicename][lang] = {}
+          for exe in exes:
+            dependencies = resolved.get((lang, exe))
+            if isinstance(dependencies, pdscerror):
+              self._warn(str(dependencies))
+              dependencies = None
+            self._extractDependencies(dependencies)
+            _all[devicename][lang][exe] = copy.deepcopy(dependencies)
+      return _all
+
+    except pdscerror:
+      raise
 
-      prcompTag = proj.findall('at:component', namespace)
-      for prcomp in prcompTag:
-        files_dict = {}
-        component = self._root.find('components/component[@Cvendor="%s"][@Cclass="%s"][@Cgroup="%s"][@condition="%s"]' 
-                   %(prcomp.attrib.get('Cvendor'), prcomp.attrib.get('Cclass'), prcomp.attrib.get('Cgroup'), devicename))
+    except Exception as inst:
+      self._err("getAllGCCProjectDependencies: %s:%s" %(type(inst), inst))
+
+  # resolved device (see _resolveDevice) covering at least the given langs,
+  # kept in a table of their own, so they don't evict the query results
+  def _getResolved(self, devicename, eextn, *langs):
+    key = (devicename, eextn)
+    with self._lock:
+      found, resolved = self._resolved.get(key)
+      if not found:
+        resolved = {}
+      missing = tuple(lang for lang in langs if (lang, 'exe') not in resolved)
+      if missing:
+        # the cached dict may be read by other threads, extend a new one
+        resolved = dict(resolved)
+        resolved.update(self._resolveDevice(devicename, eextn, missing))
+      if not found or missing:
+        self._resolved.put(key, resolved)
+      return resolved
+
+  # dependencies of a device for every combination of langs and exes in one
+  # pass over its project components: {(lang, exe): dependencies}; None if
+  # there is no project for the language, the packfilenotfound error if a
+  # file of the combination is missing
+  def _resolveDevice(self, devicename, eextn, langs=('c', 'cpp'), exes=('exe', 'lib')):
+    with PT.span('query.device', device=devicename):
+      record = self._getProcessorRecord(devicename)
+      if record is None:
+        self._err('Device "%s" not found' %(devicename), devicenotfound)
+      projs = self._getEnvExtension(record.dname, eextn)
+    if record.pname != '':
+      projs = [proj for proj in projs if proj.pname == record.pname]
+
+    # existence checks are answered from a snapshot of the pack directory
+    # (or the index of the archive, see _extractDependencies)
+    with PT.span('fs.snapshot'):
+      snapshot = self._getSnapshot()
+
+    resolved = {}
+    # project -> [(PackFile, error message or None)]
+    walked = {}
+    for lang in langs:
+      langstr = ' '+lang+' '
+      proj = None
+      for p in projs:
+        if langstr in p.name.lower():
+          proj = p
+          break
+
+      if proj is None:
+        for exe in exes:
+          resolved[(lang, exe)] = None
+        continue
+
+      if id(proj) not in walked:
+        walked[id(proj)] = self._checkProjectFiles(devicename, proj, snapshot)
+
+      for exe in exes:
+        dependencies = {}
+        dependencies['mode'] = 'thumb'
+        dependencies['other'] = []
+        dependencies['define'] = record.define
+        dependencies['cpu'] = record.core.replace('+', 'plus')
+
+        for (f, error) in walked[id(proj)]:
+          if f.variant is not None and f.variant != (lang, exe):
+            continue
+          if error is not None:
+            dependencies = packfilenotfound(error)
+            break
+
+          if f.field == 'other':
+            dependencies['other'].append(f.abspath)
+          else:
+            dependencies[f.field] = f.abspath
 
-        if component is None:
-          continue
+        resolved[(lang, exe)] = dependencies
 
-        filesTag = component.findall('files/file')
-        for f in filesTag:
-          condition = f.attrib.get('condition').lower()
-          category = f.attrib.get('category').lower()
-          name = f.attrib.get('name')
-          name_abspath = self._packdir + '/' + name
-          #print ('%s:%s:%s' %(condition, category, name))
-
-          if condition == 'c' and category == 'include':
-            if False == os.path.isdir(name_abspath):
-              self._err('Could not find include directory "%s"' %(name_abspath))
-            dependencies['include'] = name_abspath
-
-          elif condition == 'c' and category == 'header':
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find header file "%s"' %(name_abspath))
-            dependencies['header'] = name_abspath
-
-          elif condition == 'c exe' and lang == 'c' and exe == 'exe' and name.rstrip().endswith('main.c'):
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find template file "%s"' %(name_abspath))
-            dependencies['template'] = name_abspath
-
-          elif condition == 'c exe' and lang == 'cpp' and exe == 'exe' and name.rstrip().endswith('main.cpp'):
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find template file "%s"' %(name_abspath))
-            dependencies['template'] = name_abspath
-
-          elif condition == 'c lib' and lang == 'c' and exe == 'lib' and name.rstrip().endswith('library.c'):
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find template file "%s"' %(name_abspath))
-            dependencies['template'] = name_abspath
-
-          elif condition == 'c lib' and lang == 'cpp' and exe == 'lib' and name.rstrip().endswith('library.cpp'):
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find template file "%s"' %(name_abspath))
-            dependencies['template'] = name_abspath
-
-          elif condition == 'gcc exe' and category == 'linkerscript':
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find linker script "%s"' %(name_abspath))
-            dependencies['linkerscript'] = name_abspath
-
-          elif condition == 'gcc exe' and category == 'source' and ('system_' in name):
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find system file "%s"' %(name_abspath))
-            dependencies['system'] = name_abspath
-
-          elif condition == 'gcc exe' and category == 'source' and ('startup_' in name):
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find startup file "%s"' %(name_abspath))
-            dependencies['startup'] = name_abspath
-
-          # dual core devices uses nested linker scripts that is listed in other category
-          elif condition == 'gcc exe' and category == 'other':
-            if False == os.path.isfile(name_abspath):
-              self._err('Could not find other config file "%s"' %(name_abspath))
-            dependencies['other'].append(name_abspath)
+    return resolved
 
-      return dependencies
+  # check every file of the components of a device project once:
+  # [(PackFile, error message if it is missing)]
+  def _checkProjectFiles(self, devicename, proj, snapshot):
+    checked = []
+    with PT.span('query.components', device=devicename):
+      for (cvendor, cclass, cgroup) in proj.components:
+        component = self._componentIndex.get((cvendor, cclass, cgroup, devicename))
+        if component is None:
+          continue
 
-    except Exception as inst:
-      self._err("getGCCProjectDependencies: %s:%s" %(type(inst), inst))
+        for f in component.files:
+          PT.count('fs.checks')
+          if f.relpath is None:
+            PT.count('fs.stat')
+            found = os.path.isdir(f.abspath) if f.kind == 'dir' else os.path.isfile(f.abspath)
+          elif f.kind == 'dir':
+            found = snapshot.isdir(f.relpath)
+          else:
+            found = snapshot.isfile(f.relpath)
+          error = None
+          if False == found:
+            error = 'Could not find %s "%s"' %(self._fileDescriptions[f.field], f.abspath)
+          checked.append((f, error))
+    return checked
+
+  # get hit/miss counters of the memoized query results (and under
+  # 'resolved', of the resolved devices)
+  def getResultCacheStats(self):
+    stats = self._results.stats()
+    stats['resolved'] = self._resolved.stats()
+    return stats
+
+  # worker function to create the result caches; a resolved device serves
+  # every query of it, so that table holds one per device name
+  def _createResultCaches(self, resultcachesize):
+    if resultcachesize is None:
+      resultcachesize = max(256, 4 * len(self._devices))
+    self._results = resultcache(resultcachesize)
+    self._resolved = resultcache(len(self._devices) if resultcachesize > 0 else 0)
+
+  # memoized call of a query worker function; results are dropped when files
+  # of the pack directory change (the parsed model itself is not reloaded
+  # when the pdsc file changes, owners such as pdscserver create a new
+  # parser), callers get private copies
+  def _memoized(self, name, args, func):
+    with self._lock:
+      self._checkResults()
+      key = (name,) + args
+      found, result = self._results.get(key)
+      if not found:
+        result = func(*args)
+        self._results.put(key, result)
+    return copy.deepcopy(result)
+
+  # worker function to drop memoized results when the snapshot of the pack
+  # directory was rescanned
+  def _checkResults(self):
+    now = time.time()
+    if now - self._resultsChecked < packfs.snapshotCheckInterval:
+      return
+    self._resultsChecked = now
+    stamp = self._getSnapshot().generation
+    if stamp != self._resultsStamp:
+      self._results.clear()
+      self._resolved.clear()
+      self._resultsStamp = stamp
+
+  # locks don't pickle (spawned pool workers), a copy gets its own
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    del state['_lock']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.RLock()
 
   def _log(self, lmsg):
     if self.logmsg == False:
@@ -334,9 +999,8 @@ class pdscparser(object):
   def _msg(self, message):
     print (message)
 
-  def _err(self, emsg):
-    print ("Error: %s" %(emsg))
-    sys.exit(2)
+  def _err(self, emsg, errtype=None):
+    raise (errtype or pdscerror)(emsg)
 
   def _warn(self, wmsg):
     print ("Warning: %s" %(wmsg))
@@ -0,0 +1,319 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Resident pdsc query server: keeps parsed packs in memory and answers
+# queries over a local unix socket, one JSON request/response per line.
+#
+#   request:  {"op": "devices", "pdsc": "/path/to/pack.pdsc"}
+#             {"op": "environments", "pdsc": ..., "device": "ATSAMD20E14"}
+#             {"op": "specifics", "pdsc": ..., "device": "ATSAMD20E14"}
+#             {"op": "find", "pdsc": ..., "pattern": "ATSAME70*", "core": ...,
+#              "family": ..., "pname": ...}
+#             {"op": "dependencies", "pdsc": ..., "device": ..., "lang": "c",
+#              "exe": "exe", "extension": "atmel"}
+#             {"op": "alldependencies", "pdsc": ..., "devices": [...] or null,
+#              "extension": "atmel"}
+#   response: {"ok": true, "result": ...}
+#             {"ok": false, "error": "devicenotfound", "message": "..."}
+
+import argparse
+import errno
+import json
+import os
+import os.path
+import socket
+import signal
+import socketserver
+import sys
+import threading
+import pdscparser as PP
+
+# default location of the server socket
+def defaultSocketPath():
+  rundir = os.environ.get('XDG_RUNTIME_DIR') or PP.defaultCacheDir()
+  return os.path.join(rundir, 'pack-utils.sock')
+
+# error types that keep their identity across the socket
+errorTypes = {}
+for _errtype in (PP.pdscerror, PP.pdscfileerror, PP.unsupportedschema, PP.devicenotfound,
+                 PP.extensionnotfound, PP.packfilenotfound, PP.svderror):
+  errorTypes[_errtype.__name__] = _errtype
+
+# parsed packs kept warm by the server; a pack is reparsed when its pdsc
+# file changes (size or mtime)
+class parserpool(object):
+  def __init__(self, cachedir=None):
+    self._cachedir = cachedir
+    # guards the tables below, never held while parsing
+    self._lock = threading.Lock()
+    # pdsc path -> (size, mtime, pdscparser)
+    self._parsers = {}
+    # pdsc path -> lock serializing the (re)parse of that pack only
+    self._loadLocks = {}
+
+  def get(self, pdscfile):
+    pdscfile = os.path.abspath(pdscfile)
+    try:
+      st = os.stat(pdscfile)
+    except OSError:
+      raise PP.pdscfileerror(pdscfile + ' is not a valid file')
+
+    stamp = (st.st_size, st.st_mtime_ns)
+    with self._lock:
+      entry = self._parsers.get(pdscfile)
+      if entry is not None and entry[:2] == stamp:
+        return entry[2]
+      loadlock = self._loadLocks.setdefault(pdscfile, threading.Lock())
+
+    # queries of other packs go on while this one is parsed; a query of the
+    # same pack waits and takes the parser published by the first one
+    with loadlock:
+      with self._lock:
+        entry = self._parsers.get(pdscfile)
+      if entry is not None and entry[:2] == stamp:
+        return entry[2]
+      parser = PP.pdscparser(pdscfile, cachedir=self._cachedir)
+      with self._lock:
+        self._parsers[pdscfile] = stamp + (parser,)
+      return parser
+
+  # answer one decoded request
+  def query(self, request):
+    op = request.get('op')
+    if op == 'ping':
+      return True
+
+    parser = self.get(request['pdsc'])
+    if op == 'devices':
+      return parser.getDevices()
+    if op == 'releases':
+      return parser.getReleases()
+    if op == 'packinfo':
+      return parser.getPackInfo()
+    if op == 'packdir':
+      return parser.getPackDir()
+    if op == 'packfile':
+      return parser.getPackFile(request['name'])
+    if op == 'environments':
+      return parser.getEnvironments(request['device'])
+    if op == 'specifics':
+      return parser.getDeviceSpecifics(request['device'])
+    if op == 'find':
+      return parser.findDevices(request.get('pattern'), request.get('core'),
+                                request.get('family'), request.get('pname'))
+    if op == 'stats':
+      return parser.getResultCacheStats()
+    if op == 'dependencies':
+      return parser.getGCCProjectDependencies(request['device'], request.get('lang', 'c'),
+                                              request.get('exe', 'exe'),
+                                              request.get('extension', 'atmel'))
+    if op == 'alldependencies':
+      return parser.getAllGCCProjectDependencies(request.get('devices'),
+                                                 request.get('extension', 'atmel'))
+    raise PP.pdscerror('Unknown request "%s"' %(op))
+
+class _requesthandler(socketserver.StreamRequestHandler):
+  def handle(self):
+    for line in self.rfile:
+      try:
+        response = {'ok':True, 'result':self.server.parsers.query(json.loads(line))}
+      except PP.pdscerror as inst:
+        response = {'ok':False, 'error':type(inst).__name__, 'message':str(inst)}
+      except Exception as inst:
+        response = {'ok':False, 'error':'pdscerror', 'message':'%s:%s' %(type(inst), inst)}
+      self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+      self.wfile.flush()
+
+class pdscserver(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  daemon_threads = True
+
+  def __init__(self, socketpath=None, cachedir=None):
+    self.socketpath = socketpath or defaultSocketPath()
+    self.parsers = parserpool(cachedir)
+    if os.path.exists(self.socketpath):
+      self._removeStaleSocket()
+    socketdir = os.path.dirname(self.socketpath)
+    if socketdir and not os.path.isdir(socketdir):
+      os.makedirs(socketdir)
+    socketserver.UnixStreamServer.__init__(self, self.socketpath, _requesthandler)
+
+  # remove the socket of a server that is gone; a live server keeps it
+  def _removeStaleSocket(self):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(self.socketpath)
+    except OSError as inst:
+      if inst.errno != errno.ECONNREFUSED:
+        raise PP.pdscerror('Could not check socket %s: %s' %(self.socketpath, inst))
+      os.remove(self.socketpath)
+      return
+    finally:
+      sock.close()
+    raise PP.pdscerror('pdsc server already listening on %s' %(self.socketpath))
+
+  def server_close(self):
+    socketserver.UnixStreamServer.server_close(self)
+    if os.path.exists(self.socketpath):
+      os.remove(self.socketpath)
+
+# seconds a client waits for the server before giving up on a request
+clientTimeout = 300
+
+# client side connection to a running pdscserver. the connection belongs to
+# the process that opened it: a forked child (E.g. a multiprocessing worker)
+# opens its own, so requests of different processes never interleave
+class pdscclient(object):
+  def __init__(self, socketpath=None, timeout=None):
+    self._socketpath = socketpath or defaultSocketPath()
+    self._timeout = clientTimeout if timeout is None else timeout
+    self._sock = None
+    self._pid = None
+
+  def _connect(self):
+    if self._sock is not None and self._pid != os.getpid():
+      # inherited from the parent; closing our copy leaves the parent's open
+      self.close()
+    if self._sock is None:
+      self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self._sock.settimeout(self._timeout)
+      try:
+        self._sock.connect(self._socketpath)
+      except OSError as inst:
+        self._sock.close()
+        self._sock = None
+        raise PP.pdscerror('Could not connect to pdsc server at %s: %s' %(self._socketpath, inst))
+      self._rfile = self._sock.makefile('rb')
+      self._pid = os.getpid()
+
+  def close(self):
+    if self._sock is not None:
+      self._rfile.close()
+      self._sock.close()
+      self._sock = None
+      self._pid = None
+
+  def query(self, **request):
+    self._connect()
+    try:
+      self._sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+      line = self._rfile.readline()
+    except OSError as inst:
+      # a late response would answer the next request, so drop the connection
+      self.close()
+      raise PP.pdscerror('pdsc server at %s: %s' %(self._socketpath, inst))
+    if not line:
+      self.close()
+      raise PP.pdscerror('pdsc server at %s closed the connection' %(self._socketpath))
+    response = json.loads(line)
+    if not response['ok']:
+      raise errorTypes.get(response['error'], PP.pdscerror)(response['message'])
+    return response['result']
+
+  # the connection is per process; a pickled client reconnects lazily
+  def __getstate__(self):
+    return {'_socketpath':self._socketpath, '_timeout':self._timeout, '_sock':None, '_pid':None}
+
+# stands in for a pdscparser of one pdsc file, answered by a pdscserver
+class remoteparser(object):
+  def __init__(self, pdscfile, socketpath=None):
+    self.logmsg = False
+    self._pdscfile = os.path.abspath(pdscfile)
+    self._client = pdscclient(socketpath)
+
+  def getReleases(self):
+    return self._client.query(op='releases', pdsc=self._pdscfile)
+
+  def getPackInfo(self):
+    return self._client.query(op='packinfo', pdsc=self._pdscfile)
+
+  def getPackDir(self):
+    return self._client.query(op='packdir', pdsc=self._pdscfile)
+
+  def getPackFile(self, name):
+    return self._client.query(op='packfile', pdsc=self._pdscfile, name=name)
+
+  def getDevices(self):
+    return self._client.query(op='devices', pdsc=self._pdscfile)
+
+  def getEnvironments(self, devicename):
+    return self._client.query(op='environments', pdsc=self._pdscfile, device=devicename)
+
+  def getDeviceSpecifics(self, devicename):
+    return self._client.query(op='specifics', pdsc=self._pdscfile, device=devicename)
+
+  def findDevices(self, pattern=None, core=None, family=None, pname=None):
+    return self._client.query(op='find', pdsc=self._pdscfile, pattern=pattern, core=core,
+                              family=family, pname=pname)
+
+  def getResultCacheStats(self):
+    return self._client.query(op='stats', pdsc=self._pdscfile)
+
+  def getGCCProjectDependencies(self, devicename, lang, exe, eextn):
+    return self._client.query(op='dependencies', pdsc=self._pdscfile, device=devicename,
+                              lang=lang, exe=exe, extension=eextn)
+
+  def getAllGCCProjectDependencies(self, devicenames=None, eextn='atmel'):
+    return self._client.query(op='alldependencies', pdsc=self._pdscfile, devices=devicenames,
+                              extension=eextn)
+
+def main():
+  aparser = argparse.ArgumentParser(description='Resident server answering pdsc queries over a unix socket.')
+  aparser.add_argument('--socket', metavar='<socket path>', help="Unix socket path (default: %s)" %(defaultSocketPath()))
+  aparser.add_argument('--cache', metavar='<cache dir>', nargs='?', const=PP.defaultCacheDir(), help="Cache parsed PDSC files (default directory: %s)" %(PP.defaultCacheDir()))
+  aparser.add_argument('-f', metavar='<pdsc file>', nargs='*', default=[], help="PDSC file(s) to load at startup")
+  pargs = aparser.parse_args()
+
+  try:
+    server = pdscserver(pargs.socket, pargs.cache)
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
+  # leave through the finally clause below, removing the socket
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    for pdscfile in pargs.f:
+      server.parsers.get(pdscfile)
+    print ('pdsc server listening on %s' %(server.socketpath))
+    sys.stdout.flush()
+    server.serve_forever()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,186 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Instrumentation of the hot paths: timed spans and counters, reported as
+# JSON or as a Chrome trace (chrome://tracing, Perfetto). Tracing is off by
+# default and then costs one flag test per span or counter.
+#
+#   import pdsctrace as PT
+#   PT.enable()
+#   with PT.span('parse.xml', file=pdscfile):
+#     ...
+#   PT.count('fs.stat')
+#   PT.writeReport('profile.json', 'chrome')
+#
+# Hooks registered with addHook are called for every finished span and
+# counter update as hook(kind, name, value) with kind 'span' (value: seconds)
+# or 'count' (value: increment), also while reports are not collected.
+
+import collections
+import json
+import os
+import threading
+import time
+
+enabled = False
+_collecting = False
+_hooks = []
+_lock = threading.Lock()
+_spans = []
+_counters = collections.Counter()
+_epoch = time.perf_counter()
+
+# switch span and counter collection on or off
+def enable(flag=True):
+  global _collecting
+  _collecting = bool(flag)
+  _update()
+
+def addHook(hook):
+  _hooks.append(hook)
+  _update()
+
+def removeHook(hook):
+  if hook in _hooks:
+    _hooks.remove(hook)
+  _update()
+
+def _update():
+  global enabled
+  enabled = _collecting or bool(_hooks)
+
+# drop collected spans and counters
+def reset():
+  global _spans
+  with _lock:
+    _spans = []
+    _counters.clear()
+
+def count(name, n=1):
+  if not enabled:
+    return
+  if _collecting:
+    with _lock:
+      _counters[name] += n
+  for hook in _hooks:
+    hook('count', name, n)
+
+def getCounters():
+  with _lock:
+    return dict(_counters)
+
+# raw spans: (name, start, duration, pid, tid, args), times in seconds
+def getSpans():
+  with _lock:
+    return list(_spans)
+
+# spans and counters collected in this process, cleared afterwards; used to
+# ship the trace of a worker process back to the parent (see merge)
+def collect():
+  with _lock:
+    global _spans
+    trace = {'spans':_spans, 'counters':dict(_counters)}
+    _spans = []
+    _counters.clear()
+  return trace
+
+def merge(trace):
+  with _lock:
+    _spans.extend(trace['spans'])
+    _counters.update(trace['counters'])
+
+class _nullspan:
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exctype, exc, tb):
+    return False
+
+_null = _nullspan()
+
+class _span:
+  __slots__ = ('_name', '_args', '_start')
+
+  def __init__(self, name, args):
+    self._name = name
+    self._args = args
+
+  def __enter__(self):
+    self._start = time.perf_counter()
+    return self
+
+  def __exit__(self, exctype, exc, tb):
+    duration = time.perf_counter() - self._start
+    if _collecting:
+      with _lock:
+        _spans.append((self._name, self._start - _epoch, duration, os.getpid(),
+                       threading.get_ident(), self._args))
+    for hook in _hooks:
+      hook('span', self._name, duration)
+    return False
+
+# context manager timing the enclosed block; args are stored with the span
+def span(name, **args):
+  if not enabled:
+    return _null
+  return _span(name, args)
+
+# per span name totals: calls, total and max seconds
+def summary():
+  totals = {}
+  for (name, start, duration, pid, tid, args) in getSpans():
+    entry = totals.setdefault(name, {'calls':0, 'total':0.0, 'max':0.0})
+    entry['calls'] += 1
+    entry['total'] += duration
+    entry['max'] = max(entry['max'], duration)
+  return totals
+
+# report in 'json' (span summary and counters) or 'chrome' (trace events)
+def report(fmt='json'):
+  if fmt == 'chrome':
+    events = []
+    for (name, start, duration, pid, tid, args) in getSpans():
+      events.append({'name':name, 'cat':name.split('.')[0], 'ph':'X', 'ts':start * 1e6,
+                     'dur':duration * 1e6, 'pid':pid, 'tid':tid, 'args':args})
+    counters = getCounters()
+    if counters:
+      events.append({'name':'counters', 'ph':'C', 'ts':(time.perf_counter() - _epoch) * 1e6,
+                     'pid':os.getpid(), 'tid':0, 'args':counters})
+    return {'traceEvents':events, 'displayTimeUnit':'ms'}
+  return {'spans':summary(), 'counters':getCounters()}
+
+def writeReport(path, fmt='json'):
+  with open(path, 'w') as fo:
+    json.dump(report(fmt), fo, indent=1, sort_keys=True)
+    fo.write('\n')
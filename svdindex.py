@@ -0,0 +1,369 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Indexed access to the SVD file of a device (see getDeviceSpecifics). The
+# SVD file is streamed once, one peripheral at a time, into a compact index
+# of peripherals -> registers -> fields with their addresses; the index is
+# cached next to the parsed pdsc snapshots and answers lookups without
+# touching the XML again.
+#
+#   svd = svdindex.svdForDevice(parser, 'ATSAMD20E14', cachedir)
+#   svd.getRegister('PORT', 'DIR0')['address']
+
+import argparse
+import hashlib
+import os
+import os.path
+import pickle
+import re
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+import pdscparser as PP
+import pdsctrace as PT
+
+# bump whenever the layout of the cached index changes
+svdIndexFormatVersion = 2
+
+# SVD scaledNonNegativeInteger: decimal, 0x hex, #binary, k/M/G suffix
+def svdInt(text, default=None):
+  if text is None:
+    return default
+  text = text.strip().lower()
+  scale = 1
+  if text and text[-1] in 'kmg':
+    scale = {'k':1 << 10, 'm':1 << 20, 'g':1 << 30}[text[-1]]
+    text = text[:-1]
+  if text.startswith('#'):
+    return int(text[1:].replace('x', '0'), 2) * scale
+  return int(text, 0) * scale
+
+# names and address increments of a dim list ("%s" in the name)
+def _dimNames(elem, name):
+  dim = svdInt(elem.findtext('dim'))
+  if dim is None or '%s' not in name:
+    return [(name, 0)]
+  increment = svdInt(elem.findtext('dimIncrement'), 0)
+  indexes = elem.findtext('dimIndex')
+  if indexes is None:
+    indexes = [str(i) for i in range(dim)]
+  elif '-' in indexes and ',' not in indexes:
+    first, last = indexes.split('-')
+    if first.isdigit():
+      indexes = [str(i) for i in range(int(first), int(last) + 1)]
+    else:
+      indexes = [chr(c) for c in range(ord(first), ord(last) + 1)]
+  else:
+    indexes = [i.strip() for i in indexes.split(',')]
+  return [(name.replace('%s', index), n * increment)
+          for n, index in enumerate(indexes[:dim])]
+
+# register properties (size, access, reset value) of a device, peripheral,
+# cluster or register tag, defaulting to the ones inherited from its parent
+def _registerProperties(elem, inherited):
+  return {'size':svdInt(elem.findtext('size'), inherited['size']),
+          'access':(elem.findtext('access') or '').strip() or inherited['access'],
+          'reset':svdInt(elem.findtext('resetValue'), inherited['reset'])}
+
+# bit offset and width of a field tag
+def _fieldBits(field):
+  offset = svdInt(field.findtext('bitOffset'))
+  if offset is not None:
+    return (offset, svdInt(field.findtext('bitWidth'), 1))
+  lsb = svdInt(field.findtext('lsb'))
+  if lsb is not None:
+    return (lsb, svdInt(field.findtext('msb')) - lsb + 1)
+  msb, lsb = field.findtext('bitRange').strip('[] ').split(':')
+  return (int(lsb), int(msb) - int(lsb) + 1)
+
+class svdindex(object):
+  # cachedir: optional directory holding the cached index
+  def __init__(self, svdfile, cachedir=None):
+    self.logmsg = False
+    try:
+      if False == os.path.isfile(svdfile):
+        self._err(svdfile + ' is not a valid file', PP.pdscfileerror)
+      self._svdfile = os.path.abspath(svdfile)
+      st = os.stat(self._svdfile)
+      self._key = (self._svdfile, st.st_size, st.st_mtime_ns)
+
+      self._cachefile = None
+      if cachedir is not None:
+        self._cachefile = os.path.join(os.path.abspath(cachedir), '%s-%s.svdindex'
+                          %(os.path.basename(self._svdfile),
+                            hashlib.sha1(self._svdfile.encode('utf-8')).hexdigest()[:12]))
+        if self._loadCache():
+          self._log('loaded svd index from %s' %(self._cachefile))
+          return
+
+      with PT.span('svd.parse', file=self._svdfile):
+        self._device, self._peripherals = self._parse()
+      if self._cachefile is not None:
+        self._saveCache()
+
+    except PP.pdscerror:
+      raise
+
+    except Exception as inst:
+      self._err("svd index: %s:%s" %(type(inst), inst), PP.svderror)
+
+  # worker function to stream the svd file into
+  # {peripheral: {'base', 'description', 'group', 'registers'}} where
+  # registers is {name: (offset, size, access, reset, {field: (offset, width)})}
+  def _parse(self):
+    device = None
+    # device level register properties, they come before the peripherals
+    properties = {'size':32, 'access':None, 'reset':None}
+    peripherals = {}
+    derived = {}
+    depth = 0
+    for event, elem in ET.iterparse(self._svdfile, events=('start', 'end')):
+      if event == 'start':
+        depth += 1
+        continue
+      depth -= 1
+
+      if elem.tag == 'name' and depth == 1:
+        device = (elem.text or '').strip()
+      elif elem.tag == 'size' and depth == 1:
+        properties['size'] = svdInt(elem.text, properties['size'])
+      elif elem.tag == 'access' and depth == 1:
+        properties['access'] = (elem.text or '').strip() or None
+      elif elem.tag == 'resetValue' and depth == 1:
+        properties['reset'] = svdInt(elem.text)
+      elif elem.tag == 'peripheral':
+        name = elem.findtext('name').strip()
+        registers = {}
+        regs = elem.find('registers')
+        if regs is not None:
+          self._collectRegisters(regs, 0, '', _registerProperties(elem, properties), registers)
+        peripherals[name] = {'base':svdInt(elem.findtext('baseAddress'), 0),
+                             'description':' '.join((elem.findtext('description') or '').split()),
+                             'group':elem.findtext('groupName'),
+                             'registers':registers}
+        if elem.attrib.get('derivedFrom'):
+          derived[name] = elem.attrib['derivedFrom']
+        elem.clear()
+
+    # derived peripherals share the registers of their base, which may be
+    # derived itself (chains are resolved base first, each peripheral once,
+    # which also ends cycles)
+    def resolve(name):
+      base = derived.pop(name, None)
+      if base is None or base not in peripherals:
+        return
+      resolve(base)
+      if not peripherals[name]['registers']:
+        peripherals[name]['registers'] = peripherals[base]['registers']
+      if not peripherals[name]['group']:
+        peripherals[name]['group'] = peripherals[base]['group']
+    while derived:
+      resolve(next(iter(derived)))
+    return (device, peripherals)
+
+  # worker function to collect the registers of a registers or cluster tag;
+  # properties are the register properties inherited from the parent
+  def _collectRegisters(self, parent, baseoffset, prefix, properties, registers):
+    for elem in parent:
+      if elem.tag not in ('register', 'cluster'):
+        continue
+      elemproperties = _registerProperties(elem, properties)
+      for name, increment in _dimNames(elem, elem.findtext('name').strip()):
+        offset = baseoffset + svdInt(elem.findtext('addressOffset'), 0) + increment
+        if elem.tag == 'cluster':
+          self._collectRegisters(elem, offset, prefix + name + '.', elemproperties, registers)
+          continue
+
+        fields = {}
+        for field in elem.findall('fields/field'):
+          fields[field.findtext('name').strip()] = _fieldBits(field)
+        registers[prefix + name] = (offset, elemproperties['size'], elemproperties['access'],
+                                    elemproperties['reset'], fields)
+
+  def _loadCache(self):
+    try:
+      with open(self._cachefile, 'rb') as fo:
+        version, key, index = pickle.load(fo)
+    except Exception:
+      return False
+    if version != svdIndexFormatVersion or key != self._key:
+      return False
+    self._device, self._peripherals = index
+    return True
+
+  # write the index to the cache; cache failures are not fatal
+  def _saveCache(self):
+    try:
+      cachedir = os.path.dirname(self._cachefile)
+      if not os.path.isdir(cachedir):
+        os.makedirs(cachedir)
+      fd, tmpname = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+      with os.fdopen(fd, 'wb') as fo:
+        pickle.dump((svdIndexFormatVersion, self._key, (self._device, self._peripherals)), fo,
+                    pickle.HIGHEST_PROTOCOL)
+      os.replace(tmpname, self._cachefile)
+    except Exception as inst:
+      self._warn('could not write svd index %s: %s' %(self._cachefile, inst))
+
+  def getDeviceName(self):
+    return self._device
+
+  def getPeripherals(self):
+    return sorted(self._peripherals)
+
+  def getPeripheral(self, peripheral):
+    p = self._getPeripheral(peripheral)
+    return {'name':peripheral, 'base':p['base'], 'description':p['description'],
+            'group':p['group']}
+
+  def getRegisters(self, peripheral):
+    registers = self._getPeripheral(peripheral)['registers']
+    return sorted(registers, key=lambda name: (registers[name][0], name))
+
+  # register with its absolute address; fields map to (bit offset, width)
+  def getRegister(self, peripheral, register):
+    p = self._getPeripheral(peripheral)
+    r = p['registers'].get(register)
+    if r is None:
+      self._err('Register "%s" not found in peripheral %s' %(register, peripheral), PP.svderror)
+    offset, size, access, reset, fields = r
+    return {'name':register, 'address':p['base'] + offset, 'offset':offset, 'size':size,
+            'access':access, 'reset':reset, 'fields':dict(fields)}
+
+  def getField(self, peripheral, register, field):
+    fields = self.getRegister(peripheral, register)['fields']
+    if field not in fields:
+      self._err('Field "%s" not found in register %s.%s' %(field, peripheral, register), PP.svderror)
+    offset, width = fields[field]
+    return {'name':field, 'offset':offset, 'width':width, 'mask':((1 << width) - 1) << offset}
+
+  def _getPeripheral(self, peripheral):
+    p = self._peripherals.get(peripheral)
+    if p is None:
+      self._err('Peripheral "%s" not found in %s' %(peripheral, self._svdfile), PP.svderror)
+    return p
+
+  # C header fragment: peripheral base addresses and register addresses
+  def headerFragment(self):
+    guard = '_%s_SVD_H_' %((self._device or 'DEVICE').upper().replace('-', '_'))
+    lines = ['/* Generated from %s */' %(os.path.basename(self._svdfile)),
+             '#ifndef %s' %(guard), '#define %s' %(guard), '']
+    for name in self.getPeripherals():
+      p = self._peripherals[name]
+      lines.append('#define %-40s 0x%08XUL' %(name + '_BASE', p['base']))
+      for register in self.getRegisters(name):
+        macro = '%s_%s_ADDR' %(name, re.sub(r'[^A-Za-z0-9_]', '', register.replace('.', '_')))
+        lines.append('#define %-40s 0x%08XUL' %(macro, p['base'] + p['registers'][register][0]))
+      lines.append('')
+    lines.append('#endif /* %s */' %(guard))
+    return '\n'.join(lines) + '\n'
+
+  # linker script fragment: one symbol per peripheral base address
+  def linkerFragment(self):
+    lines = ['/* Generated from %s */' %(os.path.basename(self._svdfile))]
+    for name in self.getPeripherals():
+      lines.append('PROVIDE(%s = 0x%08X);' %(name, self._peripherals[name]['base']))
+    return '\n'.join(lines) + '\n'
+
+  def _log(self, lmsg):
+    if self.logmsg == False:
+      return
+    print ('==> %s' %(lmsg))
+
+  def _err(self, emsg, errtype=None):
+    raise (errtype or PP.pdscerror)(emsg)
+
+  def _warn(self, wmsg):
+    print ("Warning: %s" %(wmsg))
+
+# index of the svd file of a device of a parsed pack
+def svdForDevice(parser, devicename, cachedir=None):
+  specifics = parser.getDeviceSpecifics(devicename)
+  if 'svd' not in specifics:
+    raise PP.svderror('Device "%s" has no svd file' %(devicename))
+  return svdindex(parser.getPackFile(specifics['svd']), cachedir)
+
+def main():
+  aparser = argparse.ArgumentParser(description='Look up peripherals, registers and fields of a device SVD file.')
+  aparser.add_argument('-f', metavar='<pdsc file>', required=True, help="PDSC file or .pack archive")
+  aparser.add_argument('-d', metavar='<devicename>', required=True, help="Device name")
+  aparser.add_argument('--cache', metavar='<cache dir>', nargs='?', const=PP.defaultCacheDir(), help="Cache the svd index (default directory: %s)" %(PP.defaultCacheDir()))
+  aparser.add_argument('--header', metavar='<file>', help="Write a C header fragment with peripheral and register addresses")
+  aparser.add_argument('--linker', metavar='<file>', help="Write a linker script fragment with peripheral symbols")
+  aparser.add_argument('lookup', nargs='?', metavar='PERIPHERAL[.REGISTER[.FIELD]]', help="Print a peripheral, register or field (default: list peripherals)")
+  pargs = aparser.parse_args()
+
+  svd = svdForDevice(PP.pdscparser(pargs.f, cachedir=pargs.cache), pargs.d, pargs.cache)
+  if pargs.header:
+    with open(pargs.header, 'w') as fo:
+      fo.write(svd.headerFragment())
+  if pargs.linker:
+    with open(pargs.linker, 'w') as fo:
+      fo.write(svd.linkerFragment())
+
+  if pargs.lookup is None:
+    for name in svd.getPeripherals():
+      print ('%-12s 0x%08X' %(name, svd.getPeripheral(name)['base']))
+    return
+
+  parts = pargs.lookup.split('.')
+  peripheral = parts[0]
+  if len(parts) == 1:
+    print ('%s 0x%08X' %(peripheral, svd.getPeripheral(peripheral)['base']))
+    for register in svd.getRegisters(peripheral):
+      print ('  %-24s 0x%08X' %(register, svd.getRegister(peripheral, register)['address']))
+    return
+
+  # register names of clusters contain dots themselves
+  registers = svd.getRegisters(peripheral)
+  register = '.'.join(parts[1:])
+  field = None
+  if register not in registers and '.'.join(parts[1:-1]) in registers:
+    register, field = '.'.join(parts[1:-1]), parts[-1]
+  if field is None:
+    r = svd.getRegister(peripheral, register)
+    print ('%s.%s 0x%08X size %d access %s' %(peripheral, register, r['address'], r['size'], r['access']))
+    for name, (offset, width) in sorted(r['fields'].items(), key=lambda f: f[1]):
+      print ('  %-24s [%d:%d]' %(name, offset + width - 1, offset))
+  else:
+    f = svd.getField(peripheral, register, field)
+    print ('%s.%s.%s [%d:%d] mask 0x%08X' %(peripheral, register, field, f['offset'] + f['width'] - 1,
+           f['offset'], f['mask']))
+
+if __name__ == '__main__':
+  try:
+    main()
+  except PP.pdscerror as inst:
+    print ("Error: %s" %(inst))
+    sys.exit(2)
@@ -0,0 +1,105 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Fixtures shared by the tests: a synthetic pack (see pdscgen.py), a CMSIS
+# pack directory and an output directory in a temporary directory
+
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+topdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, topdir)
+
+import packfs
+import pdscgen
+
+genmake = os.path.join(topdir, 'genmake-arm.py')
+
+# run fn in threads, return the exceptions they raised; threads switch as
+# often as possible to expose races
+def runThreads(fn, count=8):
+  errors = []
+  def worker():
+    try:
+      fn()
+    except Exception as inst:
+      errors.append(inst)
+  interval = sys.getswitchinterval()
+  sys.setswitchinterval(1e-6)
+  try:
+    threads = [threading.Thread(target=worker) for i in range(count)]
+    for t in threads:
+      t.start()
+    for t in threads:
+      t.join()
+  finally:
+    sys.setswitchinterval(interval)
+  return errors
+
+class packtestcase(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp(prefix='pack-utils-test-')
+    self.packdir = os.path.join(self.tmpdir, 'pack')
+    self.pdscfile = pdscgen.generatePack(self.packdir, devices=2)
+    self.cmsisdir = os.path.join(self.tmpdir, 'cmsis')
+    os.makedirs(os.path.join(self.cmsisdir, 'CMSIS', 'Include'))
+    self.outdir = os.path.join(self.tmpdir, 'out')
+    os.makedirs(self.outdir)
+    packfs.invalidate()
+
+  def tearDown(self):
+    packfs.invalidate()
+    shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+  # run genmake-arm.py on all devices of a pdsc file
+  def genmake(self, pdscfile, *args):
+    result = subprocess.run([sys.executable, genmake, '-f', pdscfile, '-c', self.cmsisdir,
+                             '--all-devices', '-o', self.outdir] + list(args),
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True, timeout=120)
+    self.assertEqual(result.returncode, 0, result.stdout)
+    return result.stdout
+
+  def setRelease(self, version):
+    with open(self.pdscfile) as fi:
+      pdsc = fi.read()
+    with open(self.pdscfile, 'w') as fo:
+      fo.write(pdsc.replace('release version="1.0.0"', 'release version="%s"' %(version)))
+
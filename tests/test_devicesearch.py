@@ -0,0 +1,82 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Tests of the device search (see devicesearch.py)
+
+import fnmatch
+import os.path
+import unittest
+
+from packtest import packtestcase
+
+import devicesearch as DS
+import pdscgen
+import pdscparser as PP
+
+class TestDeviceTrie(unittest.TestCase):
+  def setUp(self):
+    self.names = ['ATSAME70Q21', 'ATSAME70N21', 'ATSAMD20E14', 'ATSAM4C4C:0', 'ATSAM4C4C:1']
+    self.trie = DS.devicetrie(self.names)
+
+  def testPrefix(self):
+    self.assertEqual(sorted(self.trie.prefix('ATSAME70')), ['ATSAME70N21', 'ATSAME70Q21'])
+    self.assertEqual(self.trie.prefix('ATSAMX'), [])
+
+  def testMatchAgreesWithFnmatch(self):
+    for pattern in ('ATSAME70*', '*21', 'ATSAM4C4C:?', 'ATSAM[DE]*', 'ATSAMD20E14', 'atsame70*', ''):
+      self.assertEqual(sorted(self.trie.match(pattern)),
+                       sorted(name for name in self.names if fnmatch.fnmatchcase(name, pattern)),
+                       pattern)
+
+class TestFindDevices(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.parser = PP.pdscparser(pdscgen.generatePack(os.path.join(self.tmpdir, 'pack6'),
+                                                     devices=6, processors=2))
+
+  def testPatternInPackOrder(self):
+    self.assertEqual(self.parser.findDevices('ATSAMX000[12]A:*'),
+                     ['ATSAMX0001A:0', 'ATSAMX0001A:1', 'ATSAMX0002A:0', 'ATSAMX0002A:1'])
+    self.assertEqual(self.parser.findDevices(), self.parser.getDevices())
+
+  def testAttributeFilters(self):
+    self.assertEqual(self.parser.findDevices(core='Cortex-M4', pname='1'),
+                     ['ATSAMX0001A:1', 'ATSAMX0004A:1'])
+    self.assertEqual(self.parser.findDevices('ATSAMX000[0-2]A:0', family='SAM X', core='Cortex-M7'),
+                     ['ATSAMX0002A:0'])
+    self.assertEqual(len(self.parser.findDevices(pname=True)), 12)
+    self.assertEqual(self.parser.findDevices(family='SAM Y'), [])
+
+if __name__ == '__main__':
+  unittest.main()
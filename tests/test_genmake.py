@@ -0,0 +1,152 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Tests of the build files generated by genmake-arm.py
+
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import time
+import unittest
+
+from packtest import genmake, packtestcase
+
+class TestErrors(packtestcase):
+  def testWriteErrorFailsOnlyThatDevice(self):
+    # a directory in place of the Makefile can't be replaced
+    os.makedirs(os.path.join(self.outdir, 'atsamx0000a_Makefile', 'keep'))
+    for jobs in (['-j', '2'], []):
+      args = ['-d', 'ATSAMX0000A', 'ATSAMX0001A'] if jobs else ['-d', 'ATSAMX0000A']
+      result = subprocess.run([sys.executable, genmake, '-f', self.pdscfile, '-c', self.cmsisdir,
+                               '-o', self.outdir] + args + jobs,
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                              universal_newlines=True, timeout=120)
+      self.assertEqual(result.returncode, 2, result.stdout)
+      self.assertIn('Error: create makefile:', result.stdout)
+      self.assertIn('Failed devices: ATSAMX0000A', result.stdout)
+      self.assertNotIn('Traceback', result.stdout)
+    self.assertTrue(os.path.isfile(os.path.join(self.outdir, 'atsamx0001a_Makefile')))
+
+class TestDependTemplate(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.genmake(self.pdscfile, '--copy-config-files', '--template', 'depend', '--build-dir', 'obj')
+    self.projectdir = os.path.join(self.outdir, 'atsamx0000a')
+    with open(os.path.join(self.projectdir, 'atsamx0000a_Makefile')) as fi:
+      self.makefile = fi.read()
+
+  def make(self, *args):
+    return subprocess.run(['make', '-f', 'atsamx0000a_Makefile', 'CC=gcc', 'CFLAGS=-c'] + list(args),
+                          cwd=self.projectdir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          universal_newlines=True, timeout=60)
+
+  def testBuildDirectory(self):
+    self.assertIn('BUILD_DIR=obj\n', self.makefile)
+    self.assertIn('$(BUILD_DIR)/%.o: %.c', self.makefile)
+    self.assertIn('-include $(BUILD_OBJS:.o=.d)', self.makefile)
+
+  def testHeaderDependencies(self):
+    if shutil.which('make') is None or shutil.which('gcc') is None:
+      self.skipTest('needs make and gcc')
+    with open(os.path.join(self.projectdir, 'app.h'), 'w') as fo:
+      fo.write('#define APP 1\n')
+    with open(os.path.join(self.projectdir, 'main.c'), 'w') as fo:
+      fo.write('#include "app.h"\nint main(void) { return APP; }\n')
+    result = self.make('obj/main.o')
+    self.assertEqual(result.returncode, 0, result.stdout)
+    self.assertTrue(os.path.isfile(os.path.join(self.projectdir, 'obj', 'main.d')))
+    self.assertEqual(self.make('-q', 'obj/main.o').returncode, 0)
+
+    later = time.time() + 10
+    os.utime(os.path.join(self.projectdir, 'app.h'), (later, later))
+    self.assertEqual(self.make('-q', 'obj/main.o').returncode, 1)
+
+class TestPch(packtestcase):
+  def makefile(self, *args):
+    self.genmake(self.pdscfile, '-d', 'ATSAMX0000A', *args)
+    with open(os.path.join(self.outdir, 'atsamx0000a_Makefile')) as fi:
+      return fi.read()
+
+  def testCompileRulesUnchangedWithoutPch(self):
+    makefile = self.makefile()
+    self.assertNotIn('PCH', makefile)
+    self.assertIn('./%.o: ./%.c\n\t$(CC) $(CFLAGS) $(INCLUDE_PATHS) -o $@ $<\n', makefile)
+    self.assertIn('startup/%.o: startup/%.c\n\t$(CC) $(CFLAGS) $(INCLUDE_PATHS) -o $@ $<\n', makefile)
+
+  def testCompileRulesUsePch(self):
+    makefile = self.makefile('--pch')
+    self.assertIn('./%.o: ./%.c $(PCH_C)\n\t$(CC) $(CFLAGS) $(PCH_CFLAGS) $(INCLUDE_PATHS) -o $@ $<\n',
+                  makefile)
+    self.assertIn('./%.o: ./%.cpp $(PCH_CXX)\n', makefile)
+    self.assertNotIn('@PCH', makefile)
+
+class TestNinjaBackend(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.output = self.genmake(self.pdscfile, '--copy-config-files', '--backend', 'ninja')
+    self.projectdir = os.path.join(self.outdir, 'atsamx0000a')
+    self.ninjafile = os.path.join(self.projectdir, 'atsamx0000a_build.ninja')
+    with open(self.ninjafile) as fi:
+      self.lines = fi.read().splitlines()
+
+  def testFlagsMatchMakefileBackend(self):
+    self.assertIn('cflags = -x c -mthumb -mcpu=Cortex-M0plus -D__ATSAMX0000A__ -O1 -ffunction-sections'
+                  ' -Wall -c -std=gnu99', self.lines)
+    self.assertIn('  depfile = $out.d', self.lines)
+    self.assertFalse(os.path.exists(os.path.join(self.projectdir, 'atsamx0000a_Makefile')))
+
+  def testSummaryNamesNinjaFiles(self):
+    self.assertIn('Generated 2 of 2 Ninja files.', self.output)
+    self.assertNotIn('Makefile', self.output)
+
+  def testEverySourceIsCompiled(self):
+    compiles = [line.split() for line in self.lines if line.startswith('build $builddir/') and ': cc ' in line]
+    self.assertEqual(sorted(words[3] for words in compiles), ['main.c', 'startup_samx.c', 'system_samx.c'])
+    for words in compiles:
+      self.assertTrue(os.path.isfile(os.path.join(self.projectdir, words[3])))
+    link = [line for line in self.lines if ': link ' in line][0]
+    for words in compiles:
+      self.assertIn(words[1][:-1], link.split())
+
+  def testNinjaDryRun(self):
+    if shutil.which('ninja') is None:
+      self.skipTest('needs ninja')
+    result = subprocess.run(['ninja', '-n', '-f', os.path.basename(self.ninjafile)], cwd=self.projectdir,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    self.assertEqual(result.returncode, 0, result.stdout)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,92 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Tests of the SQLite pack catalog (see packcatalog.py)
+
+import os
+import os.path
+import shutil
+import unittest
+
+from packtest import packtestcase
+
+import packcatalog as PC
+
+class TestPackCatalog(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.catalog = PC.packcatalog(os.path.join(self.tmpdir, 'catalog.sqlite'))
+    # a second version in its own directory
+    self.newdir = os.path.join(self.tmpdir, 'pack-1.1.0')
+    shutil.copytree(self.packdir, self.newdir)
+    self.newpdsc = os.path.join(self.newdir, 'Atmel.SAMX_DFP.pdsc')
+    with open(self.newpdsc) as fi:
+      pdsc = fi.read()
+    with open(self.newpdsc, 'w') as fo:
+      fo.write(pdsc.replace('release version="1.0.0"', 'release version="1.1.0"'))
+
+  def tearDown(self):
+    self.catalog.close()
+    packtestcase.tearDown(self)
+
+  def testIncrementalExport(self):
+    self.assertTrue(self.catalog.exportPack(self.pdscfile))
+    self.assertFalse(self.catalog.exportPack(self.pdscfile))
+    self.setRelease('1.0.1')
+    self.assertTrue(self.catalog.exportPack(self.pdscfile))
+    self.assertEqual([p['version'] for p in self.catalog.findPacks('ATSAMX0000A')], ['1.0.1'])
+
+  def testQueries(self):
+    self.catalog.exportPack(self.pdscfile)
+    self.catalog.exportPack(self.newpdsc)
+    self.assertEqual([p['version'] for p in self.catalog.findPacks('ATSAMX0001A')], ['1.1.0', '1.0.0'])
+    self.assertEqual(self.catalog.findPacks('ATSAMX0001A', core='Cortex-M0+'), [])
+    self.assertEqual(len(self.catalog.findPacks('ATSAMX0001A', svd='ATSAMX0001A.svd')), 2)
+
+    processors = self.catalog.findProcessors(core='Cortex-M4')
+    self.assertEqual(sorted((p['name'], p['version']) for p in processors),
+                     [('ATSAMX0001A', '1.0.0'), ('ATSAMX0001A', '1.1.0')])
+    self.assertEqual(processors[0]['define'], '__ATSAMX0001A__')
+    self.assertEqual(len(self.catalog.findComponents('Device', 'Startup')), 4)
+
+  def testPrune(self):
+    self.catalog.exportPack(self.pdscfile)
+    self.catalog.exportPack(self.newpdsc)
+    shutil.rmtree(self.newdir)
+    self.assertEqual(self.catalog.prune(), 1)
+    self.assertEqual([p['version'] for p in self.catalog.findPacks('ATSAMX0000A')], ['1.0.0'])
+    self.assertEqual(len(self.catalog.findComponents('Device')), 2)
+
+if __name__ == '__main__':
+  unittest.main()
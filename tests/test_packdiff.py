@@ -0,0 +1,122 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Tests of the pack delta detection (see packdiff.py)
+
+import os
+import os.path
+import shutil
+import unittest
+
+from packtest import packtestcase
+
+import packdiff as PD
+import pdscparser as PP
+
+class TestDiffPacks(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.newdir = os.path.join(self.tmpdir, 'pack-1.1.0')
+    shutil.copytree(self.packdir, self.newdir)
+    self.newpdsc = os.path.join(self.newdir, 'Atmel.SAMX_DFP.pdsc')
+    with open(self.newpdsc) as fi:
+      pdsc = fi.read()
+    with open(self.newpdsc, 'w') as fo:
+      fo.write(pdsc.replace('release version="1.0.0"', 'release version="1.1.0"'))
+
+  def diff(self):
+    return PD.diffPacks(PP.pdscparser(self.pdscfile), PP.pdscparser(self.newpdsc))
+
+  def testCopiedPackIsUnchanged(self):
+    delta = self.diff()
+    self.assertEqual(delta['releases'], ('1.0.0', '1.1.0'))
+    self.assertEqual(delta['devices'], {})
+
+  def testChangedFileAndDefine(self):
+    with open(os.path.join(self.newdir, 'samx', 'atsamx0001a', 'gcc', 'startup_samx.c'), 'a') as fo:
+      fo.write('/* fixed */\n')
+    with open(self.newpdsc) as fi:
+      pdsc = fi.read()
+    with open(self.newpdsc, 'w') as fo:
+      fo.write(pdsc.replace('define="__ATSAMX0000A__"', 'define="__SAMX0000A__"'))
+    self.assertEqual(self.diff()['devices'], {'ATSAMX0000A':['define'], 'ATSAMX0001A':['startup']})
+
+  def testIncludeTreeIsCompared(self):
+    with open(os.path.join(self.newdir, 'samx', 'atsamx0000a', 'include', 'extra.h'), 'w') as fo:
+      fo.write('#define EXTRA 1\n')
+    self.assertEqual(self.diff()['devices'], {'ATSAMX0000A':['include']})
+
+  def testCompareFingerprints(self):
+    self.assertEqual(PD.compareFingerprints(None, None), [])
+    self.assertEqual(PD.compareFingerprints(None, {'cpu':['Cortex-M4', None]}), ['device'])
+
+class TestSince(packtestcase):
+  def testPackInItsOwnDirectoryRegeneratesEveryDevice(self):
+    newdir = os.path.join(self.tmpdir, 'pack-1.1.0')
+    shutil.copytree(self.packdir, newdir)
+    output = self.genmake(os.path.join(newdir, 'Atmel.SAMX_DFP.pdsc'), '--since', self.pdscfile)
+    self.assertIn('regenerating every device', output)
+    self.assertIn('Generated 2 of 2 Makefiles.', output)
+
+  def testSinceIntoEmptyOutputDir(self):
+    oldpdsc = os.path.join(self.packdir, 'old.pdsc')
+    shutil.copy(self.pdscfile, oldpdsc)
+    self.genmake(self.pdscfile, '--since', oldpdsc)
+    for device in ('atsamx0000a', 'atsamx0001a'):
+      self.assertTrue(os.path.isfile(os.path.join(self.outdir, device + '_Makefile')))
+
+    os.remove(os.path.join(self.outdir, 'atsamx0000a_Makefile'))
+    output = self.genmake(self.pdscfile, '--since', oldpdsc)
+    self.assertIn('Regenerating 1 unchanged device(s) with missing outputs.', output)
+    self.assertTrue(os.path.isfile(os.path.join(self.outdir, 'atsamx0000a_Makefile')))
+
+  def testSinceDetectsChangedFileOfPackUpdatedInPlace(self):
+    oldpdsc = os.path.join(self.packdir, 'old.pdsc')
+    shutil.copy(self.pdscfile, oldpdsc)
+    self.genmake(self.pdscfile, '--copy-config-files')
+    packstartup = os.path.join(self.packdir, 'samx', 'atsamx0000a', 'gcc', 'startup_samx.c')
+    startup = os.path.join(self.outdir, 'atsamx0000a', 'startup_samx.c')
+    for fix in ('/* fix 1 */', '/* fix 2 */'):
+      with open(packstartup, 'a') as fo:
+        fo.write(fix + '\n')
+      self.setRelease('1.1.0')
+      self.genmake(self.pdscfile, '--copy-config-files', '--since', oldpdsc)
+      with open(startup) as fi:
+        self.assertIn(fix, fi.read())
+    # recorded by the last run, nothing changed since
+    self.assertIn('0 of 2 device(s) changed',
+                  self.genmake(self.pdscfile, '--copy-config-files', '--since', oldpdsc))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,85 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Tests of .pack archives read in place (see packfs.py)
+
+import os
+import os.path
+import shutil
+import unittest
+
+from packtest import packtestcase
+
+import packfs
+import pdscparser as PP
+
+class TestPackArchive(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.archive = shutil.make_archive(os.path.join(self.tmpdir, 'Atmel.SAMX_DFP.1.0.0'), 'zip',
+                                       self.packdir)
+    os.rename(self.archive, self.archive[:-len('.zip')] + '.pack')
+    self.archive = self.archive[:-len('.zip')] + '.pack'
+    self.extractdir = os.path.join(self.tmpdir, 'extracted')
+
+  def testOnlyProjectFilesAreExtracted(self):
+    parser = PP.pdscparser(self.archive, extractdir=self.extractdir)
+    self.assertEqual(parser.getDevices(), PP.pdscparser(self.pdscfile).getDevices())
+    self.assertFalse(os.path.exists(os.path.join(self.extractdir, 'samx')))
+
+    dep = parser.getGCCProjectDependencies('ATSAMX0000A', 'c', 'exe', 'atmel')
+    self.assertEqual(dep['startup'], os.path.join(self.extractdir, 'samx', 'atsamx0000a', 'gcc', 'startup_samx.c'))
+    for field in ('header', 'startup', 'system', 'linkerscript', 'template'):
+      self.assertTrue(os.path.isfile(dep[field]), field)
+    with open(dep['startup'], 'rb') as fi, \
+         open(os.path.join(self.packdir, 'samx', 'atsamx0000a', 'gcc', 'startup_samx.c'), 'rb') as fp:
+      self.assertEqual(fi.read(), fp.read())
+    # the other device was not asked for
+    self.assertFalse(os.path.exists(os.path.join(self.extractdir, 'samx', 'atsamx0001a')))
+
+  def testDeletedExtractedFileIsRestored(self):
+    parser = PP.pdscparser(self.archive, extractdir=self.extractdir)
+    dep = parser.getGCCProjectDependencies('ATSAMX0000A', 'c', 'exe', 'atmel')
+    os.remove(dep['startup'])
+    dep = parser.getGCCProjectDependencies('ATSAMX0000A', 'c', 'exe', 'atmel')
+    self.assertTrue(os.path.isfile(dep['startup']))
+
+  def testArchiveIndex(self):
+    snapshot = packfs.getSnapshot(self.archive, self.extractdir)
+    self.assertTrue(snapshot.isfile('samx/atsamx0000a/gcc/startup_samx.c'))
+    self.assertTrue(snapshot.isdir('samx/atsamx0000a'))
+    self.assertFalse(snapshot.isfile('samx/atsamx0000a/gcc/missing.c'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,65 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Tests of the benchmark harness and its baseline comparison
+
+import json
+import os.path
+import unittest
+
+from packtest import packtestcase
+
+import pdscbench as PB
+
+class TestBaseline(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    with open(PB.referenceBaselineFile) as fo:
+      self.reference = json.load(fo)
+
+  def testReferenceCoversEveryBenchmark(self):
+    bench = PB.pdscbench(os.path.join(self.tmpdir, 'bench'), 2, 1, 1, 10, 1)
+    results = bench.run()
+    self.assertIn('getDevices_x%d' %(PB.getDevicesCalls), results)
+    self.assertEqual(sorted(results), sorted(self.reference['results']))
+
+  def testNoiseBelowTheFloorIsIgnored(self):
+    config = self.reference['config']
+    baseline = {'version':PB.baselineFormatVersion, 'config':config,
+                'results':{'fast':0.0001, 'slow':0.1, 'peak_bytes':1000}}
+    results = {'fast':0.0005, 'slow':0.2, 'peak_bytes':2000}
+    self.assertEqual(PB.compareBaseline(baseline, config, results, 0.25), [('slow', 0.1, 0.2)])
+
+if __name__ == '__main__':
+  unittest.main()
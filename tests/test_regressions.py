@@ -0,0 +1,336 @@
+##############################################################################
+# 
+# Copyright (C) 2015 Atmel Corporation
+# All rights reserved.
+# 
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# 
+# * Redistributions of source code must retain the above copyright
+#   notice, this list of conditions and the following disclaimer.
+# 
+# * Redistributions in binary form must reproduce the above copyright
+#   notice, this list of conditions and the following disclaimer in
+#   the documentation and/or other materials provided with the
+#   distribution.
+# 
+# * Neither the name of the copyright holders nor the names of
+#   contributors may be used to endorse or promote products derived
+#   from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+##############################################################################
+
+# Regression tests of races and data loss paths, run on synthetic packs
+# (see pdscgen.py) in a temporary directory:
+#
+#   python3 -m pytest tests
+
+import os
+import os.path
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import unittest
+
+from packtest import genmake, packtestcase, runThreads
+
+import configstore as CS
+import packfs
+import pdscgen
+import pdscparser as PP
+import pdscserver as PS
+import svdindex as SV
+
+class TestCacheConcurrency(packtestcase):
+  def testResultCacheThreads(self):
+    cache = PP.resultcache(4)
+    def hammer():
+      for i in range(30000):
+        key = random.randrange(8)
+        if random.random() < 0.5:
+          cache.get(key)
+        else:
+          cache.put(key, i)
+        if i % 5000 == 0:
+          cache.clear()
+    self.assertEqual(runThreads(hammer), [])
+
+  def testSharedParserThreads(self):
+    parser = PP.pdscparser(self.pdscfile)
+    expected = parser.getGCCProjectDependencies('ATSAMX0001A', 'c', 'exe', 'atmel')
+    def query():
+      for i in range(100):
+        dep = parser.getGCCProjectDependencies('ATSAMX0001A', 'c', 'exe', 'atmel')
+        assert dep == expected
+        parser.findDevices('ATSAMX*')
+        parser.getAllGCCProjectDependencies(langs=('c',))
+        if i % 10 == 0:
+          parser._results.clear()
+    self.assertEqual(runThreads(query), [])
+
+class TestStreaming(packtestcase):
+  def testStreamedParserMatchesFullParse(self):
+    pdscfile = pdscgen.generatePack(os.path.join(self.tmpdir, 'pack3'), devices=3, processors=2,
+                                    components=2)
+    with open(pdscfile) as fi:
+      pdsc = fi.read()
+    conditions = ''.join('<condition id="c%d"><require Dname="ATSAMX0000A"/></condition>' %(i)
+                         for i in range(50))
+    with open(pdscfile, 'w') as fo:
+      fo.write(pdsc.replace('  <devices>', '  <conditions>%s</conditions>\n  <devices>' %(conditions), 1))
+
+    full = PP.pdscparser(pdscfile)
+    streamed = PP.pdscparser(pdscfile, ['ATSAMX0001A:1'])
+    self.assertEqual(streamed.getDevices(), full.getDevices())
+    self.assertEqual(streamed.getGCCProjectDependencies('ATSAMX0001A:1', 'c', 'exe', 'atmel'),
+                     full.getGCCProjectDependencies('ATSAMX0001A:1', 'c', 'exe', 'atmel'))
+
+class TestResultCache(packtestcase):
+  def testRepeatedPassesHit(self):
+    parser = PP.pdscparser(pdscgen.generatePack(os.path.join(self.tmpdir, 'pack100'), devices=100))
+    def queryAll():
+      for device in parser.getDevices():
+        for lang in ('c', 'c++'):
+          for exe in ('exe', 'lib'):
+            parser.getGCCProjectDependencies(device, lang, exe, 'atmel')
+    queryAll()
+    misses = parser.getResultCacheStats()['misses']
+    queryAll()
+    queryAll()
+    stats = parser.getResultCacheStats()
+    self.assertEqual(stats['misses'], misses)
+    self.assertEqual(stats['hits'], 800)
+
+class TestAllDependencies(packtestcase):
+  def testCaseInsensitiveLanguages(self):
+    parser = PP.pdscparser(self.pdscfile)
+    _all = parser.getAllGCCProjectDependencies(['ATSAMX0001A'], 'atmel', ['C'], ['EXE'])
+    self.assertEqual(_all['ATSAMX0001A']['c']['exe'],
+                     parser.getGCCProjectDependencies('ATSAMX0001A', 'C', 'EXE', 'atmel'))
+    self.assertIsNotNone(_all['ATSAMX0001A']['c']['exe'])
+
+class TestSymlinkedPack(packtestcase):
+  def testSymlinkedDirectory(self):
+    gccdir = os.path.join(self.packdir, 'samx', 'atsamx0000a', 'gcc')
+    shutil.move(gccdir, os.path.join(self.tmpdir, 'gcc'))
+    os.symlink(os.path.join(self.tmpdir, 'gcc'), gccdir)
+    # a symlink cycle must not hang the scan
+    os.symlink(self.packdir, os.path.join(self.packdir, 'samx', 'loop'))
+    dep = PP.pdscparser(self.pdscfile).getGCCProjectDependencies('ATSAMX0000A', 'c', 'exe', 'atmel')
+    self.assertTrue(os.path.isfile(dep['linkerscript']))
+
+class TestConfigStore(packtestcase):
+  def testGcKeepsSkippedDevices(self):
+    store = os.path.join(self.tmpdir, 'store')
+    self.genmake(self.pdscfile, '--changed-only', '--config-store', store)
+    self.setRelease('1.1.0')
+    self.assertIn('Skipping 2 unchanged device(s)',
+                  self.genmake(self.pdscfile, '--changed-only', '--config-store', store))
+
+    cs = CS.configstore(store)
+    cs.retire('Atmel.SAMX_DFP.1.0.0')
+    self.assertEqual(cs.gc(grace=0)[0], 0)
+    with open(os.path.join(self.outdir, 'atsamx0000a', 'atsamx0000a_Makefile')) as fi:
+      ldflags = [line for line in fi if line.startswith('LDFLAGS=')][0]
+    ldscript = [option[2:] for option in ldflags.split() if option.startswith('-T')][0]
+    self.assertTrue(os.path.isfile(ldscript))
+
+  def testRenamedPdscKeepsPackKey(self):
+    store = os.path.join(self.tmpdir, 'store')
+    renamed = os.path.join(self.packdir, 'samx.pdsc')
+    os.rename(self.pdscfile, renamed)
+    self.genmake(renamed, '--config-store', store)
+    self.assertEqual(os.listdir(os.path.join(store, 'refs')), ['Atmel.SAMX_DFP.1.0.0'])
+
+  def testGcWaitsForGenerators(self):
+    store = os.path.join(self.tmpdir, 'store')
+    generator = CS.configstore(store, 'Atmel.SAMX_DFP.1.0.0')
+    stored = generator.add(os.path.join(self.packdir, 'templates', 'main.c'))
+    if CS.fcntl is None:
+      self.skipTest('store locks need fcntl')
+    # gc blocks on the lock until the generator recorded its references
+    collector = threading.Thread(target=CS.configstore(store).gc, args=(0,))
+    collector.start()
+    collector.join(0.5)
+    self.assertTrue(collector.is_alive())
+    project = os.path.join(self.outdir, 'Makefile')
+    open(project, 'w').close()
+    generator.addRefs(project, [stored])
+    generator.close()
+    collector.join()
+    self.assertTrue(os.path.isfile(stored))
+
+class TestIncremental(packtestcase):
+  def testChangedConfigFileIsNewerThanObjects(self):
+    packstartup = os.path.join(self.packdir, 'samx', 'atsamx0000a', 'gcc', 'startup_samx.c')
+    released = 1609459200  # pack files keep their release date
+    os.utime(packstartup, (released, released))
+    self.genmake(self.pdscfile, '--incremental', '--copy-config-files')
+    startup = os.path.join(self.outdir, 'atsamx0000a', 'startup_samx.c')
+    obj = os.path.join(self.outdir, 'atsamx0000a', 'startup_samx.o')
+    open(obj, 'w').close()
+    built = time.time() - 10
+    os.utime(obj, (built, built))
+
+    with open(packstartup, 'a') as fo:
+      fo.write('/* fixed */\n')
+    os.utime(packstartup, (released, released))
+    self.genmake(self.pdscfile, '--incremental', '--copy-config-files')
+    with open(startup) as fi:
+      self.assertIn('/* fixed */', fi.read())
+    self.assertGreater(os.stat(startup).st_mtime, os.stat(obj).st_mtime)
+
+class TestCopyMode(packtestcase):
+  def testTemplateIsCopiedWhenLinking(self):
+    for mode in ('hardlink', 'symlink'):
+      self.genmake(self.pdscfile, '--copy-config-files', '--copy-mode', mode)
+      projectdir = os.path.join(self.outdir, 'atsamx0000a')
+      main = os.path.join(projectdir, 'main.c')
+      self.assertFalse(os.path.islink(main))
+      self.assertFalse(os.path.samefile(main, os.path.join(self.packdir, 'templates', 'main.c')))
+      startup = os.path.join(projectdir, 'startup_samx.c')
+      packstartup = os.path.join(self.packdir, 'samx', 'atsamx0000a', 'gcc', 'startup_samx.c')
+      self.assertTrue(os.path.samefile(startup, packstartup))
+      self.assertEqual(os.path.islink(startup), mode == 'symlink')
+
+class TestChangedOnly(packtestcase):
+  def testMovedPackIsRegenerated(self):
+    self.genmake(self.pdscfile, '--changed-only')
+    movedpack = os.path.join(self.tmpdir, 'pack2')
+    shutil.copytree(self.packdir, movedpack)
+    self.genmake(os.path.join(movedpack, 'Atmel.SAMX_DFP.pdsc'), '--changed-only')
+    with open(os.path.join(self.outdir, 'atsamx0000a_Makefile')) as fi:
+      self.assertIn('-I' + movedpack + '/', fi.read())
+
+  def testDeletedMakefileIsRegenerated(self):
+    self.genmake(self.pdscfile, '--changed-only')
+    makefile = os.path.join(self.outdir, 'atsamx0001a_Makefile')
+    os.remove(makefile)
+    self.assertIn('Skipping 1 unchanged device(s)', self.genmake(self.pdscfile, '--changed-only'))
+    self.assertTrue(os.path.isfile(makefile))
+
+  def testDeletedConfigFileIsRegenerated(self):
+    self.genmake(self.pdscfile, '--changed-only', '--copy-config-files')
+    startup = os.path.join(self.outdir, 'atsamx0000a', 'startup_samx.c')
+    os.remove(startup)
+    self.genmake(self.pdscfile, '--changed-only', '--copy-config-files')
+    self.assertTrue(os.path.isfile(startup))
+
+  def testEmptySelectionFails(self):
+    result = subprocess.run([sys.executable, genmake, '-f', self.pdscfile, '-c', self.cmsisdir,
+                             '-d', 'NOSUCH*', '-o', self.outdir],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    self.assertEqual(result.returncode, 2)
+
+class TestBatch(packtestcase):
+  def testPoolGeneratesEveryDevice(self):
+    pdscfile = pdscgen.generatePack(os.path.join(self.tmpdir, 'pack6'), devices=6)
+    devicelist = os.path.join(self.tmpdir, 'devices.txt')
+    with open(devicelist, 'w') as fo:
+      fo.write('ATSAMX0005A  # listed\n')
+    result = subprocess.run([sys.executable, genmake, '-f', pdscfile, '-c', self.cmsisdir,
+                             '-d', 'ATSAMX000[0-3]A', 'ATSAMX0001A', '--device-list', devicelist,
+                             '-j', '3', '-o', self.outdir],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True, timeout=120)
+    self.assertEqual(result.returncode, 0, result.stdout)
+    self.assertIn('Generated 5 of 5 Makefiles.', result.stdout)
+    for n in (0, 1, 2, 3, 5):
+      device = pdscgen.syntheticDeviceName(n)
+      with open(os.path.join(self.outdir, device.lower() + '_Makefile')) as fi:
+        self.assertIn('-D__%s__ ' %(device), fi.read())
+    self.assertFalse(os.path.exists(os.path.join(self.outdir, 'atsamx0004a_Makefile')))
+
+class TestServerClient(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.pdscfile = pdscgen.generatePack(os.path.join(self.tmpdir, 'pack12'), devices=12)
+    self.socketpath = os.path.join(self.tmpdir, 'server.sock')
+    self.server = PS.pdscserver(self.socketpath)
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    packtestcase.tearDown(self)
+
+  def testPoolWorkersGetTheirOwnConnection(self):
+    self.genmake(self.pdscfile, '--server', self.socketpath, '-j', '4')
+    for n in range(12):
+      device = pdscgen.syntheticDeviceName(n)
+      with open(os.path.join(self.outdir, device.lower() + '_Makefile')) as fi:
+        cflags = [line for line in fi if line.startswith('CFLAGS=')][0]
+      self.assertIn('-D__%s__ ' %(device), cflags)
+
+  def testForkedClientReconnects(self):
+    client = PS.pdscclient(self.socketpath)
+    client.query(op='ping')
+    pid = os.fork()
+    if pid == 0:
+      try:
+        ok = client.query(op='devices', pdsc=self.pdscfile) == PP.pdscparser(self.pdscfile).getDevices()
+      finally:
+        os._exit(0 if ok else 1)
+    self.assertEqual(client.query(op='ping'), True)
+    self.assertEqual(os.waitpid(pid, 0)[1], 0)
+    client.close()
+
+chainSvd = """<?xml version="1.0"?>
+<device>
+  <name>TEST</name>
+  <size>8</size>
+  <access>read-write</access>
+  <peripherals>
+    <peripheral derivedFrom="B"><name>C</name><baseAddress>0x3000</baseAddress></peripheral>
+    <peripheral derivedFrom="A"><name>B</name><baseAddress>0x2000</baseAddress></peripheral>
+    <peripheral>
+      <name>A</name>
+      <baseAddress>0x1000</baseAddress>
+      <registers>
+        <register><name>CTRL</name><addressOffset>0x4</addressOffset></register>
+        <cluster>
+          <name>CH</name><addressOffset>0x10</addressOffset><size>16</size><access>read-only</access>
+          <register><name>DATA</name><addressOffset>0x2</addressOffset></register>
+        </cluster>
+      </registers>
+    </peripheral>
+  </peripherals>
+</device>
+"""
+
+class TestSvdIndex(packtestcase):
+  def setUp(self):
+    packtestcase.setUp(self)
+    self.svdfile = os.path.join(self.tmpdir, 'test.svd')
+    with open(self.svdfile, 'w') as fo:
+      fo.write(chainSvd)
+
+  def testDerivedFromChain(self):
+    svd = SV.svdindex(self.svdfile)
+    self.assertEqual(svd.getRegisters('C'), ['CTRL', 'CH.DATA'])
+    self.assertEqual(svd.getRegister('C', 'CTRL')['address'], 0x3004)
+
+  def testInheritedProperties(self):
+    svd = SV.svdindex(self.svdfile)
+    ctrl = svd.getRegister('A', 'CTRL')
+    self.assertEqual((ctrl['size'], ctrl['access']), (8, 'read-write'))
+    data = svd.getRegister('A', 'CH.DATA')
+    self.assertEqual((data['size'], data['access'], data['address']), (16, 'read-only', 0x1012))
+
+if __name__ == '__main__':
+  unittest.main()